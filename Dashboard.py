@@ -1,8 +1,20 @@
+import time
+STARTED = time.perf_counter()   # taken before the other imports for the start-up report
+
+import gc
 import tkinter as tk
 from tkinter import ttk, messagebox
-from PIL import Image, ImageTk
-import requests
 from datetime import datetime, timedelta
+from tk_worker import TkWorker
+from loan_store import LoanError
+from library_client import loan_backend, LibraryClient, ServerError
+from library_stats import format_stats
+from popular_books import PopularityRanker, WINDOWS
+import instrumentation
+from library_db import connect
+from typeahead import load_catalog, attach_typeahead
+# Modules only one window or action needs are imported there, so start-up
+# loads just what the first paint uses
 
 # ====================================================
 #   LIBRARY MANAGEMENT SYSTEM - MERGED VERSION
@@ -10,6 +22,8 @@ from datetime import datetime, timedelta
 
 class LibraryApp(tk.Tk):
     def __init__(self):
+        self.startup = instrumentation.StartupTimer(STARTED)
+        self.startup.mark("imports")
         super().__init__()
         self.title("📚 Library Management System")
         self.geometry("1000x850")
@@ -19,37 +33,54 @@ class LibraryApp(tk.Tk):
         tk.Label(self, text="📘 Library Management Dashboard", font=("Arial", 22, "bold"),
                  bg="#283593", fg="white").pack(fill="x", pady=10)
 
-        # --- Dashboard Section ---
-        self.create_dashboard_section()
-
-        # --- Book Management Section ---
-        self.create_book_management_section()
-
-        # --- Member Management Section ---
-        self.create_member_management_section()
-
-        # --- Transaction Management Section (NEW) ---
-        self.create_transaction_management_section()
-
-        # Store transaction data in memory
-        self.transactions = []
+        # Transactions are stored in transtb (library.db), or behind library_server.py
+        self.loans = loan_backend()
+        self.popular = None         # loaded in _finish_startup
+        # Against library_server.py the server owns the database, the ranker
+        # and the statistics; this desk opens no connection and goes through the client
+        self.remote = isinstance(self.loans, LibraryClient)
+        self.conn = None if self.remote else self.loans.conn
+        self.catalog = None         # typeahead index, loaded in the background after that
+        self.startup.mark("database")
+
+        # --- Sections: one tab each, built the first time it is shown ---
+        self.txn_table = None       # built with the Transactions tab
+        self.sections = ttk.Notebook(self)
+        self.sections.pack(fill="both", expand=True, padx=10, pady=5)
+        self.section_builders = {}
+        for title, build in (("Dashboard", self.create_dashboard_section),
+                             ("Books", self.create_book_management_section),
+                             ("Members", self.create_member_management_section),
+                             ("Transactions", self.create_transaction_management_section)):
+            tab = tk.Frame(self.sections, bg="#f5f5f5")
+            self.sections.add(tab, text=title)
+            self.section_builders[str(tab)] = build
+        self.sections.bind("<<NotebookTabChanged>>", self._build_section)
+        self._build_section()       # the dashboard, shown first
+
+        # Cover thumbnails and background work for popups, built on first use
+        self._worker = self._covers = None
+        self.lag_monitor = instrumentation.LagMonitor(self).start()
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.startup.mark("window")
+        self.after_idle(self._finish_startup)
 
     # ====================================================
     #   DASHBOARD SECTION
     # ====================================================
-    def create_dashboard_section(self):
-        dashboard_frame = tk.LabelFrame(self, text="Dashboard", font=("Arial", 14, "bold"),
+    def create_dashboard_section(self, parent):
+        dashboard_frame = tk.LabelFrame(parent, text="Dashboard", font=("Arial", 14, "bold"),
                                         padx=15, pady=10, bg="#e8eaf6")
         dashboard_frame.pack(fill="x", padx=20, pady=10)
 
-        stats_label = tk.Label(
+        self.stats_label = tk.Label(
             dashboard_frame,
-            text="📊 Key Statistics:\n• Total Books: \n• Total Members: \n• Books Issued: ",
+            text=format_stats(self.loans.stats()),
             font=("Arial", 12),
             justify="left",
             bg="#e8eaf6"
         )
-        stats_label.grid(row=0, column=0, sticky="w", padx=10, pady=5)
+        self.stats_label.grid(row=0, column=0, sticky="w", padx=10, pady=5)
 
         # Quick Actions
         quick_actions = tk.Frame(dashboard_frame, bg="#e8eaf6")
@@ -69,16 +100,19 @@ class LibraryApp(tk.Tk):
         # Popular Books
         tk.Label(dashboard_frame, text="⭐ Popular Books", font=("Arial", 12, "bold"),
                  bg="#e8eaf6").grid(row=1, column=1, sticky="w", pady=10)
+        self.popular_window = tk.StringVar(value="30 days")
+        window_choice = ttk.Combobox(dashboard_frame, textvariable=self.popular_window, state="readonly",
+                                     width=9, values=[f"{w} days" for w in WINDOWS] + ["Top rated"])
+        window_choice.grid(row=1, column=1, sticky="e", pady=10)
+        window_choice.bind("<<ComboboxSelected>>", lambda e: self.refresh_popular())
         self.popular_list = tk.Listbox(dashboard_frame, width=40, height=5)
         self.popular_list.grid(row=2, column=1, pady=5)
-        for book in ["The Hobbit", "Pride and Prejudice", "The Great Gatsby", "1984"]:
-            self.popular_list.insert(tk.END, book)
 
     # ====================================================
     #   BOOK MANAGEMENT SECTION
     # ====================================================
-    def create_book_management_section(self):
-        book_frame = tk.LabelFrame(self, text="Book Management (API Integrated)",
+    def create_book_management_section(self, parent):
+        book_frame = tk.LabelFrame(parent, text="Book Management (API Integrated)",
                                    font=("Arial", 14, "bold"), padx=15, pady=10, bg="#e3f2fd")
         book_frame.pack(fill="x", padx=20, pady=10)
 
@@ -89,8 +123,8 @@ class LibraryApp(tk.Tk):
     # ====================================================
     #   MEMBER MANAGEMENT SECTION
     # ====================================================
-    def create_member_management_section(self):
-        member_frame = tk.LabelFrame(self, text="Member Management",
+    def create_member_management_section(self, parent):
+        member_frame = tk.LabelFrame(parent, text="Member Management",
                                      font=("Arial", 14, "bold"), padx=15, pady=10, bg="#f3e5f5")
         member_frame.pack(fill="x", padx=20, pady=10)
 
@@ -102,8 +136,8 @@ class LibraryApp(tk.Tk):
     # ====================================================
     #   TRANSACTION MANAGEMENT SECTION
     # ====================================================
-    def create_transaction_management_section(self):
-        txn_frame = tk.LabelFrame(self, text="Transaction Management", font=("Arial", 14, "bold"),
+    def create_transaction_management_section(self, parent):
+        txn_frame = tk.LabelFrame(parent, text="Transaction Management", font=("Arial", 14, "bold"),
                                   padx=15, pady=10, bg="#fff3e0")
         txn_frame.pack(fill="both", expand=True, padx=20, pady=10)
 
@@ -113,15 +147,26 @@ class LibraryApp(tk.Tk):
         ttk.Button(button_frame, text="Issue Book", command=self.open_issue_book_window).pack(side="left", padx=10, pady=5)
         ttk.Button(button_frame, text="Return Book", command=self.open_return_book_window).pack(side="left", padx=10, pady=5)
         ttk.Button(button_frame, text="View All Transactions", command=self.refresh_transaction_table).pack(side="left", padx=10, pady=5)
-        ttk.Button(button_frame, text="Send Due Date Reminders", command=self.send_due_reminders).pack(side="left", padx=10, pady=5)
+        if not self.remote:
+            # Against the server, reminders are queued on its host: python notifications.py enqueue
+            ttk.Button(button_frame, text="Send Due Date Reminders",
+                       command=self.send_due_reminders).pack(side="left", padx=10, pady=5)
+        if instrumentation.ENABLED:
+            ttk.Button(button_frame, text="Diagnostics",
+                       command=self.open_diagnostics_window).pack(side="left", padx=10, pady=5)
 
         # Table
+        from txn_table import TransactionTable
         columns = ("member", "book", "issue_date", "due_date", "return_date", "fine")
         self.tree = ttk.Treeview(txn_frame, columns=columns, show="headings", height=10)
         for col in columns:
             self.tree.heading(col, text=col.replace("_", " ").title())
             self.tree.column(col, anchor="center", width=150)
+        scrollbar = ttk.Scrollbar(txn_frame, orient="vertical")
+        scrollbar.pack(side="right", fill="y", pady=10)
         self.tree.pack(fill="both", expand=True, pady=10)
+        self.txn_table = TransactionTable(self.tree, self.loans, scrollbar)
+        self.txn_table.refresh()
 
     # ====================================================
     #   POPUPS FOR FEATURES
@@ -135,13 +180,79 @@ class LibraryApp(tk.Tk):
         tk.Message(popup, text=text, width=350, font=("Arial", 12), bg="white").pack(padx=20, pady=10)
         ttk.Button(popup, text="Close", command=popup.destroy).pack(pady=15)
 
+    @property
+    def worker(self):
+        if self._worker is None:
+            self._worker = TkWorker(self)
+        return self._worker
+
+    @property
+    def covers(self):
+        if self._covers is None:
+            from cover_cache import CoverCache
+            self._covers = CoverCache(self.worker)
+        return self._covers
+
+    def _build_section(self, event=None):
+        tab = self.sections.select()
+        build = self.section_builders.pop(tab, None)
+        if build is not None:
+            build(self.nametowidget(tab))
+
+    def _finish_startup(self):
+        # Runs once the main loop has drawn the window: the slower fills
+        # (popularity buckets) happen here; the transactions load with their tab
+        self.update_idletasks()
+        self.startup.mark("first_paint")
+        if not self.remote:
+            self.popular = PopularityRanker(self.conn)
+        self.refresh_popular()
+        self.startup.mark("data")
+        self.startup.report()
+        if not self.remote:
+            # The typeahead index reads the catalog tables; a desk on the server goes without
+            load_catalog(self.worker, self.conn, self._catalog_loaded)
+
+    # --- Member/book typeahead (typeahead.py) ---
+    def _catalog_loaded(self, catalog):
+        self.catalog = catalog
+        # The index's millions of long-lived keys would otherwise make every
+        # full GC pass stall a keystroke (~40ms); this app keeps them for good
+        gc.freeze()
+
+    def _add_typeahead(self, member, book):
+        if self.catalog is not None:
+            self.catalog.refresh()
+        attach_typeahead(member, lambda text: self.catalog.suggest_members(text) if self.catalog else [])
+        attach_typeahead(book, lambda text: self.catalog.suggest_books(text) if self.catalog else [])
+
+    def on_close(self):
+        self.lag_monitor.stop()
+        if self._worker is not None:
+            self._worker.shutdown()
+        if self._covers is not None:
+            self._covers.close()
+        if self.remote:
+            self.loans.close()
+        else:
+            self.conn.close()
+        self.destroy()
+
     # --- Dashboard popups ---
     def open_add_book_window(self): self._open_popup("Add Book", "Add new books via ISBN lookup.")
     def open_update_book_window(self): self._open_popup("Update Book", "Update book details and availability.")
-    def open_search_books_window(self): self._open_popup("Search Books", "Search books by title, author, or ISBN.")
+
+    def open_search_books_window(self):
+        from library_windows import open_search_books_window
+        open_search_books_window(self, self.loans, self.covers)
+
     def open_register_member_window(self): self._open_popup("Register Member", "Register new library member.")
     def open_update_member_window(self): self._open_popup("Update Member", "Update member information.")
-    def open_borrow_history_window(self): self._open_popup("Borrow History", "View member borrowing history.")
+
+    def open_borrow_history_window(self):
+        from library_windows import open_borrow_history_window
+        open_borrow_history_window(self, self.loans)
+
     def open_email_notify_window(self): self._open_popup("Email Notifications", "Send email reminders to members.")
 
     # ====================================================
@@ -150,7 +261,7 @@ class LibraryApp(tk.Tk):
     def open_issue_book_window(self):
         win = tk.Toplevel(self)
         win.title("📗 Issue Book")
-        win.geometry("400x350")
+        win.geometry("400x390")
 
         tk.Label(win, text="Member Name:").pack(pady=5)
         member = tk.Entry(win, width=30)
@@ -159,6 +270,7 @@ class LibraryApp(tk.Tk):
         tk.Label(win, text="Book Title:").pack(pady=5)
         book = tk.Entry(win, width=30)
         book.pack()
+        self._add_typeahead(member, book)
 
         tk.Label(win, text="Issue Date (YYYY-MM-DD):").pack(pady=5)
         issue = tk.Entry(win, width=30)
@@ -170,21 +282,36 @@ class LibraryApp(tk.Tk):
         due.insert(0, (datetime.now() + timedelta(days=7)).strftime("%Y-%m-%d"))
         due.pack()
 
+        @instrumentation.timed("save_issue")
         def save_issue():
-            data = {
-                "member": member.get(),
-                "book": book.get(),
-                "issue_date": issue.get(),
-                "due_date": due.get(),
-                "return_date": None,
-                "fine": 0
-            }
-            self.transactions.append(data)
-            self.refresh_transaction_table()
+            try:
+                txn = self.loans.checkout(member.get(), book.get(), issue.get(), due.get())
+            except (LoanError, ServerError) as e:
+                messagebox.showerror("Error", str(e), parent=win)
+                return
+            if self.txn_table is not None:
+                self.txn_table.row_changed(txn)
+            self.refresh_stats()
+            if not self.remote:
+                if self.popular is not None:
+                    self.popular.record_issue(txn["book_id"], txn["issue_date"])
+                from recommendations import refresh_related
+                refresh_related(self.conn)
+            self.refresh_popular()
             messagebox.showinfo("Success", "Book issued successfully!")
             win.destroy()
 
+        def place_hold():
+            try:
+                hold = self.loans.place_hold(member.get(), book.get())
+            except (LoanError, ServerError) as e:
+                messagebox.showerror("Error", str(e), parent=win)
+                return
+            messagebox.showinfo("Hold Placed", f"Hold placed: number {hold['position']} in the queue.", parent=win)
+            win.destroy()
+
         ttk.Button(win, text="Save", command=save_issue).pack(pady=15)
+        ttk.Button(win, text="Place Hold", command=place_hold).pack()
 
     def open_return_book_window(self):
         win = tk.Toplevel(self)
@@ -198,27 +325,28 @@ class LibraryApp(tk.Tk):
         tk.Label(win, text="Book Title:").pack(pady=5)
         book = tk.Entry(win, width=30)
         book.pack()
+        self._add_typeahead(member, book)
 
         tk.Label(win, text="Return Date (YYYY-MM-DD):").pack(pady=5)
         return_date = tk.Entry(win, width=30)
         return_date.insert(0, datetime.now().strftime("%Y-%m-%d"))
         return_date.pack()
 
+        @instrumentation.timed("process_return")
         def process_return():
-            fine = 0
-            today = datetime.now().date()
-            for txn in self.transactions:
-                if txn["member"] == member.get() and txn["book"] == book.get() and txn["return_date"] is None:
-                    due = datetime.strptime(txn["due_date"], "%Y-%m-%d").date()
-                    if today > due:
-                        fine = (today - due).days * 1  # $1/day fine
-                    txn["return_date"] = return_date.get()
-                    txn["fine"] = fine
-                    messagebox.showinfo("Returned", f"Book returned.\nFine: ${fine}")
-                    break
-            else:
-                messagebox.showerror("Error", "No matching record found.")
-            self.refresh_transaction_table()
+            try:
+                txn = self.loans.checkin(member.get(), book.get(), return_date.get())
+            except (LoanError, ServerError) as e:
+                messagebox.showerror("Error", str(e), parent=win)
+                return
+            fine = txn["fine"]
+            if self.txn_table is not None:
+                self.txn_table.row_changed(txn)
+            self.refresh_stats()
+            message = f"Book returned.\nFine: ${fine}"
+            if txn.get("hold"):
+                message += f"\nSet this copy aside: a hold for member #{txn['hold']['member_id']} is now ready."
+            messagebox.showinfo("Returned", message)
             win.destroy()
 
         ttk.Button(win, text="Process Return", command=process_return).pack(pady=15)
@@ -226,23 +354,62 @@ class LibraryApp(tk.Tk):
     # ====================================================
     #   TRANSACTION UTILITIES
     # ====================================================
+    @instrumentation.timed()
     def refresh_transaction_table(self):
-        for row in self.tree.get_children():
-            self.tree.delete(row)
-        for txn in self.transactions:
-            self.tree.insert("", "end", values=(
-                txn["member"], txn["book"], txn["issue_date"],
-                txn["due_date"], txn["return_date"], f"${txn['fine']}"
-            ))
+        if self.txn_table is not None:
+            self.txn_table.refresh()
+        self.refresh_stats()
+
+    def open_diagnostics_window(self):
+        from library_windows import open_diagnostics_window
+        open_diagnostics_window(self)
+
+    def refresh_stats(self):
+        self.stats_label.config(text=format_stats(self.loans.stats()))
+
+    @instrumentation.timed()
+    def refresh_popular(self):
+        choice = self.popular_window.get()
+        self.popular_list.delete(0, tk.END)
+        if choice == "Top rated":
+            from ratings import format_rating
+            for book in self.loans.top_rated(k=10):
+                self.popular_list.insert(tk.END, f"{book['title']} ({format_rating(book)})")
+            return
+        window = int(choice.split()[0])
+        if self.remote:
+            ranked = self.loans.popular(window, k=10)
+        elif self.popular is None:
+            return
+        else:
+            ranked = self.popular.top_titles(window, k=10)
+        for title, issues in ranked:
+            self.popular_list.insert(tk.END, f"{title} ({issues})")
 
     def send_due_reminders(self):
-        today = datetime.now().date()
-        overdue = [t for t in self.transactions if not t["return_date"] and datetime.strptime(t["due_date"], "%Y-%m-%d").date() < today]
-        if not overdue:
-            messagebox.showinfo("Reminders", "No overdue books.")
-            return
-        msg = "\n".join([f"{t['member']} - '{t['book']}' (Due: {t['due_date']})" for t in overdue])
-        messagebox.showinfo("Overdue Reminders Sent", f"Reminders sent to:\n\n{msg}")
+        from notifications import enqueue_overdue_notices, enqueue_due_reminders
+        path = self.conn.execute("PRAGMA database_list").fetchone()[2]
+
+        def enqueue_all(cancel):
+            # The overdue scan and the inserts run on the worker, on a connection of its own
+            conn = connect(path)
+            try:
+                return enqueue_overdue_notices(conn), enqueue_due_reminders(conn)
+            finally:
+                conn.close()
+
+        def queued(counts):
+            overdue, due = counts
+            if overdue or due:
+                messagebox.showinfo("Reminders", f"{overdue} overdue notice(s) and {due} due-date reminder(s) "
+                                                 "queued.\nThey are sent by: python notifications.py dispatch")
+            else:
+                messagebox.showinfo("Reminders", "No new reminders to send.")
+
+        def failed(error):
+            messagebox.showerror("Reminders", f"Could not queue the reminders: {error}")
+
+        self.worker.submit(enqueue_all, queued, failed)
 
 
 # ====================================================
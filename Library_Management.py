@@ -1,72 +1,28 @@
+import argparse
+import csv
+import json
+import os
+import re
 import sqlite3
+import sys
+
+import library_db
+from instrumentation import timed
+from ratings import book_rating, top_rated, format_rating
+from borrow_history import iter_history, history_summary
+from loan_store import find_members
+from holds import take_copy, place_hold, HoldError
+
+# Opened by main() / RunCommandLine() through the shared database layer
+conn = None
+
+
+def OpenDatabase(path=library_db.DEFAULT_PATH, read_only=False):
+    """open_database() for the menu; read_only (the list export) skips the
+    schema upgrade and index builds and just connects."""
+    global conn
+    conn = library_db.connect(path) if read_only else library_db.open_database(path)
 
-conn = sqlite3.connect("library.db")
-cursor = conn.cursor()
-
-# Create tables
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS membertb(
-    member_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    membership_number INTEGER UNIQUE,
-    first_name TEXT NOT NULL,
-    last_name TEXT NOT NULL,
-    email TEXT NOT NULL,
-    phone TEXT NOT NULL,
-    address TEXT NOT NULL,
-    join_date DATE,
-    membership_type TEXT NOT NULL,
-    status TEXT NOT NULL
-)
-""")
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS booktb (
-    book_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    isbn TEXT UNIQUE,
-    title TEXT NOT NULL,
-    author TEXT NOT NULL,
-    publisher TEXT NOT NULL,
-    publication_year INTEGER NOT NULL,
-    category TEXT NOT NULL,
-    description TEXT NOT NULL,
-    cover_image_url TEXT NOT NULL,
-    page_count INTEGER NOT NULL,
-    language TEXT NOT NULL,
-    total_copies INTEGER NOT NULL,
-    available_copies INTEGER NOT NULL,
-    shelf_loc TEXT NOT NULL
-)
-""")
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS transtb(
-    transaction_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    member_id INTEGER,
-    book_id INTEGER,
-    issue_date DATE,
-    due_date DATE,
-    return_date DATE,
-    fine_amount REAL,
-    status TEXT,
-    FOREIGN KEY(member_id) REFERENCES membertb(member_id),
-    FOREIGN KEY(book_id) REFERENCES booktb(book_id)
-)
-""")
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS bookreviewtb(
-    review_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    book_id INTEGER,
-    member_id INTEGER,
-    rating INTEGER NOT NULL,
-    review_text TEXT NOT NULL,
-    review_date DATE,
-    FOREIGN KEY(book_id) REFERENCES booktb(book_id),
-    FOREIGN KEY(member_id) REFERENCES membertb(member_id)
-)
-""")
-
-conn.commit()
 
 # Member functions
 def InsertMemberInfo():
@@ -80,21 +36,17 @@ def InsertMemberInfo():
     membership_type = input("Enter your membership type: ")
     status = input("Enter your status: ")
 
-    cursor.execute("""
-    INSERT INTO membertb(
-        membership_number, first_name, last_name, email, phone, address, join_date, membership_type, status)
-    VALUES(?,?,?,?,?,?,?,?,?)
-    """, (membership_number, first_name, last_name, email, phone, address, join_date, membership_type, status))
-
-    conn.commit()
+    with conn:
+        conn.execute("""
+        INSERT INTO membertb(
+            membership_number, first_name, last_name, email, phone, address, join_date, membership_type, status)
+        VALUES(?,?,?,?,?,?,?,?,?)
+        """, (membership_number, first_name, last_name, email, phone, address, join_date, membership_type, status))
     print("\nMembership information added successfully!")
 
 def ShowMemberRecords():
     print("\nAll Membership Records:")
-    cursor.execute("SELECT * FROM membertb")
-    records = cursor.fetchall()
-    for record in records:
-        print(record)
+    ShowRecords("membertb")
 
 # Book functions
 def InsertBookInfo():
@@ -112,27 +64,23 @@ def InsertBookInfo():
     available_copies = int(input("Enter Available Copies: "))
     shelf_loc = input("Enter Shelf Location: ")
 
-    cursor.execute("""
-    INSERT INTO booktb (
-        isbn, title, author, publisher, publication_year, category,
-        description, cover_image_url, page_count, language, total_copies,
-        available_copies, shelf_loc
-    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
-        isbn, title, author, publisher, publication_year, category,
-        description, cover_image_url, page_count, language, total_copies,
-        available_copies, shelf_loc
-    ))
-
-    conn.commit()
+    with conn:
+        conn.execute("""
+        INSERT INTO booktb (
+            isbn, title, author, publisher, publication_year, category,
+            description, cover_image_url, page_count, language, total_copies,
+            available_copies, shelf_loc
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            isbn, title, author, publisher, publication_year, category,
+            description, cover_image_url, page_count, language, total_copies,
+            available_copies, shelf_loc
+        ))
     print("\nBook information added successfully!")
 
 def ShowBookRecords():
     print("\nAll Book Records:")
-    cursor.execute("SELECT * FROM booktb")
-    records = cursor.fetchall()
-    for record in records:
-        print(record)
+    ShowRecords("booktb")
 
 # Transaction functions
 def InsertTransactionInfo():
@@ -140,24 +88,53 @@ def InsertTransactionInfo():
     book_id = int(input("Enter Book ID: "))
     issue_date = input("Enter date of issue (YYYY-MM-DD): ")
     due_date = input("Enter due date (YYYY-MM-DD): ")
-    return_date = input("Enter return date (YYYY-MM-DD): ")
+    return_date = input("Enter return date (YYYY-MM-DD, blank if not returned): ") or None
     fine_amount = float(input("Enter fine amount: "))
     status = input("Enter status: ")
 
-    cursor.execute("""
-    INSERT INTO transtb(member_id, book_id, issue_date, due_date, return_date, fine_amount, status)
-    VALUES (?,?,?,?,?,?,?)
-    """, (member_id, book_id, issue_date, due_date, return_date, fine_amount, status))
-
-    conn.commit()
+    # An open loan needs a free copy (or the member's ready hold), claimed in
+    # the same transaction as the insert
+    with library_db.write_transaction(conn):
+        recorded = return_date is not None or take_copy(conn, member_id, book_id, issue_date)
+        if recorded:
+            conn.execute("""
+            INSERT INTO transtb(member_id, book_id, issue_date, due_date, return_date, fine_amount, status)
+            VALUES (?,?,?,?,?,?,?)
+            """, (member_id, book_id, issue_date, due_date, return_date, fine_amount, status))
+    if not recorded:
+        print("\nNo copy of this book is available; the transaction was not recorded.")
+        if input("Place a hold instead? (y/n): ").strip().lower() == "y":
+            PlaceBookHold(member_id, book_id)
+        return
     print("\nTransaction information added successfully!")
 
+def PlaceBookHold(member_id=None, book_id=None):
+    member_id = member_id or int(input("Enter Member ID: "))
+    book_id = book_id or int(input("Enter Book ID: "))
+    try:
+        hold = place_hold(conn, member_id, book_id)
+    except HoldError as e:
+        print(f"\n{e}")
+        return
+    print(f"\nHold placed: number {hold['position']} in the queue.")
+
 def ShowTransactionRecords():
     print("\nTransaction Records:")
-    cursor.execute("SELECT * FROM transtb")
-    records = cursor.fetchall()
-    for record in records:
-        print(record)
+    ShowRecords("transtb")
+
+def ShowMemberHistory():
+    members = find_members(conn, input("Membership number or name: "))
+    if len(members) != 1:
+        print(f"{len(members)} members match; please enter the membership number.")
+        return
+    member = members[0]
+    summary = history_summary(conn, member["member_id"])
+    print(f"\n{member['first_name']} {member['last_name']}: {summary['loans']} loans, "
+          f"{summary['open']} open, fines {summary['fines']:.2f}")
+    for i, loan in enumerate(iter_history(conn, member["member_id"], SCREEN_PAGE), 1):
+        print((loan["issue_date"], loan["due_date"], loan["return_date"], loan["fine"], loan["status"], loan["book"]))
+        if i % SCREEN_PAGE == 0 and input("-- Enter for more, q to stop -- ").strip().lower() == "q":
+            break
 
 # Review functions
 def InsertReviewInfo():
@@ -167,20 +144,124 @@ def InsertReviewInfo():
     review_text = input("Enter review text: ")
     review_date = input("Enter review date (YYYY-MM-DD): ")
 
-    cursor.execute("""
-    INSERT INTO bookreviewtb(book_id, member_id, rating, review_text, review_date)
-    VALUES(?,?,?,?,?)
-    """, (book_id, member_id, rating, review_text, review_date))
-
-    conn.commit()
+    with conn:
+        conn.execute("""
+        INSERT INTO bookreviewtb(book_id, member_id, rating, review_text, review_date)
+        VALUES(?,?,?,?,?)
+        """, (book_id, member_id, rating, review_text, review_date))
     print("\nReview information added successfully!")
+    print("Book rating is now:", format_rating(book_rating(conn, book_id)))
 
 def ShowReviewRecords():
     print("\nBook Reviews:")
-    cursor.execute("SELECT * FROM bookreviewtb")
-    records = cursor.fetchall()
-    for record in records:
-        print(record)
+    ShowRecords("bookreviewtb")
+
+def ShowTopRatedBooks():
+    category = input("Category (blank for all): ").strip() or None
+    print("\nTop Rated Books:")
+    for rank, book in enumerate(top_rated(conn, 10, category), 1):
+        print(f"{rank:>3}. {book['title']} by {book['author']} - {format_rating(book)}")
+
+
+# Record listing
+# Rows are read in keyset pages (WHERE pk > last ORDER BY pk LIMIT n), so
+# output starts immediately and memory stays flat however big the table is.
+TABLE_KEYS = {
+    "membertb": "member_id",
+    "booktb": "book_id",
+    "transtb": "transaction_id",
+    "bookreviewtb": "review_id",
+}
+TABLE_ALIASES = {"members": "membertb", "books": "booktb", "transactions": "transtb", "reviews": "bookreviewtb"}
+FILTER_OPS = ("<=", ">=", "!=", "=", "<", ">", "~")   # ~ is LIKE
+# The first operator in the text splits it, the longest one at that position
+FILTER_RE = re.compile(r"^([^<>=!~]*)(%s)(.*)$" % "|".join(map(re.escape, FILTER_OPS)), re.S)
+PAGE_SIZE = 500
+SCREEN_PAGE = 50
+
+
+def TableColumns(table):
+    table = TABLE_ALIASES.get(table, table)
+    if table not in TABLE_KEYS:
+        raise ValueError(f"Unknown table: {table}")
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def ParseFilter(text):
+    """Parse 'column<op>value', e.g. status=issued or due_date<2024-01-01.
+
+    Only the first operator counts, so the value may contain others
+    (title~a=b is title LIKE 'a=b').
+    """
+    match = FILTER_RE.match(text)
+    if match is None or not match.group(1).strip():
+        raise ValueError(f"Invalid filter: {text!r}")
+    column, op, value = match.groups()
+    return column.strip(), op, value.strip()
+
+
+def IterRecords(table, columns=None, filters=(), page_size=PAGE_SIZE):
+    """Yield rows of `table` as tuples of `columns`, in primary key order."""
+    table = TABLE_ALIASES.get(table, table)
+    if table not in TABLE_KEYS:
+        raise ValueError(f"Unknown table: {table}")
+    key = TABLE_KEYS[table]
+    known = TableColumns(table)
+    columns = list(columns or known)
+    for column in columns + [f[0] for f in filters]:
+        if column not in known:
+            raise ValueError(f"Unknown column for {table}: {column}")
+
+    where = [f"{column} LIKE ?" if op == "~" else f"{column} {op} ?" for column, op, _ in filters]
+    params = [value for _, _, value in filters]
+    sql = (f"SELECT {key}, {', '.join(columns)} FROM {table} "
+           f"WHERE {' AND '.join([f'{key} > ?'] + where)} ORDER BY {key} LIMIT ?")
+
+    # Arguments are checked above, before the first row is requested
+    def pages():
+        last = -1
+        while True:
+            page = conn.execute(sql, [last] + params + [page_size]).fetchall()
+            for row in page:
+                yield row[1:]
+            if len(page) < page_size:
+                return
+            last = page[-1][0]
+
+    return pages()
+
+
+@timed()
+def ShowRecords(table):
+    columns = input("Columns (comma separated, blank for all): ").strip()
+    columns = [c.strip() for c in columns.split(",") if c.strip()] or None
+    filters = input("Filter (e.g. status=issued, blank for none): ").strip()
+    try:
+        filters = [ParseFilter(f) for f in filters.split(",") if f.strip()]
+        records = IterRecords(table, columns, filters)
+        print(tuple(columns or TableColumns(table)))
+        for i, record in enumerate(records, 1):
+            print(record)
+            if i % SCREEN_PAGE == 0 and input("-- Enter for more, q to stop -- ").strip().lower() == "q":
+                break
+    except (ValueError, sqlite3.Error) as e:
+        print(f"Error: {e}")
+
+
+@timed()
+def ExportRecords(table, columns=None, filters=(), fmt="csv", out=sys.stdout):
+    """Stream records to `out` as CSV (with header) or JSON lines."""
+    table = TABLE_ALIASES.get(table, table)
+    columns = list(columns or TableColumns(table))
+    records = IterRecords(table, columns, filters)
+    if fmt == "csv":
+        writer = csv.writer(out)
+        writer.writerow(columns)
+        for record in records:
+            writer.writerow(record)
+    else:
+        for record in records:
+            out.write(json.dumps(dict(zip(columns, record))) + "\n")
 
 
 def DisplayMenu():
@@ -193,12 +274,16 @@ def DisplayMenu():
     print("6. Show Transaction Records")
     print("7. Insert Book Review")
     print("8. Show Book Reviews")
+    print("9. Show Top Rated Books")
+    print("10. Show Member Borrowing History")
+    print("11. Place Book Hold")
     print("0. Exit")
 
 def main():
+    OpenDatabase()
     while True:
         DisplayMenu()
-        choice = input("Enter Choice (0-8): ")
+        choice = input("Enter Choice (0-11): ")
         if choice == '1':
             InsertMemberInfo()
         elif choice == '2':
@@ -215,6 +300,12 @@ def main():
             InsertReviewInfo()
         elif choice == '8':
             ShowReviewRecords()
+        elif choice == '9':
+            ShowTopRatedBooks()
+        elif choice == '10':
+            ShowMemberHistory()
+        elif choice == '11':
+            PlaceBookHold()
         elif choice == '0':
             print("Exiting program.")
             break
@@ -223,4 +314,37 @@ def main():
 
     conn.close()
 
-    main()
\ No newline at end of file
+
+def RunCommandLine(argv):
+    """Non-interactive mode, e.g.
+    python Library_Management.py list transactions --where status=issued --format jsonl
+    """
+    parser = argparse.ArgumentParser(description="Library Management records.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    listing = sub.add_parser("list", help="stream table records to stdout")
+    listing.add_argument("table", help="membertb/booktb/transtb/bookreviewtb (or members/books/transactions/reviews)")
+    listing.add_argument("--columns", help="comma separated column names")
+    listing.add_argument("--where", action="append", default=[], help="filter, e.g. status=issued (repeatable)")
+    listing.add_argument("--format", choices=("csv", "jsonl"), default="csv")
+    parser.add_argument("--db", default=library_db.DEFAULT_PATH)
+    args = parser.parse_args(argv)
+
+    columns = [c.strip() for c in args.columns.split(",")] if args.columns else None
+    OpenDatabase(args.db, read_only=True)
+    try:
+        ExportRecords(args.table, columns, [ParseFilter(f) for f in args.where], args.format)
+        sys.stdout.flush()
+    except (ValueError, sqlite3.Error) as e:
+        parser.error(str(e))
+    except BrokenPipeError:
+        # reader (e.g. head) went away; silence the final flush at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        RunCommandLine(sys.argv[1:])
+    else:
+        main()
@@ -0,0 +1,195 @@
+import argparse
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from library_db import connect, DEFAULT_PATH
+
+# ====================================================
+#   ONLINE BACKUP AND SNAPSHOTS
+# ====================================================
+# Copying library.db with the file manager while a desk is writing can give
+# a torn copy (and misses whatever is still in library.db-wal).  backup.py
+# copies it with SQLite's online backup API while the desks keep working:
+#
+#   - the source connection holds one read transaction for the whole copy,
+#     so the snapshot is consistent and the copy never restarts when a desk
+#     commits (WAL lets those writers carry on past the reader);
+#   - pages are copied PAGES_PER_STEP at a time with STEP_SLEEP between
+#     steps, so the copy never hogs the disk;
+#   - the copy is written to <name>.part, verified (integrity_check and the
+#     row counts of the main tables, taken in the same read transaction) and
+#     only then renamed into place.
+#
+# Snapshots are named library-YYYYmmdd-HHMMSS.db.  After each one, rotate()
+# keeps the newest KEEP_LAST plus the newest of each of the last KEEP_DAILY
+# days and deletes the rest.  To restore, close the desks and copy a
+# snapshot over library.db (removing library.db-wal and library.db-shm).
+#
+#   python backup.py                              # snapshot library.db into backups/
+#   python backup.py --db bench.db --dir /mnt/nas/library --keep-last 12
+#   python backup.py --list
+#   python backup.py --verify backups/library-20260101-180000.db
+
+BACKUP_DIR = "backups"
+PAGES_PER_STEP = 256          # 1 MB with 4 KB pages
+STEP_SLEEP = 0.01             # seconds between steps
+KEEP_LAST = 7
+KEEP_DAILY = 30
+VERIFY_TABLES = ("booktb", "membertb", "transtb", "bookreviewtb", "holdtb")
+STAMP_FORMAT = "%Y%m%d-%H%M%S"
+
+
+class BackupError(Exception):
+    """A snapshot could not be written or failed verification."""
+
+
+def row_counts(conn, tables=VERIFY_TABLES):
+    present = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in tables if table in present}
+
+
+def backup_database(path, dest, pages=PAGES_PER_STEP, step_sleep=STEP_SLEEP, progress=None):
+    """Copy the live database at `path` to `dest` and verify the copy.
+
+    progress(copied_pages, total_pages) is called after every step.  Returns
+    {path, pages, seconds, counts}; raises BackupError (and leaves nothing at
+    `dest`) if the copy does not verify.
+    """
+    if not os.path.isfile(path):
+        # connect() would create an empty database and "back it up"
+        raise BackupError(f"No database at {path}.")
+    started = time.perf_counter()
+    part = dest + ".part"
+    if os.path.exists(part):
+        os.remove(part)
+    source = connect(path)
+    target = sqlite3.connect(part)
+    total = [0]
+
+    def step(status, remaining, count):
+        total[0] = count
+        if progress:
+            progress(count - remaining, count)
+        if remaining:
+            time.sleep(step_sleep)
+
+    try:
+        # One read transaction for the counts and the copy: both see the same snapshot
+        source.execute("BEGIN")
+        counts = row_counts(source)
+        source.backup(target, pages=pages, progress=step)
+        source.rollback()
+        # A self-contained single file, not a WAL database
+        target.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        target.close()
+        source.close()
+    problems = verify_snapshot(part, counts)
+    if problems:
+        os.remove(part)
+        raise BackupError(f"{dest} failed verification: " + "; ".join(problems))
+    os.replace(part, dest)
+    return {"path": dest, "pages": total[0], "seconds": time.perf_counter() - started, "counts": counts}
+
+
+def verify_snapshot(path, expected=None, quick=False):
+    """Problems found in the snapshot at `path` ([] when it is sound).
+
+    Runs integrity_check (quick_check if quick) and, given `expected`
+    {table: rows}, compares the row counts.
+    """
+    conn = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True)
+    try:
+        check = "quick_check" if quick else "integrity_check"
+        problems = [row[0] for row in conn.execute(f"PRAGMA {check}") if row[0] != "ok"]
+        counts = row_counts(conn, expected or ())
+        for table, rows in (expected or {}).items():
+            if table not in counts:
+                problems.append(f"{table} is missing")
+            elif counts[table] != rows:
+                problems.append(f"{table} has {counts[table]} rows, expected {rows}")
+    except sqlite3.DatabaseError as e:
+        problems = [str(e)]
+    finally:
+        conn.close()
+    return problems
+
+
+# ====================================================
+#   TIMESTAMPED SNAPSHOTS
+# ====================================================
+def _stem(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def list_snapshots(directory, stem):
+    """[(taken_at, path)] of `stem`'s snapshots in `directory`, oldest first."""
+    pattern = re.compile(re.escape(stem) + r"-(\d{8}-\d{6})\.db$")
+    found = []
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            match = pattern.match(name)
+            if match:
+                found.append((datetime.strptime(match.group(1), STAMP_FORMAT), os.path.join(directory, name)))
+    return sorted(found)
+
+
+def rotate(directory, stem, keep_last=KEEP_LAST, keep_daily=KEEP_DAILY, now=None):
+    """Delete all but the newest `keep_last` snapshots and the newest one of
+    each of the last `keep_daily` days; returns the deleted paths."""
+    now = now or datetime.now()
+    snapshots = list_snapshots(directory, stem)
+    keep = {path for _, path in snapshots[-keep_last:]} if keep_last else set()
+    newest_of_day = {}
+    for taken_at, path in snapshots:
+        if taken_at.date() > (now - timedelta(days=keep_daily)).date():
+            newest_of_day[taken_at.date()] = path
+    keep.update(newest_of_day.values())
+    removed = [path for _, path in snapshots if path not in keep]
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+def take_snapshot(path=DEFAULT_PATH, directory=BACKUP_DIR, keep_last=KEEP_LAST, keep_daily=KEEP_DAILY,
+                  pages=PAGES_PER_STEP, step_sleep=STEP_SLEEP, progress=None):
+    """Back `path` up to directory/<name>-<timestamp>.db, then rotate."""
+    os.makedirs(directory, exist_ok=True)
+    dest = os.path.join(directory, f"{_stem(path)}-{datetime.now().strftime(STAMP_FORMAT)}.db")
+    result = backup_database(path, dest, pages, step_sleep, progress)
+    result["removed"] = rotate(directory, _stem(path), keep_last, keep_daily)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Online backup of the library database.")
+    parser.add_argument("--db", default=DEFAULT_PATH)
+    parser.add_argument("--dir", default=BACKUP_DIR, help="snapshot directory")
+    parser.add_argument("--keep-last", type=int, default=KEEP_LAST)
+    parser.add_argument("--keep-daily", type=int, default=KEEP_DAILY)
+    parser.add_argument("--pages", type=int, default=PAGES_PER_STEP, help="pages copied per step")
+    parser.add_argument("--sleep", type=float, default=STEP_SLEEP, help="seconds between steps")
+    parser.add_argument("--list", action="store_true", help="list the snapshots instead")
+    parser.add_argument("--verify", metavar="SNAPSHOT", help="check an existing snapshot instead")
+    args = parser.parse_args()
+
+    if args.verify:
+        problems = verify_snapshot(args.verify)
+        print("\n".join(problems) if problems else "ok")
+        raise SystemExit(1 if problems else 0)
+    if args.list:
+        for taken_at, path in list_snapshots(args.dir, _stem(args.db)):
+            print(f"{taken_at:%Y-%m-%d %H:%M:%S}  {os.path.getsize(path) / 1e6:>9.1f} MB  {path}")
+        raise SystemExit(0)
+    try:
+        result = take_snapshot(args.db, args.dir, args.keep_last, args.keep_daily, args.pages, args.sleep)
+    except BackupError as e:
+        parser.exit(1, f"{e}\n")
+    print(f"{result['path']}: {result['pages']} pages in {result['seconds']:.2f}s, verified "
+          f"({', '.join(f'{table} {rows}' for table, rows in result['counts'].items())})")
+    for path in result["removed"]:
+        print(f"removed {path}")
@@ -0,0 +1,308 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+from datagen import SCALES, generate
+from book_search import ensure_search_index, search_books
+from loan_store import LoanStore, LoanError
+from fines import ensure_fine_rules, loan_fine, overdue_loans, run_nightly
+from library_stats import ensure_stats, read_stats, RECOUNT
+from popular_books import ensure_circulation_buckets, PopularityRanker
+from fuzzy_match import ensure_fuzzy_index, match_books
+from holds import ensure_holds
+from recommendations import ensure_recommendations, rebuild_recommendations, refresh_related, related_books
+from ratings import ensure_ratings, book_rating, top_rated
+from library_db import connect
+
+# ====================================================
+#   BENCHMARK SUITE
+# ====================================================
+# Times the hot paths of the apps against a (generated) database and writes
+# the results as JSON, so two runs can be compared:
+#
+#   python datagen.py bench.db --scale large
+#   python bench.py bench.db --out before.json
+#   ... change something ...
+#   python bench.py bench.db --out after.json --compare before.json
+#
+# The suite WRITES to the database (it issues and returns loans and runs the
+# nightly fines update), so point it at a generated file, not library.db.
+# "Today" is the last issue date in transtb, which keeps the overdue and
+# popularity numbers meaningful however old the generated data is.
+
+SUITES = ("setup", "search", "loans", "overdue", "stats", "listing", "popular")
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class Timings:
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    @contextmanager
+    def time(self, name):
+        started = time.perf_counter()
+        yield
+        self.samples[name].append(time.perf_counter() - started)
+
+    def summary(self):
+        results = {}
+        for name, samples in self.samples.items():
+            ordered = sorted(samples)
+            n = len(ordered)
+            results[name] = {
+                "runs": n,
+                "min_ms": round(ordered[0] * 1000, 3),
+                "median_ms": round(ordered[n // 2] * 1000, 3),
+                "p95_ms": round(ordered[min(n - 1, int(n * 0.95))] * 1000, 3),
+                "max_ms": round(ordered[-1] * 1000, 3),
+                "total_ms": round(sum(ordered) * 1000, 3),
+            }
+        return results
+
+
+class Bench:
+    def __init__(self, path, repeat=50, seed=1):
+        self.path = path
+        self.conn = connect(path)
+        self.repeat = repeat
+        self.rng = random.Random(seed)
+        self.timings = Timings()
+        (last,) = self.conn.execute("SELECT MAX(issue_date) FROM transtb").fetchone()
+        self.today = date.fromisoformat(last[:10]) if last else date.today()
+        (self.max_book,) = self.conn.execute("SELECT MAX(book_id) FROM booktb").fetchone()
+        (self.max_member,) = self.conn.execute("SELECT MAX(member_id) FROM membertb").fetchone()
+        self.loans = None
+
+    def counts(self):
+        return {table: self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("booktb", "membertb", "transtb", "bookreviewtb")}
+
+    def _sample(self, sql, n):
+        ids = [self.rng.randint(1, self.max_book) for _ in range(n)]
+        return [row[0] for row in self.conn.execute(
+            sql.format(ids=",".join("?" * len(ids))), ids)]
+
+    # --- Suites -----------------------------------------------------
+    def setup(self):
+        """One-off cost of the schema objects the apps create at start-up."""
+        t = self.timings
+        with t.time("setup.search_index"):
+            ensure_search_index(self.conn)
+        with t.time("setup.fuzzy_index"):
+            ensure_fuzzy_index(self.conn)
+        with t.time("setup.holds"):
+            ensure_holds(self.conn)
+        with t.time("setup.loan_store"):
+            self.loans = LoanStore(self.conn)
+        with t.time("setup.fine_rules"):
+            ensure_fine_rules(self.conn)
+        with t.time("setup.stats"):
+            ensure_stats(self.conn)
+        with t.time("setup.circulation_buckets"):
+            ensure_circulation_buckets(self.conn)
+        new = not self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'bookpairs'").fetchone()
+        with t.time("setup.recommendations"):
+            ensure_recommendations(self.conn)
+        if new:
+            with t.time("setup.recommendations_rebuild"):
+                rebuild_recommendations(self.conn)
+        with t.time("setup.ratings"):
+            ensure_ratings(self.conn)
+
+    def search(self):
+        t = self.timings
+        titles = self._sample("SELECT title FROM booktb WHERE book_id IN ({ids})", 200)
+        isbns = self._sample("SELECT isbn FROM booktb WHERE book_id IN ({ids})", 50)
+        words = sorted({w for title in titles for w in title.split() if len(w) > 3})
+        for _ in range(self.repeat):
+            word = self.rng.choice(words)
+            with t.time("search.word"):
+                search_books(self.conn, word)
+            with t.time("search.prefix2"):
+                search_books(self.conn, word[:2])
+            with t.time("search.prefix3"):
+                search_books(self.conn, word[:3])
+            with t.time("search.two_words"):
+                search_books(self.conn, " ".join(self.rng.sample(words, 2)))
+            with t.time("search.isbn"):
+                search_books(self.conn, self.rng.choice(isbns))
+            title = self.rng.choice(titles)
+            cut = self.rng.randrange(len(title))
+            with t.time("search.fuzzy"):
+                match_books(self.conn, title[:cut] + title[cut + 1:])
+            with t.time("search.related"):
+                related_books(self.conn, self.rng.randint(1, self.max_book))
+
+    def loans_suite(self):
+        t = self.timings
+        today = self.today.isoformat()
+        due = (self.today + timedelta(days=14)).isoformat()
+        numbers = [row[0] for row in self.conn.execute(
+            "SELECT membership_number FROM membertb ORDER BY random() LIMIT ?", (self.repeat,))]
+        titles = self._sample("SELECT title FROM booktb WHERE book_id IN ({ids}) AND available_copies > 0",
+                              self.repeat)
+        for number, title in zip(numbers, titles):
+            with t.time("loans.resolve"):
+                member_id = self.loans.resolve_member(str(number))
+            with t.time("loans.issue"):
+                txn = self.loans.checkout(str(number), title, today, due)
+                refresh_related(self.conn)
+            with t.time("loans.return"):
+                txn = self.loans.find_open(member_id, [txn["book_id"]])
+                self.loans.return_loan(txn, today, loan_fine(self.conn, txn["id"], today))
+
+    def overdue(self):
+        t = self.timings
+        today = self.today.isoformat()
+        for _ in range(max(1, self.repeat // 10)):
+            with t.time("overdue.scan"):
+                overdue_loans(self.conn, today)
+        with t.time("overdue.nightly_first"):
+            run_nightly(self.conn, today)
+        for _ in range(max(1, self.repeat // 10)):
+            with t.time("overdue.nightly_repeat"):
+                run_nightly(self.conn, today)
+
+    def stats(self):
+        t = self.timings
+        for _ in range(self.repeat):
+            with t.time("stats.read"):
+                read_stats(self.conn)
+            with t.time("stats.book_rating"):
+                book_rating(self.conn, self.rng.randint(1, self.max_book))
+            with t.time("stats.top_rated"):
+                top_rated(self.conn, 10)
+            with t.time("stats.top_rated_category"):
+                top_rated(self.conn, 10, "Fantasy")
+        for _ in range(max(1, self.repeat // 10)):
+            with t.time("stats.recount"):
+                for sql in RECOUNT.values():
+                    self.conn.execute(sql).fetchone()
+
+    def listing(self):
+        t = self.timings
+        with t.time("listing.anchors"):
+            anchors = self.loans.anchors(100)
+        middle = anchors[len(anchors) // 2] if anchors else None
+        (last,) = self.conn.execute("SELECT MAX(transaction_id) FROM transtb").fetchone()
+        for _ in range(self.repeat):
+            with t.time("listing.page_first"):
+                self.loans.page_after(None, 50)
+            with t.time("listing.page_middle"):
+                self.loans.page_after(middle, 50)
+            with t.time("listing.page_last"):
+                self.loans.page_before((last or 0) + 1, 50)
+        # The command line export, end to end, against this database
+        for table in ("booktb", "membertb"):
+            for _ in range(max(1, self.repeat // 25)):
+                with t.time(f"listing.cli_{table}"):
+                    subprocess.run([sys.executable, os.path.join(HERE, "Library_Management.py"),
+                                    "--db", self.path, "list", table, "--format", "csv"],
+                                   stdout=subprocess.DEVNULL, check=True)
+
+    def popular(self):
+        t = self.timings
+        with t.time("popular.load"):
+            ranker = PopularityRanker(self.conn, clock=lambda: self.today)
+        for _ in range(self.repeat):
+            for window in ranker.windows:
+                with t.time(f"popular.top_{window}d"):
+                    ranker.top_titles(window, k=10)
+            with t.time("popular.top_30d_category"):
+                ranker.top(30, k=10, category="Fantasy")
+
+    def run(self, suites=SUITES, log=print):
+        self.setup()
+        runners = {"search": self.search, "loans": self.loans_suite, "overdue": self.overdue,
+                   "stats": self.stats, "listing": self.listing, "popular": self.popular}
+        for suite in suites:
+            if suite in runners:
+                started = time.perf_counter()
+                try:
+                    runners[suite]()
+                except LoanError as e:
+                    log(f"{suite}: skipped ({e})")
+                    continue
+                log(f"{suite}: {time.perf_counter() - started:.2f}s")
+        return self.timings.summary()
+
+    def close(self):
+        self.conn.close()
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """Print the median change per benchmark against a previous results file."""
+    old = baseline["results"]
+    print(f"\n{'benchmark':<32}{'before':>12}{'after':>12}{'change':>10}")
+    for name, summary in sorted(results.items()):
+        if name not in old:
+            print(f"{name:<32}{'-':>12}{summary['median_ms']:>10.2f}ms{'new':>10}")
+            continue
+        before, after = old[name]["median_ms"], summary["median_ms"]
+        change = f"{(after - before) / before * 100:+.1f}%" if before else "-"
+        print(f"{name:<32}{before:>10.2f}ms{after:>10.2f}ms{change:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the library hot paths.")
+    parser.add_argument("db", help="generated database (created with --scale if missing)")
+    parser.add_argument("--scale", choices=SCALES, default="small", help="volumes if the db must be generated")
+    parser.add_argument("--suites", default=",".join(SUITES[1:]), help="comma separated: " + ",".join(SUITES[1:]))
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1, help="seed for the sampled queries")
+    parser.add_argument("--out", help="results file (default bench-<timestamp>.json)")
+    parser.add_argument("--compare", help="previous results file to compare against")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        generate(args.db, *SCALES[args.scale], log=lambda *a, **kw: print(*a, **kw, file=sys.stderr, flush=True))
+    suites = [s.strip() for s in args.suites.split(",") if s.strip()]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suite(s): {', '.join(sorted(unknown))}")
+
+    bench = Bench(args.db, args.repeat, args.seed)
+    meta = {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "db": os.path.abspath(args.db),
+        "db_bytes": os.path.getsize(args.db),
+        "rows": bench.counts(),
+        "today": bench.today.isoformat(),
+        "repeat": args.repeat,
+        "seed": args.seed,
+    }
+    results = bench.run(suites)
+    bench.close()
+
+    out = args.out or f"bench-{datetime.now():%Y%m%d-%H%M%S}.json"
+    with open(out, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2, sort_keys=True)
+    print(f"\n{'benchmark':<32}{'median':>12}{'p95':>12}{'runs':>6}")
+    for name, summary in sorted(results.items()):
+        print(f"{name:<32}{summary['median_ms']:>10.2f}ms{summary['p95_ms']:>10.2f}ms{summary['runs']:>6}")
+    print(f"\nResults written to {out}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
@@ -0,0 +1,71 @@
+from metadata_client import default_client
+
+# ====================================================
+#   ISBN LOOKUP (GOOGLE BOOKS -> OPEN LIBRARY)
+# ====================================================
+# Lookups go through the shared pooled MetadataClient (see metadata_client.py),
+# which applies per-provider timeouts and retries and hedges a slow Google
+# answer with Open Library.  Nothing here touches Tk, so it is safe to call
+# from a worker thread.
+
+
+def lookup_isbn(isbn, cache=None, cancel_event=None, limiters=None):
+    """Return (provider, payload) for the first provider that knows the ISBN.
+
+    Returns (None, None) when every provider answered "not found".  If a
+    provider failed and none found the book, the last error is re-raised.
+    `limiters` maps a provider name to an object with an acquire() method
+    that is called before each network request to that provider.
+    """
+    return default_client().lookup(isbn, cache=cache, limiters=limiters, cancel_event=cancel_event)
+
+
+# ====================================================
+#   PAYLOAD -> booktb ROW
+# ====================================================
+BOOK_COLUMNS = ("isbn", "title", "author", "publisher", "publication_year", "category",
+                "description", "cover_image_url", "page_count", "language")
+
+
+def _year(date_text):
+    digits = str(date_text or "")
+    for i in range(len(digits) - 3):
+        if digits[i:i + 4].isdigit():
+            return int(digits[i:i + 4])
+    return 0
+
+
+def book_record(isbn, provider, payload):
+    """Map a provider payload onto the booktb metadata columns."""
+    if provider == "google":
+        info = payload["items"][0]["volumeInfo"]
+        return {
+            "isbn": isbn,
+            "title": info.get("title", ""),
+            "author": ", ".join(info.get("authors", [])),
+            "publisher": info.get("publisher", ""),
+            "publication_year": _year(info.get("publishedDate")),
+            "category": ", ".join(info.get("categories", [])),
+            "description": info.get("description", ""),
+            "cover_image_url": info.get("imageLinks", {}).get("thumbnail", ""),
+            "page_count": info.get("pageCount", 0),
+            "language": info.get("language", ""),
+        }
+
+    description = payload.get("description", "")
+    if isinstance(description, dict):
+        description = description.get("value", "")
+    covers = payload.get("covers") or []
+    languages = payload.get("languages") or []
+    return {
+        "isbn": isbn,
+        "title": payload.get("title", ""),
+        "author": payload.get("by_statement", ""),
+        "publisher": ", ".join(payload.get("publishers", [])),
+        "publication_year": _year(payload.get("publish_date")),
+        "category": ", ".join(payload.get("subjects", [])[:3]),
+        "description": description,
+        "cover_image_url": f"https://covers.openlibrary.org/b/id/{covers[0]}-M.jpg" if covers else "",
+        "page_count": payload.get("number_of_pages", 0),
+        "language": languages[0]["key"].rsplit("/", 1)[-1] if languages else "",
+    }
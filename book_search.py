@@ -0,0 +1,131 @@
+import argparse
+import re
+import time
+
+from library_db import connect
+
+# ====================================================
+#   FULL-TEXT BOOK SEARCH (SQLite FTS5)
+# ====================================================
+# booksearch is an external-content FTS5 index over booktb: it stores only
+# the inverted index and reads the row text from booktb itself (through the
+# booksearchsource view, which drops the hyphens and spaces from ISBNs so a
+# scanned 9780306406157 finds a book stored as 978-0-306-40615-7).  Triggers
+# keep it in step with every insert, update and delete on booktb.
+#
+# Results are paged by keyset: the next page continues after the (score,
+# book_id) of the last book shown instead of skipping OFFSET rows, so the
+# sorter never holds more than one page.
+#
+# Rebuild the index of an existing database (e.g. after a bulk load):
+#   python book_search.py --rebuild --db library.db
+# Try a query from the shell:
+#   python book_search.py "tolkien hobb"
+
+SEARCH_COLUMNS = ("title", "author", "category", "description", "isbn")
+# bm25 weights, same order as SEARCH_COLUMNS
+RANK = "bm25(10.0, 6.0, 3.0, 1.0, 8.0)"
+PAGE_SIZE = 25
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def _bare_isbn(expr):
+    return f"replace(replace({expr}, '-', ''), ' ', '')"
+
+
+def ensure_search_index(conn):
+    """Create the FTS index and sync triggers; build it if it is new."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'booksearch'").fetchone()
+    cols = ", ".join(SEARCH_COLUMNS)
+    source_cols = ", ".join(_bare_isbn(c) + " AS isbn" if c == "isbn" else c for c in SEARCH_COLUMNS)
+    new_cols = ", ".join(_bare_isbn("new." + c) if c == "isbn" else "new." + c for c in SEARCH_COLUMNS)
+    old_cols = ", ".join(_bare_isbn("old." + c) if c == "isbn" else "old." + c for c in SEARCH_COLUMNS)
+    conn.executescript(f"""
+    CREATE VIEW IF NOT EXISTS booksearchsource AS SELECT book_id, {source_cols} FROM booktb;
+    CREATE VIRTUAL TABLE IF NOT EXISTS booksearch USING fts5(
+        {cols},
+        content='booksearchsource', content_rowid='book_id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    );
+
+    CREATE TRIGGER IF NOT EXISTS booksearch_ai AFTER INSERT ON booktb BEGIN
+        INSERT INTO booksearch(rowid, {cols}) VALUES (new.book_id, {new_cols});
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS booksearch_ad AFTER DELETE ON booktb BEGIN
+        INSERT INTO booksearch(booksearch, rowid, {cols}) VALUES ('delete', old.book_id, {old_cols});
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS booksearch_au AFTER UPDATE OF {cols} ON booktb BEGIN
+        INSERT INTO booksearch(booksearch, rowid, {cols}) VALUES ('delete', old.book_id, {old_cols});
+        INSERT INTO booksearch(rowid, {cols}) VALUES (new.book_id, {new_cols});
+    END;
+    """)
+    if not exists:
+        conn.execute(f"INSERT INTO booksearch(booksearch, rank) VALUES ('rank', '{RANK}')")
+        rebuild_index(conn)
+    conn.commit()
+
+
+def rebuild_index(conn):
+    conn.execute("INSERT INTO booksearch(booksearch) VALUES ('rebuild')")
+    conn.execute("INSERT INTO booksearch(booksearch) VALUES ('optimize')")
+    conn.commit()
+
+
+def build_match(text):
+    """Turn free text into an FTS5 query: every word must match, as a prefix."""
+    # ISBNs are typed with hyphens; search them as one token
+    if re.fullmatch(r"[\d\-\sXx]{10,17}", text.strip()):
+        text = re.sub(r"[\s\-]", "", text)
+    tokens = _TOKEN.findall(text)
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def search_books(conn, text, limit=PAGE_SIZE, after=None):
+    """Return up to `limit` ranked matches as dicts, best first.
+
+    For the next page pass after=(score, book_id) of the last book returned.
+    """
+    match = build_match(text)
+    if not match:
+        return []
+    where, params = ("AND (rank, rowid) > (?, ?)", after) if after else ("", ())
+    rows = conn.execute(f"""
+    SELECT b.book_id, b.isbn, b.title, b.author, b.category, b.available_copies,
+           b.total_copies, b.shelf_loc, b.cover_image_url, s.score
+    FROM (SELECT rowid AS book_id, rank AS score FROM booksearch
+          WHERE booksearch MATCH ? {where}
+          ORDER BY rank, rowid LIMIT ?) s
+    JOIN booktb b ON b.book_id = s.book_id
+    ORDER BY s.score, s.book_id
+    """, (match, *params, limit)).fetchall()
+    keys = ("book_id", "isbn", "title", "author", "category", "available_copies",
+            "total_copies", "shelf_loc", "cover_image_url", "score")
+    return [dict(zip(keys, row)) for row in rows]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Full-text search over booktb.")
+    parser.add_argument("query", nargs="?", help="search text")
+    parser.add_argument("--db", default="library.db")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the search index from booktb")
+    parser.add_argument("--limit", type=int, default=PAGE_SIZE)
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    ensure_search_index(conn)
+    if args.rebuild:
+        started = time.perf_counter()
+        rebuild_index(conn)
+        print(f"Search index rebuilt in {time.perf_counter() - started:.2f}s")
+    if args.query:
+        started = time.perf_counter()
+        results = search_books(conn, args.query, limit=args.limit)
+        elapsed = (time.perf_counter() - started) * 1000
+        for book in results:
+            print(f"{book['book_id']:>8}  {book['isbn'] or '':<14} {book['title']} - {book['author']}")
+        print(f"\n{len(results)} result(s) in {elapsed:.1f} ms")
+    conn.close()
@@ -0,0 +1,106 @@
+import argparse
+
+from library_db import connect
+from loan_store import find_members
+
+# ====================================================
+#   MEMBER BORROWING HISTORY
+# ====================================================
+# A member's loans, newest first, read in keyset pages: each page continues
+# from the (issue_date, transaction_id) of the last row shown, so page 100 of
+# a long history costs the same as page 1.  idx_transtb_member_history holds
+# every transtb column the history shows, so the pages (and the summary
+# counts) are read from that index alone; only the book titles come from
+# booktb, by primary key.
+#
+#   python borrow_history.py 100042            # membership number or "First Last"
+#   python borrow_history.py 100042 --all
+
+PAGE_SIZE = 50
+
+HISTORY_SELECT = """
+SELECT t.transaction_id, t.book_id, COALESCE(b.title, '#' || t.book_id), b.author,
+       t.issue_date, t.due_date, t.return_date, t.fine_amount, t.status
+FROM transtb t INDEXED BY idx_transtb_member_history
+LEFT JOIN booktb b ON b.book_id = t.book_id
+WHERE t.member_id = ? AND {where}
+ORDER BY t.issue_date DESC, t.transaction_id DESC
+LIMIT ?
+"""
+
+
+def ensure_history_index(conn):
+    conn.execute("""
+    CREATE INDEX IF NOT EXISTS idx_transtb_member_history
+        ON transtb(member_id, issue_date, transaction_id, book_id, due_date, return_date, fine_amount, status)
+    """)
+    conn.commit()
+
+
+def _page(conn, member_id, where, params, limit):
+    rows = conn.execute(HISTORY_SELECT.format(where=where), (member_id, *params, limit))
+    keys = ("id", "book_id", "book", "author", "issue_date", "due_date", "return_date", "fine", "status")
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def member_history(conn, member_id, cursor=None, limit=PAGE_SIZE):
+    """(loans, next_cursor): one page of the member's loans, newest first.
+
+    Pass the returned cursor to get the following page; it is None after
+    the last page.  Loans without an issue date come after all dated ones.
+    """
+    loans = []
+    if cursor is None or cursor[0] is not None:
+        if cursor is None:
+            loans = _page(conn, member_id, "t.issue_date IS NOT NULL", (), limit)
+        else:
+            loans = _page(conn, member_id, "(t.issue_date, t.transaction_id) < (?, ?)", cursor, limit)
+    if len(loans) < limit:
+        if cursor is None or cursor[0] is not None:
+            loans += _page(conn, member_id, "t.issue_date IS NULL", (), limit - len(loans))
+        else:
+            loans += _page(conn, member_id, "t.issue_date IS NULL AND t.transaction_id < ?",
+                           (cursor[1],), limit - len(loans))
+    next_cursor = (loans[-1]["issue_date"], loans[-1]["id"]) if len(loans) == limit else None
+    return loans, next_cursor
+
+
+def history_summary(conn, member_id):
+    """{loans, open, fines} for the member, counted over the history index."""
+    row = conn.execute("""
+    SELECT COUNT(*), COUNT(*) - COUNT(return_date), COALESCE(SUM(fine_amount), 0)
+    FROM transtb INDEXED BY idx_transtb_member_history WHERE member_id = ?
+    """, (member_id,)).fetchone()
+    return {"loans": row[0], "open": row[1], "fines": row[2]}
+
+
+def iter_history(conn, member_id, page_size=PAGE_SIZE):
+    cursor = None
+    while True:
+        loans, cursor = member_history(conn, member_id, cursor, page_size)
+        yield from loans
+        if cursor is None:
+            return
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="A member's borrowing history, newest first.")
+    parser.add_argument("member", help="membership number or \"First Last\"")
+    parser.add_argument("--db", default="library.db")
+    parser.add_argument("--all", action="store_true", help="print every loan, not just the first page")
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    ensure_history_index(conn)
+    members = find_members(conn, args.member)
+    if len(members) != 1:
+        parser.error(f"{len(members)} members match {args.member!r}")
+    member = members[0]
+    summary = history_summary(conn, member["member_id"])
+    print(f"{member['first_name']} {member['last_name']} ({member['membership_number']}): "
+          f"{summary['loans']} loans, {summary['open']} open, fines {summary['fines']:.2f}")
+    loans = iter_history(conn, member["member_id"]) if args.all else member_history(conn, member["member_id"])[0]
+    for loan in loans:
+        print(f"{loan['issue_date'] or '':<12}{loan['return_date'] or '-':<12}{loan['status'] or '':<10}"
+              f"{loan['fine'] or 0:>7.2f}  {loan['book']}")
+    conn.close()
@@ -0,0 +1,242 @@
+import argparse
+import csv
+import hashlib
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from isbn_cache import IsbnCache, normalize_isbn
+from book_lookup import lookup_isbn, book_record, BOOK_COLUMNS
+from library_db import connect
+from notifications import ensure_outbox, enqueue_new_arrivals
+
+# ====================================================
+#   BULK ISBN IMPORT INTO booktb
+# ====================================================
+# Usage:
+#   python bulk_import.py shipment.csv --copies 1 --shelf INTAKE
+#   cat isbns.txt | python bulk_import.py - --job donation-2024-05
+#   python bulk_import.py shipment.csv --notify     # also queue a new-arrivals digest
+#
+# ISBNs are read from a CSV file (an "isbn" column, or the first column) or
+# from stdin, de-duplicated, looked up concurrently and written to booktb in
+# large executemany batches.  Progress is recorded in the same transaction as
+# the rows, so an interrupted import can simply be re-run with the same job.
+# A file's job defaults to a hash of its contents, so a new shipment saved
+# under an old name is a new job; stdin has no such identity and needs --job.
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_RATES = {"google": 10.0, "openlibrary": 5.0}   # requests per second
+
+
+class RateLimiter:
+    """Thread-safe token bucket: at most `rate` acquires per second."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_for = (1 - self.tokens) / self.rate
+            time.sleep(wait_for)
+
+
+def read_isbns(source):
+    """Yield raw ISBN strings from a CSV file path, or stdin for '-'."""
+    handle = sys.stdin if source == "-" else open(source, newline="", encoding="utf-8")
+    try:
+        reader = csv.reader(handle)
+        column = 0
+        for i, row in enumerate(reader):
+            if not row:
+                continue
+            if i == 0:
+                header = [c.strip().lower() for c in row]
+                if "isbn" in header:
+                    column = header.index("isbn")
+                    continue
+                if normalize_isbn(row[0]) is None and not row[0].strip().isdigit():
+                    continue  # some other header line
+            if column < len(row) and row[column].strip():
+                yield row[column].strip()
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+
+
+def file_job(path):
+    """Default job for an import file: a hash of its contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return f"{os.path.basename(path)}@{digest.hexdigest()[:16]}"
+
+
+def imported_book_ids(conn, job):
+    """booktb ids of the books a job has imported so far."""
+    return [book_id for (book_id,) in conn.execute("""
+    SELECT b.book_id FROM importprogress p JOIN booktb b ON b.isbn = p.isbn
+    WHERE p.job = ? AND p.status = 'imported'
+    """, (job,))]
+
+
+def ensure_progress_table(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS importprogress(
+        job TEXT NOT NULL,
+        isbn TEXT NOT NULL,
+        status TEXT NOT NULL,
+        PRIMARY KEY (job, isbn)
+    )
+    """)
+    conn.commit()
+
+
+INSERT_BOOK = f"""
+INSERT INTO booktb ({", ".join(BOOK_COLUMNS)}, total_copies, available_copies, shelf_loc)
+VALUES ({", ".join("?" for _ in BOOK_COLUMNS)}, ?, ?, ?)
+ON CONFLICT(isbn) DO UPDATE SET
+    total_copies = total_copies + excluded.total_copies,
+    available_copies = available_copies + excluded.available_copies
+"""
+
+
+def write_batch(conn, job, books, progress):
+    with conn:
+        if books:
+            conn.executemany(INSERT_BOOK, books)
+        conn.executemany("INSERT OR REPLACE INTO importprogress(job, isbn, status) VALUES (?, ?, ?)",
+                         [(job, isbn, status) for isbn, status in progress])
+
+
+def run_import(conn, isbns, job, copies=1, shelf="", concurrency=DEFAULT_CONCURRENCY,
+               batch_size=DEFAULT_BATCH_SIZE, rates=None, cache=None, log=sys.stderr):
+    ensure_progress_table(conn)
+    limiters = {name: RateLimiter(rate) for name, rate in (rates or DEFAULT_RATES).items()}
+
+    counts = Counter()
+    summary = Counter()
+    for raw in isbns:
+        isbn = normalize_isbn(raw)
+        if isbn is None:
+            summary["invalid"] += 1
+            print(f"skipping invalid ISBN {raw!r}", file=log)
+        else:
+            counts[isbn] += 1
+
+    done = {isbn for (isbn,) in conn.execute("SELECT isbn FROM importprogress WHERE job = ?", (job,))}
+    todo = [isbn for isbn in counts if isbn not in done]
+    summary["resumed"] = len(counts) - len(todo)
+
+    started = time.perf_counter()
+    books, progress = [], []
+
+    def flush():
+        write_batch(conn, job, books, progress)
+        summary["rows"] += len(books)
+        books.clear()
+        progress.clear()
+        elapsed = time.perf_counter() - started
+        print(f"{summary['rows']} rows, {summary['not_found']} not found, "
+              f"{summary['failed']} failed ({summary['rows'] / elapsed:.1f} rows/s)", file=log)
+
+    def lookup(isbn):
+        return isbn, lookup_isbn(isbn, cache, limiters=limiters)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        pending = set()
+        remaining = iter(todo)
+        while True:
+            # Keep at most 2x concurrency lookups in flight
+            for isbn in remaining:
+                pending.add(pool.submit(lookup, isbn))
+                if len(pending) >= concurrency * 2:
+                    break
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                try:
+                    isbn, (provider, payload) = future.result()
+                except Exception as e:
+                    summary["failed"] += 1
+                    print(f"lookup failed: {e}", file=log)
+                    continue
+                if provider is None:
+                    summary["not_found"] += 1
+                    progress.append((isbn, "notfound"))
+                    continue
+                record = book_record(isbn, provider, payload)
+                n = copies * counts[isbn]
+                books.append(tuple(record[c] for c in BOOK_COLUMNS) + (n, n, shelf))
+                progress.append((isbn, "imported"))
+            if len(progress) >= batch_size:
+                flush()
+    flush()
+
+    elapsed = time.perf_counter() - started
+    summary["seconds"] = round(elapsed, 3)
+    summary["rows_per_second"] = round(summary["rows"] / elapsed, 1) if elapsed else 0.0
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import ISBNs into booktb.")
+    parser.add_argument("source", help="CSV file of ISBNs, or - for stdin")
+    parser.add_argument("--db", default="library.db")
+    parser.add_argument("--job", help="progress key for resuming (default: file name and content hash; required for stdin)")
+    parser.add_argument("--copies", type=int, default=1, help="copies per occurrence of an ISBN")
+    parser.add_argument("--shelf", default="", help="shelf location for new books")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--google-rate", type=float, default=DEFAULT_RATES["google"])
+    parser.add_argument("--openlibrary-rate", type=float, default=DEFAULT_RATES["openlibrary"])
+    parser.add_argument("--no-cache", action="store_true", help="skip the local ISBN cache")
+    parser.add_argument("--notify", action="store_true",
+                        help="queue a new-arrivals digest to members (see notifications.py)")
+    args = parser.parse_args(argv)
+
+    if args.source == "-" and not args.job:
+        parser.error("--job is required when reading ISBNs from stdin")
+    job = args.job or file_job(args.source)
+    print(f"Job: {job}")
+    conn = connect(args.db)
+    cache = None if args.no_cache else IsbnCache()
+    try:
+        summary = run_import(conn, read_isbns(args.source), job, copies=args.copies, shelf=args.shelf,
+                             concurrency=args.concurrency, batch_size=args.batch_size,
+                             rates={"google": args.google_rate, "openlibrary": args.openlibrary_rate},
+                             cache=cache)
+        if args.notify:
+            ensure_outbox(conn)
+            summary["notified"] = enqueue_new_arrivals(conn, imported_book_ids(conn, job))
+    finally:
+        conn.close()
+        if cache is not None:
+            cache.close()
+
+    print("\nImport summary:")
+    for key in ("rows", "not_found", "failed", "invalid", "resumed", "seconds", "rows_per_second"):
+        print(f"  {key}: {summary[key]}")
+    if args.notify:
+        print(f"  new-arrival notices queued: {summary['notified']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from instrumentation import timer
+
+# ====================================================
+#   BOOK COVER CACHE
+# ====================================================
+# Covers are downloaded once, shrunk to a thumbnail and stored on disk under
+# the SHA-256 of the thumbnail bytes (so identical covers behind different
+# URLs share one file).  A small SQLite index maps URL -> digest.
+#
+# Decoded PhotoImage objects are kept in an LRU bounded by an estimate of
+# their pixel memory.  Download and decode run on a TkWorker thread; only
+# the PhotoImage is created on the Tk thread, as Tk requires.
+#
+# A URL whose download fails is recorded in coverfailures and not tried again
+# for FAILURE_TTL, so redrawing a row with a dead cover link stays offline.
+
+DEFAULT_DIR = "covers"
+THUMBNAIL_SIZE = (128, 192)
+DEFAULT_MEMORY_BUDGET = 32 * 1024 * 1024   # bytes of decoded pixels
+DOWNLOAD_TIMEOUT = (3.05, 10)
+FAILURE_TTL = 15 * 60                      # seconds before a failed URL is retried
+
+
+class CoverCache:
+    def __init__(self, worker, directory=DEFAULT_DIR, memory_budget=DEFAULT_MEMORY_BUDGET):
+        self.worker = worker
+        self.directory = directory
+        self.memory_budget = memory_budget
+        self.memory_used = 0
+        self.images = OrderedDict()     # (url, size) -> (PhotoImage, bytes)
+        self.waiting = {}               # (url, size) -> [(callback, owner)]
+        self.jobs = {}                  # (url, size) -> TkWorker job
+        self.failed = {}                # url -> time of the last failed download
+        self.session = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.index = sqlite3.connect(os.path.join(directory, "index.db"), check_same_thread=False)
+        self.index.executescript("""
+        CREATE TABLE IF NOT EXISTS coverindex(url TEXT PRIMARY KEY, digest TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS coverfailures(url TEXT PRIMARY KEY, failed_at REAL NOT NULL);
+        """)
+        self.index.commit()
+
+    def request(self, url, callback, size=THUMBNAIL_SIZE, owner=None):
+        """Call callback(PhotoImage or None) on the Tk thread once the cover is ready."""
+        if not url or time.time() - self.failed.get(url, 0) < FAILURE_TTL:
+            callback(None)
+            return
+        key = (url, size)
+        if key in self.images:
+            self.images.move_to_end(key)
+            callback(self.images[key][0])
+            return
+        if key in self.waiting:
+            self.waiting[key].append((callback, owner))
+            return
+        self.waiting[key] = [(callback, owner)]
+        self.jobs[key] = self.worker.submit(lambda cancel: self._load(url, size),
+                                            on_done=lambda image: self._loaded(key, image),
+                                            on_error=lambda error: self._loaded(key, None))
+
+    def _load(self, url, size):
+        # Worker thread: disk hit or download, then decode + resize
+        from PIL import Image
+
+        data = self._read_disk(url)
+        if data is None:
+            if self._failed_recently(url):
+                return None
+            with self._lock:
+                if self.session is None:
+                    import requests
+                    self.session = requests.Session()
+            try:
+                with timer("http", "cover"):
+                    res = self.session.get(url, timeout=DOWNLOAD_TIMEOUT)
+                res.raise_for_status()
+                image = Image.open(io.BytesIO(res.content))
+                image.thumbnail(THUMBNAIL_SIZE)
+            except Exception:
+                self._record_failure(url)
+                raise
+            data = self._write_disk(url, image)
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        if size != THUMBNAIL_SIZE:
+            image.thumbnail(size)
+        return image
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest + ".png")
+
+    def _read_disk(self, url):
+        with self._lock:
+            row = self.index.execute("SELECT digest FROM coverindex WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        try:
+            with open(self._path(row[0]), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _failed_recently(self, url):
+        with self._lock:
+            row = self.index.execute("SELECT failed_at FROM coverfailures WHERE url = ?", (url,)).fetchone()
+        return row is not None and time.time() - row[0] < FAILURE_TTL
+
+    def _record_failure(self, url):
+        with self._lock:
+            self.index.execute("INSERT OR REPLACE INTO coverfailures(url, failed_at) VALUES (?, ?)",
+                               (url, time.time()))
+            self.index.commit()
+
+    def _write_disk(self, url, image):
+        buffer = io.BytesIO()
+        image.convert("RGB").save(buffer, format="PNG")
+        data = buffer.getvalue()
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        with self._lock:
+            self.index.execute("INSERT OR REPLACE INTO coverindex(url, digest) VALUES (?, ?)", (url, digest))
+            self.index.execute("DELETE FROM coverfailures WHERE url = ?", (url,))
+            self.index.commit()
+        return data
+
+    def _loaded(self, key, image):
+        # Tk thread: build the PhotoImage and hand it to everyone waiting
+        photo = None
+        if image is not None:
+            from PIL import ImageTk
+            photo = ImageTk.PhotoImage(image)
+            cost = image.width * image.height * 4
+            self.images[key] = (photo, cost)
+            self.memory_used += cost
+            while self.memory_used > self.memory_budget and len(self.images) > 1:
+                _, (_, old_cost) = self.images.popitem(last=False)
+                self.memory_used -= old_cost
+        else:
+            # Remembered here too, so redraws do not even start a job
+            self.failed[key[0]] = time.time()
+        self.jobs.pop(key, None)
+        for callback, owner in self.waiting.pop(key, []):
+            callback(photo)
+
+    def cancel_owner(self, owner):
+        """Drop callbacks registered for a window that is closing."""
+        for key, waiters in list(self.waiting.items()):
+            waiters[:] = [(cb, o) for cb, o in waiters if o is not owner]
+            if not waiters:
+                del self.waiting[key]
+                self.worker.cancel(self.jobs.pop(key))
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+        with self._lock:
+            self.index.close()
@@ -0,0 +1,208 @@
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+
+from library_db import SCHEMA
+
+# ====================================================
+#   SYNTHETIC LIBRARY DATA
+# ====================================================
+# Fills a fresh database with the booktb/membertb/transtb/bookreviewtb schema
+# at a chosen scale, so the hot paths can be measured on realistic volumes.
+# The output depends only on the seed, the volumes and --end-date: the same
+# arguments always produce the same rows.
+#
+#   python datagen.py bench.db --scale large            # 500k/200k/10M
+#   python datagen.py bench.db --books 20000 --transactions 300000 --seed 7
+#
+# Transactions are spread over --years up to --end-date in issue order.  Most
+# are returned (late ones carry a $1/day fine); loans from the last month are
+# often still open and about 2% of older loans were never returned, which
+# gives the overdue scans something to find.  Book popularity is skewed so a
+# small set of titles gets most of the issues.
+
+SCALES = {
+    #          books    members  transactions  reviews
+    "small": (10_000, 5_000, 100_000, 20_000),
+    "medium": (100_000, 50_000, 2_000_000, 200_000),
+    "large": (500_000, 200_000, 10_000_000, 1_000_000),
+}
+DEFAULT_SEED = 2024
+DEFAULT_END_DATE = "2025-06-30"
+BATCH_SIZE = 50_000
+LOAN_DAYS = 14
+
+FIRST_NAMES = ("Thabo", "Olwethu", "Neo", "Lerato", "Sipho", "Ayanda", "Zanele", "Pieter", "Anna", "James",
+               "Maria", "David", "Sarah", "Michael", "Aisha", "Ravi", "Mei", "Lucas", "Emma", "Noah",
+               "Fatima", "Kwame", "Chloe", "Daniel", "Grace", "Samuel", "Nadia", "Liam", "Zoe", "Ethan")
+LAST_NAMES = ("Nkosi", "Dlamini", "Mokoena", "Naidoo", "van der Merwe", "Smith", "Botha", "Khumalo",
+              "Ndlovu", "Pillay", "Jacobs", "Mahlangu", "Williams", "Brown", "Chen", "Patel", "Okafor",
+              "Mensah", "Garcia", "Muller", "Rossi", "Kim", "Ivanova", "Silva", "Cohen", "Hassan")
+TITLE_WORDS = ("Shadow", "River", "Silent", "Garden", "Empire", "Secret", "Winter", "Light", "Stone",
+               "Ocean", "Fire", "Last", "Hidden", "Golden", "Broken", "City", "Night", "Dream", "Storm",
+               "Crown", "Wild", "Glass", "Iron", "Forgotten", "Journey", "House", "Song", "Star", "Road",
+               "Memory", "Kingdom", "Wolf", "Mountain", "Island", "Letter", "Clock", "Mirror", "Bridge",
+               "Harvest", "Machine", "Algorithm", "Python", "Data", "History", "Science", "Mind", "Heart")
+CATEGORIES = ("Fiction", "Fantasy", "Science Fiction", "Mystery", "Romance", "History", "Biography",
+              "Science", "Computers", "Children", "Poetry", "Travel", "Self-Help", "Business", "Art")
+PUBLISHERS = ("Penguin", "HarperCollins", "Macmillan", "Random House", "Pan Macmillan SA", "Jacana",
+              "O'Reilly", "Oxford University Press", "Wiley", "Tafelberg")
+LANGUAGES = ("en",) * 8 + ("af", "zu", "xh", "fr")
+MEMBERSHIP_TYPES = ("standard",) * 6 + ("student",) * 3 + ("senior", "staff")
+REVIEW_TEXTS = ("Loved it.", "Could not put it down.", "Not for me.", "A bit slow in the middle.",
+                "Great for research.", "Would recommend to friends.", "Beautifully written.",
+                "Too long.", "Read it twice.", "Fine, nothing special.")
+
+
+def isbn13(n):
+    """A valid, unique ISBN-13 for serial number n."""
+    body = f"978{n:09d}"
+    check = (10 - sum((3 if i % 2 else 1) * int(d) for i, d in enumerate(body)) % 10) % 10
+    return body + str(check)
+
+
+def _batches(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _insert(conn, sql, rows, label, total, log):
+    done = 0
+    started = time.perf_counter()
+    for batch in _batches(rows):
+        conn.executemany(sql, batch)
+        done += len(batch)
+        if log:
+            log(f"\r{label}: {done}/{total}", end="")
+    conn.commit()
+    if log:
+        log(f"\r{label}: {done} rows in {time.perf_counter() - started:.1f}s")
+
+
+def _books(rng, n):
+    for i in range(1, n + 1):
+        title = " ".join(rng.sample(TITLE_WORDS, rng.randint(1, 4)))
+        if rng.random() < 0.5:
+            title = "The " + title
+        author = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        category = rng.choice(CATEGORIES)
+        copies = rng.choice((1, 1, 1, 2, 2, 3, 5))
+        yield (isbn13(i), title, author, rng.choice(PUBLISHERS), rng.randint(1950, 2025), category,
+               f"A {category.lower()} book by {author}.", f"https://covers.example.org/{i}.jpg",
+               rng.randint(80, 900), rng.choice(LANGUAGES), copies, copies,
+               f"{category[:3].upper()}-{rng.randint(1, 40):02d}")
+
+
+def _members(rng, n, end):
+    for i in range(1, n + 1):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        joined = end - timedelta(days=rng.randint(0, 3650))
+        email = f"{first.lower()}.{last.replace(' ', '').lower()}{i}@example.org"
+        status = "active" if rng.random() < 0.95 else "inactive"
+        yield (100000 + i, first, last, email, f"0{rng.randint(600000000, 839999999)}",
+               f"{rng.randint(1, 999)} {rng.choice(TITLE_WORDS)} Street", joined.isoformat(),
+               rng.choice(MEMBERSHIP_TYPES), status)
+
+
+def _transactions(rng, n, n_books, n_members, end, years):
+    span = 365 * years
+    start = end - timedelta(days=span)
+    days = [(start + timedelta(days=d)).isoformat() for d in range(span + LOAN_DAYS + 40)]
+    for i in range(n):
+        issued = min(span, i * span // n + rng.randint(0, 1))
+        book = int(n_books * rng.random() ** 3) + 1          # skewed popularity
+        member = rng.randint(1, n_members)
+        due = issued + LOAN_DAYS
+        age = span - issued
+        if (age < 30 and rng.random() < 0.6) or (age >= 30 and rng.random() < 0.02):
+            yield member, book, days[issued], days[due], None, 0, "issued"
+            continue
+        returned = min(span, issued + rng.randint(1, LOAN_DAYS + 10))
+        fine = float(max(0, returned - due))
+        yield member, book, days[issued], days[due], days[returned], fine, "returned"
+
+
+def _reviews(rng, n, n_books, n_members, end):
+    for _ in range(n):
+        rating = rng.choice((1, 2, 3, 3, 4, 4, 4, 5, 5, 5))
+        yield (int(n_books * rng.random() ** 2) + 1, rng.randint(1, n_members), rating,
+               rng.choice(REVIEW_TEXTS), (end - timedelta(days=rng.randint(0, 1000))).isoformat())
+
+
+def generate(path, books, members, transactions, reviews, seed=DEFAULT_SEED,
+             end_date=DEFAULT_END_DATE, years=3, log=print):
+    """Create `path` and fill it. The file must not exist yet."""
+    if os.path.exists(path):
+        raise FileExistsError(f"{path} already exists")
+    end = date.fromisoformat(end_date)
+    conn = sqlite3.connect(path)
+    conn.executescript("PRAGMA journal_mode = OFF; PRAGMA synchronous = OFF; PRAGMA cache_size = -200000;")
+    conn.executescript(SCHEMA)
+    # Each table gets its own generator so changing one volume leaves the others' rows alone
+    _insert(conn, """
+    INSERT INTO booktb(isbn, title, author, publisher, publication_year, category, description,
+                       cover_image_url, page_count, language, total_copies, available_copies, shelf_loc)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, _books(random.Random(f"{seed}:books"), books), "booktb", books, log)
+    _insert(conn, """
+    INSERT INTO membertb(membership_number, first_name, last_name, email, phone, address,
+                         join_date, membership_type, status)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, _members(random.Random(f"{seed}:members"), members, end), "membertb", members, log)
+    _insert(conn, """
+    INSERT INTO transtb(member_id, book_id, issue_date, due_date, return_date, fine_amount, status)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, _transactions(random.Random(f"{seed}:transactions"), transactions, books, members, end, years),
+            "transtb", transactions, log)
+    _insert(conn, """
+    INSERT INTO bookreviewtb(book_id, member_id, rating, review_text, review_date)
+    VALUES (?, ?, ?, ?, ?)
+    """, _reviews(random.Random(f"{seed}:reviews"), reviews, books, members, end),
+            "bookreviewtb", reviews, log)
+
+    # Copies on loan are not on the shelf
+    with conn:
+        conn.execute("""
+        UPDATE booktb SET available_copies = MAX(0, total_copies - o.n)
+        FROM (SELECT book_id, COUNT(*) AS n FROM transtb WHERE return_date IS NULL GROUP BY book_id) AS o
+        WHERE booktb.book_id = o.book_id
+        """)
+    conn.execute("PRAGMA journal_mode = DELETE")
+    conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic library database.")
+    parser.add_argument("path", help="database file to create (must not exist)")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--books", type=int)
+    parser.add_argument("--members", type=int)
+    parser.add_argument("--transactions", type=int)
+    parser.add_argument("--reviews", type=int)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--end-date", default=DEFAULT_END_DATE, help="last issue date (YYYY-MM-DD)")
+    parser.add_argument("--years", type=int, default=3, help="years of transaction history")
+    parser.add_argument("--force", action="store_true", help="replace an existing file")
+    args = parser.parse_args()
+
+    books, members, transactions, reviews = SCALES[args.scale]
+    if args.force and os.path.exists(args.path):
+        os.remove(args.path)
+    try:
+        generate(args.path, args.books or books, args.members or members,
+                 args.transactions if args.transactions is not None else transactions,
+                 args.reviews if args.reviews is not None else reviews,
+                 args.seed, args.end_date, args.years,
+                 log=lambda *a, **kw: print(*a, **kw, file=sys.stderr, flush=True))
+    except FileExistsError as e:
+        parser.error(f"{e} (use --force to replace it)")
@@ -0,0 +1,133 @@
+import argparse
+import time
+from datetime import date
+
+from library_db import connect
+
+# ====================================================
+#   FINES ENGINE
+# ====================================================
+# Overdue status and fines are computed in SQL over transtb, one statement for
+# all open loans, instead of parsing due dates one by one in Python.
+#
+# Rates live in the finerules table, one row per membership_type plus a '*'
+# row used for any type without its own rule:
+#   fine = min(max_fine, max(0, days_late - grace_days) * daily_rate)
+#
+#   python fines.py --nightly                    # update fine_amount/status
+#   python fines.py --set-rule student 0.5 --grace 2 --cap 20
+#   python fines.py --rules
+
+DEFAULT_RULE = ("*", 1.0, 0, None)   # $1/day, no grace, no cap
+STATUS_OVERDUE = "overdue"
+
+
+def ensure_fine_rules(conn):
+    conn.executescript("""
+    CREATE TABLE IF NOT EXISTS finerules(
+        membership_type TEXT PRIMARY KEY,
+        daily_rate REAL NOT NULL,
+        grace_days INTEGER NOT NULL DEFAULT 0,
+        max_fine REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_transtb_open_due
+        ON transtb(due_date) WHERE return_date IS NULL;
+    """)
+    conn.execute("INSERT OR IGNORE INTO finerules VALUES (?, ?, ?, ?)", DEFAULT_RULE)
+    conn.commit()
+
+
+def set_rule(conn, membership_type, daily_rate, grace_days=0, max_fine=None):
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO finerules VALUES (?, ?, ?, ?)",
+                     (membership_type, daily_rate, grace_days, max_fine))
+
+
+# Fine for loan t of member m as of :on, using the member's rule or the '*' rule
+FINE_EXPR = """
+MIN(
+    COALESCE(r.max_fine, d.max_fine, 1e18),
+    MAX(0, CAST(julianday(:on) - julianday(t.due_date) AS INTEGER)
+           - COALESCE(r.grace_days, d.grace_days))
+    * COALESCE(r.daily_rate, d.daily_rate)
+)
+"""
+RULE_JOINS = """
+LEFT JOIN membertb m ON m.member_id = t.member_id
+LEFT JOIN finerules r ON r.membership_type = m.membership_type
+JOIN finerules d ON d.membership_type = '*'
+"""
+
+
+def loan_fine(conn, txn_id, on_date):
+    """Fine for one loan if it is returned on `on_date` (YYYY-MM-DD)."""
+    row = conn.execute(f"""
+    SELECT {FINE_EXPR} FROM transtb t {RULE_JOINS}
+    WHERE t.transaction_id = :id
+    """, {"on": on_date, "id": txn_id}).fetchone()
+    return round(row[0], 2) if row and row[0] is not None else 0
+
+
+def overdue_loans(conn, today=None):
+    """All open loans past their due date, with the fine accrued so far."""
+    today = today or date.today().isoformat()
+    rows = conn.execute(f"""
+    SELECT t.transaction_id, t.member_id, t.book_id,
+           COALESCE(m.first_name || ' ' || m.last_name, '#' || t.member_id),
+           COALESCE(b.title, '#' || t.book_id), m.email,
+           t.issue_date, t.due_date, {FINE_EXPR}
+    FROM transtb t INDEXED BY idx_transtb_open_due
+    {RULE_JOINS}
+    LEFT JOIN booktb b ON b.book_id = t.book_id
+    WHERE t.return_date IS NULL AND t.due_date < :on
+    ORDER BY t.due_date
+    """, {"on": today}).fetchall()
+    keys = ("id", "member_id", "book_id", "member", "book", "email", "issue_date", "due_date", "fine")
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def run_nightly(conn, today=None):
+    """Bring fine_amount and status of every overdue open loan up to date.
+
+    Returns the number of loans whose fine or status changed.
+    """
+    today = today or date.today().isoformat()
+    with conn:
+        cur = conn.execute(f"""
+        UPDATE transtb
+        SET fine_amount = f.fine, status = :overdue
+        FROM (
+            SELECT t.transaction_id AS id, ROUND({FINE_EXPR}, 2) AS fine
+            FROM transtb t INDEXED BY idx_transtb_open_due
+            {RULE_JOINS}
+            WHERE t.return_date IS NULL AND t.due_date < :on
+        ) AS f
+        WHERE transtb.transaction_id = f.id
+          AND (transtb.fine_amount IS NOT f.fine OR transtb.status IS NOT :overdue)
+        """, {"on": today, "overdue": STATUS_OVERDUE})
+    return cur.rowcount
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Overdue fines for open loans.")
+    parser.add_argument("--db", default="library.db")
+    parser.add_argument("--date", help="compute as of this date (YYYY-MM-DD, default today)")
+    parser.add_argument("--nightly", action="store_true", help="update fine_amount/status of overdue loans")
+    parser.add_argument("--rules", action="store_true", help="list fine rules")
+    parser.add_argument("--set-rule", nargs=2, metavar=("TYPE", "RATE"), help="daily rate for a membership type")
+    parser.add_argument("--grace", type=int, default=0, help="grace days for --set-rule")
+    parser.add_argument("--cap", type=float, help="maximum fine for --set-rule")
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    ensure_fine_rules(conn)
+    if args.set_rule:
+        set_rule(conn, args.set_rule[0], float(args.set_rule[1]), args.grace, args.cap)
+    if args.rules or args.set_rule:
+        for rule in conn.execute("SELECT * FROM finerules ORDER BY membership_type"):
+            print("type={} rate={} grace={} cap={}".format(*rule))
+    if args.nightly:
+        started = time.perf_counter()
+        changed = run_nightly(conn, args.date)
+        print(f"Updated {changed} overdue loan(s) in {time.perf_counter() - started:.2f}s")
+    conn.close()
@@ -0,0 +1,232 @@
+import argparse
+import heapq
+import math
+import re
+import time
+
+from library_db import connect
+
+# ====================================================
+#   FUZZY MATCHING (TRIGRAMS)
+# ====================================================
+# fuzzybooks (title, author) and fuzzymembers ("first last") are FTS5 indexes
+# with the trigram tokenizer: an inverted index from every 3-character
+# window of the text to the rows containing it.  Like booksearch they store
+# no text of their own, and triggers keep them in step with booktb/membertb.
+#
+# A query is split into its trigrams and a row is a candidate only if it
+# shares at least MIN_SHARED of them.  A row sharing T of the query's Q
+# trigrams misses at most Q - T, so if the trigrams are dealt into Q - T + 1
+# groups it contains every trigram of at least one group.  Candidates are
+# therefore one FTS5 query, (a AND b) OR (c AND d) OR ..., which FTS5 answers
+# by intersecting posting lists without reading them out; pairing each rare
+# trigram with common ones keeps every group selective.  The filter is exact
+# (no row is cut off by position in a list); when it still returns more than
+# MAX_CANDIDATES rows, T is raised, and text that matches too many rows even
+# with every trigram required ("the") matches nothing.  Only the candidates are fetched and
+# scored, so the cost depends on the query, not on the size of the catalog.
+#
+# Scoring uses word trigrams padded like PostgreSQL's pg_trgm ("  ne", " ne",
+# "neo", "eo "), so the start of each word counts and "Ne Williams" is closer
+# to "Neo Williams" than to "Zoe Williams".  score = mean of
+#   containment  share of the query's trigrams found in the text
+#   dice         2 * shared / (query + text trigrams), so closer lengths win
+# "Harry Potter" scores 1.0 against itself and ~0.7 against "Harry Potter
+# and the Philosopher's Stone"; "Hary Poter" ~0.7 against "Harry Potter".
+#
+#   python fuzzy_match.py "hary poter"             # ranked books
+#   python fuzzy_match.py --members "jon smiht"    # ranked members
+#   python fuzzy_match.py --rebuild
+
+MIN_SHARED = 0.5          # share of the query's trigrams a candidate must have
+MIN_SCORE = 0.4
+MAX_CANDIDATES = 500      # require more shared trigrams past this many rows
+CHUNK = 500
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def ensure_fuzzy_index(conn):
+    """Create the trigram indexes and their sync triggers; build them if new."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'fuzzybooks'").fetchone()
+    conn.executescript("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS fuzzybooks USING fts5(
+        title, author,
+        content='booktb', content_rowid='book_id',
+        tokenize='trigram', detail='column'
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS fuzzybooks_terms USING fts5vocab(fuzzybooks, row);
+    DROP TABLE IF EXISTS fuzzybooks_hits;
+
+    CREATE TRIGGER IF NOT EXISTS fuzzybooks_ai AFTER INSERT ON booktb BEGIN
+        INSERT INTO fuzzybooks(rowid, title, author) VALUES (new.book_id, new.title, new.author);
+    END;
+    CREATE TRIGGER IF NOT EXISTS fuzzybooks_ad AFTER DELETE ON booktb BEGIN
+        INSERT INTO fuzzybooks(fuzzybooks, rowid, title, author) VALUES ('delete', old.book_id, old.title, old.author);
+    END;
+    CREATE TRIGGER IF NOT EXISTS fuzzybooks_au AFTER UPDATE OF title, author ON booktb BEGIN
+        INSERT INTO fuzzybooks(fuzzybooks, rowid, title, author) VALUES ('delete', old.book_id, old.title, old.author);
+        INSERT INTO fuzzybooks(rowid, title, author) VALUES (new.book_id, new.title, new.author);
+    END;
+
+    CREATE VIEW IF NOT EXISTS membernames AS
+        SELECT member_id, first_name || ' ' || last_name AS name FROM membertb;
+    CREATE VIRTUAL TABLE IF NOT EXISTS fuzzymembers USING fts5(
+        name,
+        content='membernames', content_rowid='member_id',
+        tokenize='trigram', detail='none'
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS fuzzymembers_terms USING fts5vocab(fuzzymembers, row);
+    DROP TABLE IF EXISTS fuzzymembers_hits;
+
+    CREATE TRIGGER IF NOT EXISTS fuzzymembers_ai AFTER INSERT ON membertb BEGIN
+        INSERT INTO fuzzymembers(rowid, name) VALUES (new.member_id, new.first_name || ' ' || new.last_name);
+    END;
+    CREATE TRIGGER IF NOT EXISTS fuzzymembers_ad AFTER DELETE ON membertb BEGIN
+        INSERT INTO fuzzymembers(fuzzymembers, rowid, name)
+        VALUES ('delete', old.member_id, old.first_name || ' ' || old.last_name);
+    END;
+    CREATE TRIGGER IF NOT EXISTS fuzzymembers_au AFTER UPDATE OF first_name, last_name ON membertb BEGIN
+        INSERT INTO fuzzymembers(fuzzymembers, rowid, name)
+        VALUES ('delete', old.member_id, old.first_name || ' ' || old.last_name);
+        INSERT INTO fuzzymembers(rowid, name) VALUES (new.member_id, new.first_name || ' ' || new.last_name);
+    END;
+    """)
+    if not exists:
+        rebuild_fuzzy_index(conn)
+    conn.commit()
+
+
+def rebuild_fuzzy_index(conn):
+    for index in ("fuzzybooks", "fuzzymembers"):
+        conn.execute(f"INSERT INTO {index}({index}) VALUES ('rebuild')")
+        conn.execute(f"INSERT INTO {index}({index}) VALUES ('optimize')")
+    conn.commit()
+
+
+def trigrams(text):
+    """The set of 3-character windows of text, folded like the trigram tokenizer."""
+    text = " ".join(str(text).lower().split())
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def word_trigrams(text):
+    """Trigrams of each word padded as "  word ", for scoring."""
+    grams = set()
+    for word in _WORD.findall(str(text).lower()):
+        word = f"  {word} "
+        grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+def similarity(query_grams, text):
+    """Score in [0, 1] of text against word_trigrams() of the query."""
+    grams = word_trigrams(text)
+    shared = len(query_grams & grams)
+    if not shared:
+        return 0.0
+    return (shared / len(query_grams) + 2 * shared / (len(query_grams) + len(grams))) / 2
+
+
+def _quote(gram):
+    return '"' + gram.replace('"', '""') + '"'
+
+
+def candidates(conn, index, grams):
+    """Rowids of the rows that share MIN_SHARED of `grams` (a higher share
+    when that many rows would be too many to score).  At most MAX_CANDIDATES;
+    none when the text is too vague ("the") to narrow the catalog that far.
+    """
+    counts = {}
+    for gram in grams:
+        row = conn.execute(f"SELECT doc FROM {index}_terms WHERE term = ?", (gram,)).fetchone()
+        if row:
+            counts[gram] = row[0]
+    present = sorted(counts, key=counts.get)
+    needed = max(1, math.ceil(len(grams) * MIN_SHARED))
+    rows = []
+    while needed <= len(present):
+        # Deal the trigrams, rarest first, into len(present) - needed + 1 groups:
+        # a row missing fewer trigrams than there are groups holds all of one
+        width = len(present) - needed + 1
+        groups = [present[i::width] for i in range(width)]
+        query = " OR ".join("(" + " AND ".join(map(_quote, group)) + ")" for group in groups)
+        # The LIMIT only tells "too many" early; a result that fits is complete
+        rows = [rowid for (rowid,) in conn.execute(
+            f"SELECT rowid FROM {index} WHERE {index} MATCH ? LIMIT ?", (query, MAX_CANDIDATES + 1))]
+        if len(rows) <= MAX_CANDIDATES:
+            return rows
+        needed += 1
+    return []   # too vague: even rows holding every trigram are too many to score
+
+
+def _rows(conn, sql, ids):
+    ids = list(ids)
+    for start in range(0, len(ids), CHUNK):
+        chunk = ids[start:start + CHUNK]
+        yield from conn.execute(sql.format(ids=",".join("?" * len(chunk))), chunk)
+
+
+def match_books(conn, text, limit=10, min_score=MIN_SCORE):
+    """[{book_id, title, author, isbn, field, score}] best first, matched on
+    title or author (whichever scores higher).
+    """
+    grams, query = trigrams(text), word_trigrams(text)
+    if not grams:
+        return []
+    scored = []
+    for book_id, title, author, isbn in _rows(
+            conn, "SELECT book_id, title, author, isbn FROM booktb WHERE book_id IN ({ids})",
+            candidates(conn, "fuzzybooks", grams)):
+        score, field = max((similarity(query, title), "title"), (similarity(query, author), "author"))
+        if score >= min_score:
+            scored.append({"book_id": book_id, "title": title, "author": author, "isbn": isbn,
+                           "field": field, "score": round(score, 3)})
+    return heapq.nlargest(limit, scored, key=lambda book: (book["score"], -book["book_id"]))
+
+
+def match_members(conn, text, limit=10, min_score=MIN_SCORE):
+    """[{member_id, membership_number, first_name, last_name, score}] best first."""
+    grams, query = trigrams(text), word_trigrams(text)
+    if not grams:
+        return []
+    scored = []
+    for member_id, number, first, last in _rows(
+            conn, "SELECT member_id, membership_number, first_name, last_name FROM membertb "
+                  "WHERE member_id IN ({ids})", candidates(conn, "fuzzymembers", grams)):
+        score = similarity(query, f"{first} {last}")
+        if score >= min_score:
+            scored.append({"member_id": member_id, "membership_number": number, "first_name": first,
+                           "last_name": last, "score": round(score, 3)})
+    return heapq.nlargest(limit, scored, key=lambda member: (member["score"], -member["member_id"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fuzzy book/member lookup over trigram indexes.")
+    parser.add_argument("text", nargs="?")
+    parser.add_argument("--db", default="library.db")
+    parser.add_argument("--members", action="store_true", help="match member names instead of books")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--rebuild", action="store_true", help="rebuild both trigram indexes")
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    started = time.perf_counter()
+    ensure_fuzzy_index(conn)
+    if args.rebuild:
+        rebuild_fuzzy_index(conn)
+        print(f"rebuilt in {time.perf_counter() - started:.2f}s")
+    if args.text:
+        started = time.perf_counter()
+        if args.members:
+            results = [(m["score"], f"{m['first_name']} {m['last_name']} ({m['membership_number']})")
+                       for m in match_members(conn, args.text, args.limit)]
+        else:
+            results = [(b["score"], f"{b['title']} by {b['author']} [{b['field']}]")
+                       for b in match_books(conn, args.text, args.limit)]
+        elapsed = time.perf_counter() - started
+        for score, label in results:
+            print(f"{score:.3f}  {label}")
+        print(f"{len(results)} match(es) in {elapsed * 1000:.1f}ms")
+    conn.close()
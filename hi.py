@@ -1,10 +1,25 @@
+import time
+STARTED = time.perf_counter()   # taken before the other imports for the start-up report
+
+import gc
 import tkinter as tk
 from tkinter import ttk, messagebox
 from datetime import datetime, timedelta
+from txn_table import TransactionTable
+from loan_store import LoanError
+from library_client import loan_backend, LibraryClient, ServerError
+from library_stats import format_stats
+from library_windows import open_search_books_window, open_borrow_history_window, open_diagnostics_window
+import instrumentation
+from recommendations import refresh_related
+from tk_worker import TkWorker
+from typeahead import load_catalog, attach_typeahead
 
 
 class LibraryApp(tk.Tk):
     def __init__(self):
+        self.startup = instrumentation.StartupTimer(STARTED)
+        self.startup.mark("imports")
         super().__init__()
         self.title("📚 Library Management System")
         self.geometry("700x500")
@@ -30,25 +45,86 @@ class LibraryApp(tk.Tk):
         ttk.Button(self, text="👥 Member Management", command=self.open_member_management_window, width=30).pack(pady=10)
         ttk.Button(self, text="💼 Transaction Management", command=self.open_transaction_management_window, width=30).pack(pady=10)
 
-        self.transactions = []  # shared data between windows
+        self.loans = loan_backend()  # shared data between windows
+        self.remote = isinstance(self.loans, LibraryClient)   # the server owns the database
+        self.conn = None if self.remote else self.loans.conn
+        self.lag_monitor = instrumentation.LagMonitor(self).start()
+        if instrumentation.ENABLED:
+            ttk.Button(self, text="🩺 Diagnostics", command=lambda: open_diagnostics_window(self),
+                       width=30).pack(pady=10)
+
+        # Section windows are built on first open and then reused
+        self.windows = {}
+        self.window_refresh = {}
+        self.catalog = None         # typeahead index, loaded in the background after first paint
+        self.startup.mark("window")
+        self.after_idle(self._finish_startup)
+
+    def _finish_startup(self):
+        self.update_idletasks()
+        self.startup.mark("first_paint")
+        self.startup.report()
+        self.worker = TkWorker(self)
+        if not self.remote:
+            # The typeahead index reads the catalog tables; a desk on the server goes without
+            load_catalog(self.worker, self.conn, self._catalog_loaded)
+
+    # --- Member/book typeahead (typeahead.py) ---
+    def _catalog_loaded(self, catalog):
+        self.catalog = catalog
+        # The index's millions of long-lived keys would otherwise make every
+        # full GC pass stall a keystroke (~40ms); this app keeps them for good
+        gc.freeze()
+
+    def _add_typeahead(self, member, book):
+        if self.catalog is not None:
+            self.catalog.refresh()
+        attach_typeahead(member, lambda text: self.catalog.suggest_members(text) if self.catalog else [])
+        attach_typeahead(book, lambda text: self.catalog.suggest_books(text) if self.catalog else [])
+
+    # ====================================================
+    #   WINDOW CACHE
+    # ====================================================
+    # Closing a section window only hides it; the next open shows the same
+    # window again and refreshes its data instead of rebuilding every widget.
+    def _show_window(self, name):
+        win = self.windows.get(name)
+        if win is None or not win.winfo_exists():
+            return False
+        win.deiconify()
+        win.lift()
+        refresh = self.window_refresh.get(name)
+        if refresh:
+            refresh()
+        return True
+
+    def _new_window(self, name):
+        win = tk.Toplevel(self)
+        win.protocol("WM_DELETE_WINDOW", win.withdraw)
+        self.windows[name] = win
+        return win
 
     # ====================================================
     #   DASHBOARD WINDOW
     # ====================================================
     def open_dashboard_window(self):
-        win = tk.Toplevel(self)
+        if self._show_window("dashboard"):
+            return
+        win = self._new_window("dashboard")
         win.title("📊 Dashboard")
         win.geometry("800x600")
         win.config(bg="#e8eaf6")
 
         tk.Label(win, text="📊 Library Dashboard", font=("Arial", 18, "bold"), bg="#283593", fg="white").pack(fill="x", pady=5)
 
-        tk.Label(
+        stats_label = tk.Label(
             win,
-            text="📈 Key Statistics:\n• Total Books: 1240\n• Total Members: 320\n• Books Issued: 410",
+            text=format_stats(self.loans.stats()),
             font=("Arial", 12),
             bg="#e8eaf6", justify="left"
-        ).pack(pady=10)
+        )
+        stats_label.pack(pady=10)
+        self.window_refresh["dashboard"] = lambda: stats_label.config(text=format_stats(self.loans.stats()))
 
         ttk.Button(win, text="Add Book", command=self.open_add_book_window).pack(pady=5)
         ttk.Button(win, text="Issue Book", command=self.open_issue_book_window).pack(pady=5)
@@ -64,7 +140,9 @@ class LibraryApp(tk.Tk):
     #   BOOK MANAGEMENT WINDOW
     # ====================================================
     def open_book_management_window(self):
-        win = tk.Toplevel(self)
+        if self._show_window("books"):
+            return
+        win = self._new_window("books")
         win.title("📚 Book Management")
         win.geometry("700x600")
         win.config(bg="#e3f2fd")
@@ -78,7 +156,9 @@ class LibraryApp(tk.Tk):
     #   MEMBER MANAGEMENT WINDOW
     # ====================================================
     def open_member_management_window(self):
-        win = tk.Toplevel(self)
+        if self._show_window("members"):
+            return
+        win = self._new_window("members")
         win.title("👥 Member Management")
         win.geometry("700x600")
         win.config(bg="#f3e5f5")
@@ -93,7 +173,9 @@ class LibraryApp(tk.Tk):
     #   TRANSACTION MANAGEMENT WINDOW
     # ====================================================
     def open_transaction_management_window(self):
-        win = tk.Toplevel(self)
+        if self._show_window("transactions"):
+            return
+        win = self._new_window("transactions")
         win.title("💼 Transaction Management")
         win.geometry("900x600")
         win.config(bg="#fff3e0")
@@ -105,16 +187,16 @@ class LibraryApp(tk.Tk):
         for col in columns:
             tree.heading(col, text=col.replace("_", " ").title())
             tree.column(col, width=130, anchor="center")
+        scrollbar = ttk.Scrollbar(win, orient="vertical")
+        scrollbar.pack(side="right", fill="y", pady=10)
         tree.pack(fill="both", expand=True, pady=10)
+        table = TransactionTable(tree, self.loans, scrollbar)
 
         def refresh():
-            for row in tree.get_children():
-                tree.delete(row)
-            for txn in self.transactions:
-                tree.insert("", "end", values=(
-                    txn["member"], txn["book"], txn["issue_date"],
-                    txn["due_date"], txn["return_date"], f"${txn['fine']}"
-                ))
+            table.refresh()
+
+        refresh()
+        self.window_refresh["transactions"] = refresh
 
         ttk.Button(win, text="Issue Book", command=self.open_issue_book_window).pack(side="left", padx=10, pady=10)
         ttk.Button(win, text="Return Book", command=self.open_return_book_window).pack(side="left", padx=10, pady=10)
@@ -130,7 +212,7 @@ class LibraryApp(tk.Tk):
         self._popup_form("📗 Update Book", ["ISBN", "New Title", "New Author", "Availability"], "Book updated (placeholder)")
 
     def open_search_books_window(self):
-        self._popup_form("🔍 Search Books", ["Title / Author / ISBN"], "Search results (placeholder)")
+        open_search_books_window(self, self.loans)
 
     def open_register_member_window(self):
         self._popup_form("👤 Register Member", ["Member ID", "Full Name", "Email", "Phone", "Address"], "Member registered (placeholder)")
@@ -139,7 +221,7 @@ class LibraryApp(tk.Tk):
         self._popup_form("👥 Update Member Info", ["Member ID", "New Email", "New Phone", "New Address"], "Member updated (placeholder)")
 
     def open_borrow_history_window(self):
-        self._open_popup("Borrow History", "View member borrowing history.")
+        open_borrow_history_window(self, self.loans)
 
     def open_email_notify_window(self):
         self._open_popup("Email Notifications", "Send email reminders to members.")
@@ -150,13 +232,14 @@ class LibraryApp(tk.Tk):
     def open_issue_book_window(self):
         win = tk.Toplevel(self)
         win.title("📗 Issue Book")
-        win.geometry("400x350")
+        win.geometry("400x390")
         tk.Label(win, text="Member Name:").pack(pady=5)
         member = tk.Entry(win, width=30)
         member.pack()
         tk.Label(win, text="Book Title:").pack(pady=5)
         book = tk.Entry(win, width=30)
         book.pack()
+        self._add_typeahead(member, book)
         tk.Label(win, text="Issue Date:").pack(pady=5)
         issue = tk.Entry(win, width=30)
         issue.insert(0, datetime.now().strftime("%Y-%m-%d"))
@@ -166,15 +249,29 @@ class LibraryApp(tk.Tk):
         due.insert(0, (datetime.now() + timedelta(days=7)).strftime("%Y-%m-%d"))
         due.pack()
 
+        @instrumentation.timed("save_issue")
         def save():
-            data = {"member": member.get(), "book": book.get(),
-                    "issue_date": issue.get(), "due_date": due.get(),
-                    "return_date": None, "fine": 0}
-            self.transactions.append(data)
+            try:
+                self.loans.checkout(member.get(), book.get(), issue.get(), due.get())
+            except (LoanError, ServerError) as e:
+                messagebox.showerror("Error", str(e), parent=win)
+                return
+            if not self.remote:
+                refresh_related(self.conn)
             messagebox.showinfo("Success", "Book issued successfully!")
             win.destroy()
 
+        def place_hold():
+            try:
+                hold = self.loans.place_hold(member.get(), book.get())
+            except (LoanError, ServerError) as e:
+                messagebox.showerror("Error", str(e), parent=win)
+                return
+            messagebox.showinfo("Hold Placed", f"Hold placed: number {hold['position']} in the queue.", parent=win)
+            win.destroy()
+
         ttk.Button(win, text="Save", command=save).pack(pady=15)
+        ttk.Button(win, text="Place Hold", command=place_hold).pack()
 
     def open_return_book_window(self):
         win = tk.Toplevel(self)
@@ -186,25 +283,24 @@ class LibraryApp(tk.Tk):
         tk.Label(win, text="Book Title:").pack(pady=5)
         book = tk.Entry(win, width=30)
         book.pack()
+        self._add_typeahead(member, book)
         tk.Label(win, text="Return Date:").pack(pady=5)
         return_date = tk.Entry(win, width=30)
         return_date.insert(0, datetime.now().strftime("%Y-%m-%d"))
         return_date.pack()
 
+        @instrumentation.timed("process_return")
         def process():
-            fine = 0
-            today = datetime.now().date()
-            for txn in self.transactions:
-                if txn["member"] == member.get() and txn["book"] == book.get() and txn["return_date"] is None:
-                    due = datetime.strptime(txn["due_date"], "%Y-%m-%d").date()
-                    if today > due:
-                        fine = (today - due).days * 1
-                    txn["return_date"] = return_date.get()
-                    txn["fine"] = fine
-                    messagebox.showinfo("Returned", f"Book returned.\nFine: ${fine}")
-                    break
-            else:
-                messagebox.showerror("Error", "No matching record found.")
+            try:
+                txn = self.loans.checkin(member.get(), book.get(), return_date.get())
+            except (LoanError, ServerError) as e:
+                messagebox.showerror("Error", str(e), parent=win)
+                return
+            fine = txn["fine"]
+            message = f"Book returned.\nFine: ${fine}"
+            if txn.get("hold"):
+                message += f"\nSet this copy aside: a hold for member #{txn['hold']['member_id']} is now ready."
+            messagebox.showinfo("Returned", message)
             win.destroy()
 
         ttk.Button(win, text="Process Return", command=process).pack(pady=15)
@@ -0,0 +1,265 @@
+import argparse
+from datetime import date, datetime, timedelta
+
+from library_db import connect, write_transaction
+from notifications import ensure_outbox, enqueue_hold_ready
+
+# ====================================================
+#   COPY AVAILABILITY AND HOLDS
+# ====================================================
+# booktb.available_copies counts the copies on the shelf.  Issuing takes one
+# with a conditional UPDATE (... WHERE available_copies > 0) and returning
+# puts one back, each in the same BEGIN IMMEDIATE transaction as the transtb
+# write (LoanStore.issue / return_loan), so two desks can never lend the last
+# copy twice.
+#
+# A member can place a hold on a book with no copy free.  holdtb's waiting
+# rows form one priority queue per book, ordered by
+#   (priority of the membership type, requested_at, hold_id)
+# and idx_holdtb_queue keeps them in exactly that order, so the next hold is
+# the first entry of a B-tree range: O(log n) per return however long the
+# queue.  (The queue lives in SQLite rather than a heapq so every desk and
+# the server see the same one.)  A returned copy goes to that hold instead
+# of the shelf: the hold becomes 'ready', a pick-up notice is queued in the
+# notification outbox, and the copy waits READY_DAYS for the member to
+# collect it.  expire_holds() passes uncollected copies on (run it nightly).
+#
+#   python holds.py --place 100042 17       # membership number, book_id
+#   python holds.py --queue 17
+#   python holds.py --expire
+#   python holds.py --recount               # available_copies from open loans
+
+HOLD_PRIORITY = {"staff": 0, "senior": 1, "student": 2, "standard": 3}
+DEFAULT_PRIORITY = 3
+READY_DAYS = 7
+
+STATUS_WAITING = "waiting"
+STATUS_READY = "ready"
+STATUS_FULFILLED = "fulfilled"
+STATUS_CANCELLED = "cancelled"
+STATUS_EXPIRED = "expired"
+
+
+class HoldError(Exception):
+    """A user-facing problem with a hold (copies on the shelf, duplicate, ...)."""
+
+
+def ensure_holds(conn):
+    """Create holdtb and its queue index; recount availability once if new."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'holdtb'").fetchone()
+    ensure_outbox(conn)
+    conn.executescript("""
+    CREATE TABLE IF NOT EXISTS holdtb(
+        hold_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        book_id INTEGER NOT NULL,
+        member_id INTEGER NOT NULL,
+        priority INTEGER NOT NULL,
+        requested_at TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'waiting',
+        ready_at TEXT,
+        expires_at TEXT,
+        closed_at TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_holdtb_queue
+        ON holdtb(book_id, priority, requested_at, hold_id) WHERE status = 'waiting';
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_holdtb_member_book
+        ON holdtb(member_id, book_id) WHERE status IN ('waiting', 'ready');
+    CREATE INDEX IF NOT EXISTS idx_holdtb_ready
+        ON holdtb(expires_at) WHERE status = 'ready';
+    """)
+    if not exists:
+        # available_copies was typed in by hand and never kept up to date
+        recount_available(conn)
+    conn.commit()
+
+
+def recount_available(conn):
+    """Set available_copies to total_copies less open loans and ready holds."""
+    with conn:
+        conn.execute("UPDATE booktb SET available_copies = total_copies")
+        conn.execute("""
+        UPDATE booktb SET available_copies = MAX(0, booktb.total_copies - taken.n)
+        FROM (SELECT book_id, COUNT(*) AS n FROM (
+                  SELECT book_id FROM transtb WHERE return_date IS NULL
+                  UNION ALL
+                  SELECT book_id FROM holdtb WHERE status = 'ready')
+              GROUP BY book_id) AS taken
+        WHERE booktb.book_id = taken.book_id
+        """)
+
+
+def hold_from_row(row):
+    keys = ("hold_id", "book_id", "member_id", "priority", "requested_at", "status",
+            "ready_at", "expires_at", "closed_at")
+    return dict(zip(keys, row))
+
+
+def get_hold(conn, hold_id):
+    row = conn.execute("SELECT * FROM holdtb WHERE hold_id = ?", (hold_id,)).fetchone()
+    return hold_from_row(row) if row else None
+
+
+def queue_position(conn, hold):
+    """1 for the next hold to be served, 2 for the one after, ..."""
+    (ahead,) = conn.execute("""
+    SELECT COUNT(*) FROM holdtb INDEXED BY idx_holdtb_queue
+    WHERE book_id = ? AND status = 'waiting' AND (priority, requested_at, hold_id) < (?, ?, ?)
+    """, (hold["book_id"], hold["priority"], hold["requested_at"], hold["hold_id"])).fetchone()
+    return ahead + 1
+
+
+def next_hold(conn, book_id):
+    row = conn.execute("""
+    SELECT * FROM holdtb INDEXED BY idx_holdtb_queue
+    WHERE book_id = ? AND status = 'waiting'
+    ORDER BY priority, requested_at, hold_id
+    LIMIT 1
+    """, (book_id,)).fetchone()
+    return hold_from_row(row) if row else None
+
+
+def hold_queue(conn, book_id):
+    """The waiting holds of a book in the order they will be served."""
+    return [hold_from_row(row) for row in conn.execute("""
+    SELECT * FROM holdtb INDEXED BY idx_holdtb_queue
+    WHERE book_id = ? AND status = 'waiting'
+    ORDER BY priority, requested_at, hold_id
+    """, (book_id,))]
+
+
+# ====================================================
+#   INSIDE THE ISSUE / RETURN TRANSACTION
+# ====================================================
+# take_copy() and release_copy() do not commit; LoanStore calls them inside
+# write_transaction() together with its transtb write.
+def take_copy(conn, member_id, book_id, today):
+    """Claim a copy for an issue: the member's ready hold, else one from the
+    shelf.  False when every copy is out or set aside for someone else."""
+    cur = conn.execute("""
+    UPDATE holdtb SET status = 'fulfilled', closed_at = ?
+    WHERE member_id = ? AND book_id = ? AND status = 'ready'
+    """, (today, member_id, book_id))
+    if cur.rowcount:
+        return True
+    cur = conn.execute("""
+    UPDATE booktb SET available_copies = available_copies - 1
+    WHERE book_id = ? AND available_copies > 0
+    """, (book_id,))
+    if not cur.rowcount:
+        return False
+    conn.execute("""
+    UPDATE holdtb SET status = 'fulfilled', closed_at = ?
+    WHERE member_id = ? AND book_id = ? AND status = 'waiting'
+    """, (today, member_id, book_id))
+    return True
+
+
+def release_copy(conn, book_id, today):
+    """Give a returned copy to the next waiting hold (returned, with its
+    pick-up notice queued) or put it back on the shelf (returns None)."""
+    hold = next_hold(conn, book_id)
+    if hold is None:
+        conn.execute("""
+        UPDATE booktb SET available_copies = MIN(total_copies, available_copies + 1) WHERE book_id = ?
+        """, (book_id,))
+        return None
+    expires = (date.fromisoformat(today[:10]) + timedelta(days=READY_DAYS)).isoformat()
+    conn.execute("""
+    UPDATE holdtb SET status = 'ready', ready_at = ?, expires_at = ? WHERE hold_id = ?
+    """, (today, expires, hold["hold_id"]))
+    enqueue_hold_ready(conn, hold["hold_id"])
+    return get_hold(conn, hold["hold_id"])
+
+
+# ====================================================
+#   PLACING, CANCELLING AND EXPIRING HOLDS
+# ====================================================
+def place_hold(conn, member_id, book_id, requested_at=None):
+    """Queue a hold for a book with no copy on the shelf; returns the hold
+    with its queue "position"."""
+    requested_at = requested_at or datetime.now().isoformat(timespec="seconds")
+    with write_transaction(conn):
+        book = conn.execute("SELECT title, available_copies FROM booktb WHERE book_id = ?",
+                            (book_id,)).fetchone()
+        member = conn.execute("SELECT membership_type FROM membertb WHERE member_id = ?",
+                              (member_id,)).fetchone()
+        if book is None or member is None:
+            raise HoldError("No such book or member.")
+        if book[1] > 0:
+            raise HoldError(f"'{book[0]}' has {book[1]} copy(ies) on the shelf; issue one instead.")
+        if conn.execute("""
+        SELECT 1 FROM holdtb WHERE member_id = ? AND book_id = ? AND status IN ('waiting', 'ready')
+        """, (member_id, book_id)).fetchone():
+            raise HoldError(f"The member already has a hold on '{book[0]}'.")
+        # membership_type is typed in freely ("Student", "staff ")
+        priority = HOLD_PRIORITY.get((member[0] or "").strip().casefold(), DEFAULT_PRIORITY)
+        cur = conn.execute("""
+        INSERT INTO holdtb(book_id, member_id, priority, requested_at) VALUES (?, ?, ?, ?)
+        """, (book_id, member_id, priority, requested_at))
+        hold = get_hold(conn, cur.lastrowid)
+        hold["position"] = queue_position(conn, hold)
+    return hold
+
+
+def cancel_hold(conn, hold_id, today=None):
+    """Cancel a waiting or ready hold; a copy set aside for it is passed on."""
+    today = today or date.today().isoformat()
+    with write_transaction(conn):
+        hold = get_hold(conn, hold_id)
+        if hold is None or hold["status"] not in (STATUS_WAITING, STATUS_READY):
+            raise HoldError("No open hold with that id.")
+        conn.execute("UPDATE holdtb SET status = 'cancelled', closed_at = ? WHERE hold_id = ?",
+                     (today, hold_id))
+        if hold["status"] == STATUS_READY:
+            release_copy(conn, hold["book_id"], today)
+
+
+def expire_holds(conn, today=None):
+    """Expire ready holds not collected in time and pass their copies on."""
+    today = today or date.today().isoformat()
+    with write_transaction(conn):
+        expired = conn.execute("""
+        SELECT hold_id, book_id FROM holdtb INDEXED BY idx_holdtb_ready
+        WHERE status = 'ready' AND expires_at < ?
+        """, (today,)).fetchall()
+        for hold_id, book_id in expired:
+            conn.execute("UPDATE holdtb SET status = 'expired', closed_at = ? WHERE hold_id = ?",
+                         (today, hold_id))
+            release_copy(conn, book_id, today)
+    return len(expired)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Book holds and copy availability.")
+    parser.add_argument("--db", default="library.db")
+    parser.add_argument("--place", nargs=2, metavar=("MEMBERSHIP_NUMBER", "BOOK_ID"), type=int)
+    parser.add_argument("--cancel", type=int, metavar="HOLD_ID")
+    parser.add_argument("--queue", type=int, metavar="BOOK_ID", help="show a book's waiting holds")
+    parser.add_argument("--expire", action="store_true", help="expire uncollected ready holds")
+    parser.add_argument("--recount", action="store_true", help="recount available_copies")
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    ensure_holds(conn)
+    try:
+        if args.place:
+            row = conn.execute("SELECT member_id FROM membertb WHERE membership_number = ?",
+                               (args.place[0],)).fetchone()
+            hold = place_hold(conn, row[0] if row else None, args.place[1])
+            print(f"hold {hold['hold_id']} placed, position {hold['position']} in the queue")
+        if args.cancel:
+            cancel_hold(conn, args.cancel)
+            print(f"hold {args.cancel} cancelled")
+    except HoldError as e:
+        parser.exit(1, f"{e}\n")
+    if args.expire:
+        print(f"{expire_holds(conn)} hold(s) expired")
+    if args.recount:
+        recount_available(conn)
+        print("available_copies recounted")
+    if args.queue is not None:
+        for position, hold in enumerate(hold_queue(conn, args.queue), 1):
+            print(f"{position:>3}. member {hold['member_id']} (priority {hold['priority']}) "
+                  f"since {hold['requested_at']}")
+    conn.close()
@@ -0,0 +1,317 @@
+import atexit
+import functools
+import json
+import math
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+# ====================================================
+#   OPT-IN PROFILING
+# ====================================================
+# Set LIBRARY_PROFILE=1 to time SQL statements, Google Books/Open Library
+# calls, Tk event-loop lag and button handlers.  Samples are aggregated into
+# log-scale histograms; view them in the Diagnostics window or set
+# LIBRARY_PROFILE_FILE to have them written as JSON when the process exits.
+#
+#   LIBRARY_PROFILE=1 LIBRARY_PROFILE_FILE=profile.json python "part 3.py"
+#   python instrumentation.py profile.json      # print a saved profile
+#   LIBRARY_STARTUP_REPORT=1 python "part 3.py"  # print the start-up phases
+#
+# When profiling is off, connect() returns a plain sqlite3 connection, timed()
+# returns the function undecorated and timer() a shared no-op, so the hot
+# paths pay nothing but a flag check.
+
+ENABLED = os.environ.get("LIBRARY_PROFILE", "").lower() in ("1", "true", "yes", "on")
+PROFILE_FILE = os.environ.get("LIBRARY_PROFILE_FILE")
+STARTUP_REPORT = os.environ.get("LIBRARY_STARTUP_REPORT", "").lower() in ("1", "true", "yes", "on")
+
+BUCKETS_PER_DOUBLING = 4   # ~19% wide buckets
+LAG_INTERVAL_MS = 100
+
+
+class Histogram:
+    """Count/total/min/max plus log-scale buckets of durations in seconds."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.buckets = {}
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        micros = max(seconds * 1e6, 1.0)
+        index = int(math.log2(micros) * BUCKETS_PER_DOUBLING)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def percentile(self, p):
+        """Upper bound (seconds) of the bucket holding the p-th percentile."""
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(self.max, 2 ** ((index + 1) / BUCKETS_PER_DOUBLING) / 1e6)
+        return self.max
+
+    def summary(self):
+        ms = lambda s: round(s * 1000, 3)
+        return {
+            "count": self.count,
+            "total_ms": ms(self.total),
+            "mean_ms": ms(self.total / self.count) if self.count else 0,
+            "min_ms": ms(self.min) if self.count else 0,
+            "p50_ms": ms(self.percentile(50)),
+            "p95_ms": ms(self.percentile(95)),
+            "p99_ms": ms(self.percentile(99)),
+            "max_ms": ms(self.max),
+            "buckets_us": {round(2 ** ((i + 1) / BUCKETS_PER_DOUBLING)): n for i, n in sorted(self.buckets.items())},
+        }
+
+
+class Registry:
+    def __init__(self):
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def record(self, category, name, seconds):
+        with self._lock:
+            histogram = self.histograms.get((category, name))
+            if histogram is None:
+                histogram = self.histograms[(category, name)] = Histogram()
+            histogram.add(seconds)
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+
+    def snapshot(self):
+        """[(category, name, summary)] with the most total time first."""
+        with self._lock:
+            rows = [(category, name, h.summary()) for (category, name), h in self.histograms.items()]
+        return sorted(rows, key=lambda row: row[2]["total_ms"], reverse=True)
+
+    def dump(self, path):
+        data = {"pid": os.getpid(), "argv": sys.argv, "written": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "metrics": [{"category": c, "name": n, **s} for c, n, s in self.snapshot()]}
+        with open(path, "w") as f:
+            json.dump(data, f, indent=2)
+
+
+REGISTRY = Registry()
+record = REGISTRY.record
+
+
+def format_report(rows, limit=40):
+    lines = [f"{'category':<8} {'name':<60} {'count':>7} {'mean':>9} {'p95':>9} {'max':>9}"]
+    for category, name, s in rows[:limit]:
+        lines.append(f"{category:<8} {name[:60]:<60} {s['count']:>7} {s['mean_ms']:>7.2f}ms "
+                     f"{s['p95_ms']:>7.2f}ms {s['max_ms']:>7.2f}ms")
+    return "\n".join(lines)
+
+
+# ====================================================
+#   TIMERS AND DECORATORS
+# ====================================================
+class _Timer:
+    __slots__ = ("category", "name", "started")
+
+    def __init__(self, category, name):
+        self.category = category
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.category, self.name, time.perf_counter() - self.started)
+        return False
+
+
+class _NoTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_TIMER = _NoTimer()
+
+
+def timer(category, name):
+    """Context manager timing one block, e.g. `with timer("http", "google"):`."""
+    return _Timer(category, name) if ENABLED else _NO_TIMER
+
+
+def timed(name=None, category="callback"):
+    """Decorator recording each call's duration; a no-op when profiling is off."""
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+        label = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record(category, label, time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+
+# ====================================================
+#   SQL
+# ====================================================
+_SPACE = re.compile(r"\s+")
+_PLACEHOLDER_LIST = re.compile(r"\?(\s*,\s*\?)+")
+
+
+def statement_name(sql):
+    """Collapse whitespace and IN (?,?,...) lists so one statement is one metric."""
+    return _PLACEHOLDER_LIST.sub("?,...", _SPACE.sub(" ", sql).strip())[:200]
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # "sql" samples time execution up to the first row; fetchone/fetchmany/
+    # fetchall are recorded separately under "fetch".  Rows read by iterating
+    # the cursor are not timed.
+    statement = None
+
+    def _timed(self, category, name, call, *args):
+        started = time.perf_counter()
+        try:
+            return call(*args)
+        finally:
+            record(category, name, time.perf_counter() - started)
+
+    def execute(self, sql, parameters=()):
+        self.statement = statement_name(sql)
+        return self._timed("sql", self.statement, super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self.statement = statement_name(sql)
+        return self._timed("sql", self.statement, super().executemany, sql, seq_of_parameters)
+
+    def executescript(self, script):
+        self.statement = "script: " + statement_name(script)[:60]
+        return self._timed("sql", self.statement, super().executescript, script)
+
+    def fetchone(self):
+        return self._timed("fetch", self.statement, super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed("fetch", self.statement, super().fetchmany, size or self.arraysize)
+
+    def fetchall(self):
+        return self._timed("fetch", self.statement, super().fetchall)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, script):
+        return self.cursor().executescript(script)
+
+
+def connect(path, **kwargs):
+    """sqlite3.connect, with every statement timed when profiling is on."""
+    if ENABLED:
+        kwargs.setdefault("factory", InstrumentedConnection)
+    return sqlite3.connect(path, **kwargs)
+
+
+# ====================================================
+#   TK EVENT-LOOP LAG
+# ====================================================
+class LagMonitor:
+    """Schedules after(interval) repeatedly and records how late each tick runs.
+
+    A busy handler on the Tk thread shows up as a long "tk after_lag" sample.
+    """
+
+    def __init__(self, root, interval_ms=LAG_INTERVAL_MS):
+        self.root = root
+        self.interval = interval_ms / 1000
+        self.interval_ms = interval_ms
+        self.after_id = None
+        self.expected = None
+
+    def start(self):
+        if ENABLED and self.after_id is None:
+            self.expected = time.perf_counter() + self.interval
+            self.after_id = self.root.after(self.interval_ms, self._tick)
+        return self
+
+    def _tick(self):
+        now = time.perf_counter()
+        record("tk", "after_lag", max(0.0, now - self.expected))
+        self.expected = now + self.interval
+        self.after_id = self.root.after(self.interval_ms, self._tick)
+
+    def stop(self):
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+            self.after_id = None
+
+
+# ====================================================
+#   START-UP TIME
+# ====================================================
+class StartupTimer:
+    """Splits an app's start-up into phases ("imports", "window", "first_paint", ...).
+
+    Each mark() records the time since the previous one under "startup"; the
+    phases are printed to stderr at the end when LIBRARY_STARTUP_REPORT=1.
+    """
+
+    def __init__(self, started=None):
+        self.started = self.last = started if started is not None else time.perf_counter()
+        self.phases = []
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        record("startup", phase, now - self.last)
+        self.last = now
+
+    def report(self):
+        lines = [f"{phase:<14}{seconds * 1000:>9.1f}ms" for phase, seconds in self.phases]
+        lines.append(f"{'total':<14}{(self.last - self.started) * 1000:>9.1f}ms")
+        if STARTUP_REPORT:
+            print("\n".join(["start-up:"] + lines), file=sys.stderr)
+        return "\n".join(lines)
+
+
+if ENABLED and PROFILE_FILE:
+    atexit.register(lambda: REGISTRY.dump(PROFILE_FILE))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("usage: python instrumentation.py PROFILE.json")
+    with open(sys.argv[1]) as f:
+        metrics = json.load(f)["metrics"]
+    print(format_report([(m["category"], m["name"], m) for m in metrics], limit=len(metrics)))
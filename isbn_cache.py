@@ -0,0 +1,200 @@
+import json
+import sqlite3
+import threading
+import time
+
+# ====================================================
+#   ISBN METADATA CACHE
+# ====================================================
+# Raw Google Books / Open Library payloads are kept in a small SQLite file,
+# keyed by the ISBN-13 form of the ISBN, so repeat lookups at the intake desk
+# never go back to the network.  A payload of NULL records a "not found"
+# answer (negative cache) and expires sooner than a real hit.
+#
+# A hit only touches memory: its access time and the hit counters are
+# buffered and written in one transaction every EVICT_EVERY writes or
+# buffered accesses (just before eviction, which orders by access time) and
+# on close(), so the cheap path never waits for a commit.
+
+DEFAULT_PATH = "isbn_cache.db"
+DEFAULT_TTL = 30 * 24 * 3600          # 30 days for found books
+DEFAULT_NEGATIVE_TTL = 24 * 3600      # 1 day for "not found"
+DEFAULT_MAX_ENTRIES = 50000
+EVICT_EVERY = 100                     # check the size bound (and flush) every N writes
+
+
+def normalize_isbn(raw):
+    """Return the ISBN-13 form of an ISBN-10/13 string, or None if invalid."""
+    if raw is None:
+        return None
+    isbn = "".join(ch for ch in str(raw) if ch not in " -").upper()
+
+    if len(isbn) == 10:
+        if not isbn[:9].isdigit() or not (isbn[9].isdigit() or isbn[9] == "X"):
+            return None
+        total = sum((10 - i) * int(d) for i, d in enumerate(isbn[:9]))
+        total += 10 if isbn[9] == "X" else int(isbn[9])
+        if total % 11 != 0:
+            return None
+        isbn = "978" + isbn[:9]
+        return isbn + _isbn13_check_digit(isbn)
+
+    if len(isbn) == 13 and isbn.isdigit():
+        if _isbn13_check_digit(isbn[:12]) != isbn[12]:
+            return None
+        return isbn
+
+    return None
+
+
+def _isbn13_check_digit(first12):
+    total = sum(int(d) * (1 if i % 2 == 0 else 3) for i, d in enumerate(first12))
+    return str((10 - total % 10) % 10)
+
+
+class IsbnCache:
+    def __init__(self, path=DEFAULT_PATH, ttl=DEFAULT_TTL,
+                 negative_ttl=DEFAULT_NEGATIVE_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._accessed = {}               # (isbn, provider) -> access time not yet written
+        self._counts = {"hits": 0, "negative_hits": 0, "misses": 0}   # not yet written
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS isbncache(
+            isbn TEXT NOT NULL,
+            provider TEXT NOT NULL,
+            payload TEXT,
+            fetched_at REAL NOT NULL,
+            accessed_at REAL NOT NULL,
+            PRIMARY KEY (isbn, provider)
+        )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_isbncache_accessed ON isbncache(accessed_at)")
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS isbncachestats(
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            hits INTEGER NOT NULL DEFAULT 0,
+            negative_hits INTEGER NOT NULL DEFAULT 0,
+            misses INTEGER NOT NULL DEFAULT 0
+        )
+        """)
+        self.conn.execute("INSERT OR IGNORE INTO isbncachestats(id) VALUES (1)")
+        self.conn.commit()
+
+    def get(self, isbn, provider):
+        """Return (found, payload).  payload is None for a cached "not found"."""
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT payload, fetched_at FROM isbncache WHERE isbn = ? AND provider = ?",
+                (isbn, provider)).fetchone()
+            if row is not None:
+                payload, fetched_at = row
+                ttl = self.ttl if payload is not None else self.negative_ttl
+                if now - fetched_at > ttl:
+                    row = None
+
+            if row is None:
+                self.misses += 1
+                self._counts["misses"] += 1
+                return False, None
+
+            if payload is None:
+                self.negative_hits += 1
+                self._counts["negative_hits"] += 1
+            else:
+                self.hits += 1
+                self._counts["hits"] += 1
+            self._accessed[(isbn, provider)] = now
+            if len(self._accessed) >= EVICT_EVERY:
+                self._flush()
+                self.conn.commit()
+        return True, (json.loads(payload) if payload is not None else None)
+
+    def put(self, isbn, provider, payload):
+        """Store a provider payload; pass None to record a "not found" answer."""
+        now = time.time()
+        text = json.dumps(payload) if payload is not None else None
+        with self._lock:
+            self.conn.execute("""
+            INSERT OR REPLACE INTO isbncache(isbn, provider, payload, fetched_at, accessed_at)
+            VALUES (?, ?, ?, ?, ?)
+            """, (isbn, provider, text, now, now))
+            self._writes += 1
+            if self._writes % EVICT_EVERY == 0:
+                self._evict()
+            self.conn.commit()
+
+    def _flush(self):
+        # Write the buffered access times and counters (the caller commits)
+        if self._accessed:
+            self.conn.executemany("UPDATE isbncache SET accessed_at = ? WHERE isbn = ? AND provider = ?",
+                                  [(at, isbn, provider) for (isbn, provider), at in self._accessed.items()])
+            self._accessed.clear()
+        if any(self._counts.values()):
+            self.conn.execute("""
+            UPDATE isbncachestats
+            SET hits = hits + :hits, negative_hits = negative_hits + :negative_hits, misses = misses + :misses
+            WHERE id = 1
+            """, self._counts)
+            self._counts = dict.fromkeys(self._counts, 0)
+
+    def _evict(self):
+        # Expired rows go first, then the least recently used beyond the bound.
+        self._flush()
+        now = time.time()
+        self.conn.execute("""
+        DELETE FROM isbncache
+        WHERE (payload IS NOT NULL AND fetched_at < ?) OR (payload IS NULL AND fetched_at < ?)
+        """, (now - self.ttl, now - self.negative_ttl))
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM isbncache").fetchone()
+        if count > self.max_entries:
+            self.conn.execute("""
+            DELETE FROM isbncache WHERE rowid IN (
+                SELECT rowid FROM isbncache ORDER BY accessed_at LIMIT ?
+            )
+            """, (count - self.max_entries,))
+
+    def evict(self):
+        with self._lock:
+            self._evict()
+            self.conn.commit()
+
+    def stats(self):
+        with self._lock:
+            self._flush()
+            self.conn.commit()
+            (entries,) = self.conn.execute("SELECT COUNT(*) FROM isbncache").fetchone()
+            total = self.conn.execute(
+                "SELECT hits, negative_hits, misses FROM isbncachestats WHERE id = 1").fetchone()
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+            "total_hits": total[0],
+            "total_negative_hits": total[1],
+            "total_misses": total[2],
+        }
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self.conn.commit()
+            self.conn.close()
+
+
+if __name__ == "__main__":
+    cache = IsbnCache()
+    for key, value in cache.stats().items():
+        print(f"{key}: {value}")
+    cache.close()
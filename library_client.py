@@ -0,0 +1,158 @@
+import http.client
+import json
+import os
+import threading
+from urllib.parse import urlencode, urlsplit
+
+from loan_store import LoanStore, LoanError
+
+# ====================================================
+#   CIRCULATION CLIENT
+# ====================================================
+# LibraryClient talks to library_server.py and offers the parts of LoanStore
+# the GUIs use (checkout, checkin, place_hold, get, the TransactionTable
+# source methods count, page_after, page_before, anchors, and the reads of the
+# shared windows), so a Tk app can switch between its own LoanStore and the
+# shared server without other changes.  A desk on the server opens no
+# database of its own:
+#
+#   LIBRARY_SERVER=http://127.0.0.1:8750 python "part 3.py"
+#
+# Each thread keeps one HTTP/1.1 keep-alive connection to the server.
+
+TIMEOUT = 10
+
+
+class ServerError(Exception):
+    """The server could not be reached or failed unexpectedly."""
+
+
+def _rating(rating):
+    # JSON object keys are strings; ratings.py keys the star counts by int
+    if rating is not None:
+        rating["stars"] = {int(n): count for n, count in rating["stars"].items()}
+    return rating
+
+
+class LibraryClient:
+    def __init__(self, base_url, timeout=TIMEOUT):
+        url = urlsplit(base_url)
+        self.host = url.hostname or "127.0.0.1"
+        self.port = url.port or 80
+        self.timeout = timeout
+        self.local = threading.local()
+        self.total = 0
+
+    def _connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def request(self, method, path, body=None, **params):
+        if params:
+            path += "?" + urlencode({k: v for k, v in params.items() if v is not None})
+        data = json.dumps(body) if body is not None else None
+        headers = {"Content-Type": "application/json"} if data else {}
+        for attempt in (1, 2):
+            conn = self._connection()
+            try:
+                conn.request(method, path, data, headers)
+                res = conn.getresponse()
+                payload = json.loads(res.read() or b"null")
+                break
+            except (ConnectionError, http.client.HTTPException, OSError) as e:
+                # stale keep-alive connection: reconnect once
+                conn.close()
+                self.local.conn = None
+                if attempt == 2:
+                    raise ServerError(f"Library server unavailable: {e}") from e
+        if res.status == 409:
+            raise LoanError(payload["error"])
+        if res.status != 200:
+            raise ServerError(payload.get("error") if isinstance(payload, dict) else res.reason)
+        return payload
+
+    # --- LoanStore interface ----------------------------------------
+    def checkout(self, member_text, book_text, issue_date, due_date):
+        txn = self.request("POST", "/checkout", {"member": member_text, "book": book_text,
+                                                 "issue_date": issue_date, "due_date": due_date})
+        self.total += 1
+        return txn
+
+    def checkin(self, member_text, book_text, return_date):
+        return self.request("POST", "/checkin", {"member": member_text, "book": book_text,
+                                                 "return_date": return_date})
+
+    def place_hold(self, member_text, book_text):
+        return self.request("POST", "/holds", {"member": member_text, "book": book_text})
+
+    def get(self, txn_id):
+        return self.request("GET", f"/loans/{txn_id}")
+
+    def count(self):
+        self.total = self.request("GET", "/loans", limit=0)["count"]
+        return self.total
+
+    def page_after(self, after_id, limit):
+        result = self.request("GET", "/loans", after=after_id, limit=limit)
+        self.total = result["count"]
+        return result["loans"]
+
+    def page_before(self, before_id, limit):
+        result = self.request("GET", "/loans", before=before_id, limit=limit)
+        self.total = result["count"]
+        return result["loans"]
+
+    def anchors(self, step, start_id=None):
+        return self.request("GET", "/loans/anchors", step=step, **{"from": start_id})
+
+    # --- Other reads ------------------------------------------------
+    def search(self, text, limit=25, after=None):
+        return self.request("GET", "/books", q=text, limit=limit,
+                            after=f"{after[0]!r},{after[1]}" if after else None)
+
+    def related(self, book_id, k=10):
+        return self.request("GET", f"/books/{book_id}/related", k=k)
+
+    def rating(self, book_id):
+        return _rating(self.request("GET", f"/books/{book_id}/rating"))
+
+    def top_rated(self, k=10):
+        return [_rating(book) for book in self.request("GET", "/top-rated", k=k)]
+
+    def members(self, text):
+        return self.request("GET", "/members", q=text)
+
+    def history(self, member_id, cursor=None):
+        result = self.request("GET", f"/members/{member_id}/history",
+                              cursor=json.dumps(cursor) if cursor else None)
+        return result["loans"], tuple(result["cursor"]) if result["cursor"] else None
+
+    def history_summary(self, member_id):
+        return self.request("GET", f"/members/{member_id}/summary")
+
+    def stats(self):
+        return self.request("GET", "/stats")
+
+    def popular(self, window=30, k=10, category=None):
+        return [tuple(item) for item in self.request("GET", "/popular", window=window, k=k, category=category)]
+
+    # --- Other writes -----------------------------------------------
+    def message(self, recipient, subject, body):
+        return self.request("POST", "/messages", {"recipient": recipient, "subject": subject, "body": body})
+
+    def close(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn.close()
+
+
+def loan_backend():
+    """LibraryClient when LIBRARY_SERVER is set, else a LoanStore on library.db."""
+    url = os.environ.get("LIBRARY_SERVER")
+    if url:
+        return LibraryClient(url)
+    # Imported here: a desk on the server never opens the database
+    from library_db import open_database
+    return LoanStore(open_database())
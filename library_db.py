@@ -0,0 +1,292 @@
+import argparse
+import os
+from contextlib import contextmanager
+
+import instrumentation
+
+# ====================================================
+#   SHARED DATABASE LAYER
+# ====================================================
+# Every entry point (the GUIs, Library_Management.py and the command line
+# tools) opens library.db through connect() or open_database(), so they all
+# get the same schema and the same connection settings:
+#
+#   journal_mode=WAL      readers never block the writer and vice versa, so
+#                         several desks can share one file on the same machine
+#   synchronous=NORMAL    safe with WAL; commits no longer fsync every time
+#   busy_timeout          a second writer waits instead of "database is locked"
+#   cache_size/mmap_size  keep the hot pages of booktb/transtb in memory
+#
+# Older files are upgraded in place: the legacy Books/Members/Transactions/
+# Book_Reviews tables are renamed and shelf_location becomes shelf_loc, or,
+# when the canonical table already exists next to them, their rows are merged
+# into it.  Rows from another file (e.g. bks.db) can be copied in with
+# import_database().  Legacy rows with NULL in a canonical NOT NULL column get
+# the column's empty value ('' or 0) rather than being dropped; rows whose id
+# or unique key already exists are skipped and counted as such.
+#
+#   python library_db.py                      # upgrade library.db, show settings
+#   python library_db.py --import bks.db      # copy bks.db's rows into library.db
+
+DEFAULT_PATH = "library.db"
+SCHEMA_VERSION = 1
+
+BUSY_TIMEOUT_MS = 10000
+CACHE_SIZE_KB = 65536            # 64 MB page cache per connection
+MMAP_SIZE = 256 * 1024 * 1024
+CACHED_STATEMENTS = 256
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS membertb(
+    member_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    membership_number INTEGER UNIQUE,
+    first_name TEXT NOT NULL,
+    last_name TEXT NOT NULL,
+    email TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    address TEXT NOT NULL,
+    join_date DATE,
+    membership_type TEXT NOT NULL,
+    status TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS booktb (
+    book_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    isbn TEXT UNIQUE,
+    title TEXT NOT NULL,
+    author TEXT NOT NULL,
+    publisher TEXT NOT NULL,
+    publication_year INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    description TEXT NOT NULL,
+    cover_image_url TEXT NOT NULL,
+    page_count INTEGER NOT NULL,
+    language TEXT NOT NULL,
+    total_copies INTEGER NOT NULL,
+    available_copies INTEGER NOT NULL,
+    shelf_loc TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS transtb(
+    transaction_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    member_id INTEGER,
+    book_id INTEGER,
+    issue_date DATE,
+    due_date DATE,
+    return_date DATE,
+    fine_amount REAL,
+    status TEXT,
+    FOREIGN KEY(member_id) REFERENCES membertb(member_id),
+    FOREIGN KEY(book_id) REFERENCES booktb(book_id)
+);
+
+CREATE TABLE IF NOT EXISTS bookreviewtb(
+    review_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    book_id INTEGER,
+    member_id INTEGER,
+    rating INTEGER NOT NULL,
+    review_text TEXT NOT NULL,
+    review_date DATE,
+    FOREIGN KEY(book_id) REFERENCES booktb(book_id),
+    FOREIGN KEY(member_id) REFERENCES membertb(member_id)
+);
+"""
+
+# canonical table -> legacy table name, and legacy -> canonical column names
+LEGACY_TABLES = {
+    "membertb": "Members",
+    "booktb": "Books",
+    "transtb": "Transactions",
+    "bookreviewtb": "Book_Reviews",
+}
+LEGACY_COLUMNS = {"shelf_location": "shelf_loc"}
+
+
+def connect(path=DEFAULT_PATH, **kwargs):
+    """Open a connection with the shared settings (no schema changes)."""
+    kwargs.setdefault("timeout", BUSY_TIMEOUT_MS / 1000)
+    kwargs.setdefault("cached_statements", CACHED_STATEMENTS)
+    conn = instrumentation.connect(path, **kwargs)
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    if path != ":memory:":
+        conn.execute("PRAGMA journal_mode = WAL")
+    conn.executescript(f"""
+    PRAGMA synchronous = NORMAL;
+    PRAGMA cache_size = -{CACHE_SIZE_KB};
+    PRAGMA mmap_size = {MMAP_SIZE};
+    PRAGMA temp_store = MEMORY;
+    """)
+    return conn
+
+
+@contextmanager
+def write_transaction(conn):
+    """BEGIN IMMEDIATE ... COMMIT, or ROLLBACK if the block raises.
+
+    The write lock is taken before the first read, so a check-then-update
+    (e.g. "is a copy free?") cannot interleave with another desk's.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+def open_database(path=DEFAULT_PATH, **kwargs):
+    """connect() plus the canonical schema and everything the apps rely on
+    (search and fuzzy-match indexes, loan and history indexes, fine rules,
+    statistics, outbox, holds, popularity buckets, related books, ratings,
+    typeahead change log).  Each step is a no-op once the objects exist.
+    """
+    # Imported here: these modules are also used on their own with a plain connection
+    from book_search import ensure_search_index
+    from loan_store import ensure_loan_indexes
+    from fines import ensure_fine_rules
+    from library_stats import ensure_stats
+    from notifications import ensure_outbox
+    from popular_books import ensure_circulation_buckets
+    from recommendations import ensure_recommendations
+    from ratings import ensure_ratings
+    from borrow_history import ensure_history_index
+    from fuzzy_match import ensure_fuzzy_index
+    from holds import ensure_holds
+    from typeahead import ensure_catalog_changes
+
+    conn = connect(path, **kwargs)
+    ensure_schema(conn)
+    ensure_search_index(conn)
+    ensure_loan_indexes(conn)
+    ensure_fuzzy_index(conn)
+    ensure_catalog_changes(conn)
+    ensure_history_index(conn)
+    ensure_fine_rules(conn)
+    ensure_stats(conn)
+    ensure_outbox(conn)
+    ensure_holds(conn)
+    ensure_circulation_buckets(conn)
+    ensure_recommendations(conn)
+    ensure_ratings(conn)
+    return conn
+
+
+def _tables(conn, schema="main"):
+    return {name.lower(): name for (name,) in conn.execute(
+        f"SELECT name FROM {schema}.sqlite_master WHERE type = 'table'")}
+
+
+def _columns(conn, table, schema="main"):
+    return [row[1] for row in conn.execute(f'PRAGMA {schema}.table_info("{table}")')]
+
+
+def _empty_value(column_type):
+    column_type = column_type.upper()
+    return "0" if "INT" in column_type or "REAL" in column_type else "''"
+
+
+def _copy_rows(conn, table, source, schema):
+    """INSERT OR IGNORE the rows of schema.source into main.table, renaming
+    legacy columns and filling NOT NULL columns the source leaves NULL.
+    Returns (copied, skipped).
+    """
+    source_columns = {LEGACY_COLUMNS.get(col, col): col for col in _columns(conn, source, schema)}
+    names, values = [], []
+    for _, name, column_type, notnull, default, pk in conn.execute(f"PRAGMA main.table_info({table})"):
+        required = notnull and default is None and not pk
+        if name in source_columns:
+            value = f'"{source_columns[name]}"'
+            names.append(name)
+            values.append(f"COALESCE({value}, {_empty_value(column_type)})" if required else value)
+        elif required:
+            names.append(name)
+            values.append(_empty_value(column_type))
+    (total,) = conn.execute(f'SELECT COUNT(*) FROM {schema}."{source}"').fetchone()
+    cur = conn.execute(f"""
+    INSERT OR IGNORE INTO main.{table} ({", ".join(names)})
+    SELECT {", ".join(values)} FROM {schema}."{source}"
+    """)
+    return cur.rowcount, total - cur.rowcount
+
+
+def ensure_schema(conn):
+    """Upgrade legacy table/column names, then create any missing table.
+
+    Returns {table: (copied, skipped)} for legacy tables merged into an
+    existing canonical table (they are left in place).
+    """
+    (version,) = conn.execute("PRAGMA user_version").fetchone()
+    if version >= SCHEMA_VERSION:
+        return {}
+    tables = _tables(conn)
+    merged = {}
+    with conn:
+        for table, legacy in LEGACY_TABLES.items():
+            if table not in tables and legacy.lower() in tables:
+                conn.execute(f'ALTER TABLE "{tables.pop(legacy.lower())}" RENAME TO {table}')
+                tables[table] = table
+            if table in tables:
+                for old, new in LEGACY_COLUMNS.items():
+                    columns = _columns(conn, table)
+                    if old in columns and new not in columns:
+                        conn.execute(f"ALTER TABLE {table} RENAME COLUMN {old} TO {new}")
+    conn.executescript(SCHEMA)
+    with conn:
+        # Both schemas in one file: merge the legacy rows (parents first)
+        for table, legacy in LEGACY_TABLES.items():
+            if legacy.lower() in tables:
+                merged[table] = _copy_rows(conn, table, tables[legacy.lower()], "main")
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return merged
+
+
+def import_database(conn, source_path):
+    """Copy the rows of another library file (either schema) into conn.
+
+    Ids are kept so transactions and reviews still point at the right
+    member and book; rows whose id or unique key already exists are skipped.
+    Returns {table: (copied, skipped)}.
+    """
+    if not os.path.exists(source_path):
+        raise FileNotFoundError(source_path)
+    ensure_schema(conn)
+    conn.execute("ATTACH DATABASE ? AS source", (source_path,))
+    copied = {}
+    try:
+        source_tables = _tables(conn, "source")
+        with conn:
+            for table, legacy in LEGACY_TABLES.items():
+                source = source_tables.get(table) or source_tables.get(legacy.lower())
+                if source is None:
+                    continue
+                copied[table] = _copy_rows(conn, table, source, "source")
+    finally:
+        conn.execute("DETACH DATABASE source")
+    return copied
+
+
+def settings(conn):
+    names = ("journal_mode", "synchronous", "busy_timeout", "cache_size", "mmap_size", "user_version")
+    return {name: conn.execute(f"PRAGMA {name}").fetchone()[0] for name in names}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create or upgrade the library database.")
+    parser.add_argument("--db", default=DEFAULT_PATH)
+    parser.add_argument("--import", dest="source", metavar="FILE", help="copy the rows of another library file")
+    args = parser.parse_args()
+
+    # Upgrade first on a plain connection, to report any legacy rows merged
+    conn = connect(args.db)
+    for table, (n, skipped) in ensure_schema(conn).items():
+        print(f"{table}: {n} legacy row(s) merged, {skipped} skipped (id or unique key already present)")
+    conn.close()
+
+    conn = open_database(args.db)
+    if args.source:
+        for table, (n, skipped) in import_database(conn, args.source).items():
+            print(f"{table}: {n} row(s) imported, {skipped} skipped (id or unique key already present)")
+    for name, value in settings(conn).items():
+        print(f"{name}: {value}")
+    conn.close()
@@ -0,0 +1,401 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from urllib.parse import urlsplit, parse_qs
+
+from library_db import connect, open_database
+from loan_store import LoanStore, LoanError, get_loan, loan_count, loan_page_after, loan_page_before, loan_anchors, find_members
+from book_search import search_books
+from borrow_history import member_history, history_summary
+from library_stats import read_stats
+from fines import overdue_loans
+from notifications import enqueue
+from popular_books import PopularityRanker
+from ratings import book_rating, top_rated
+from recommendations import refresh_related, related_books
+
+# ====================================================
+#   CIRCULATION SERVER (asyncio, HTTP/JSON)
+# ====================================================
+# One process owns library.db for all circulation desks on the machine.  Every
+# write (issue, return) runs on a single writer thread with the one LoanStore
+# and PopularityRanker, so the open-loan index can never go stale between
+# desks.  Reads run concurrently on a small pool of read-only connections,
+# which WAL lets proceed while the writer commits.  The related-book lists a
+# checkout marks dirty are recomputed every RELATED_REFRESH_SECONDS in small
+# batches, so an issue never waits for them.
+#
+#   python library_server.py                        # serve library.db on :8750
+#   LIBRARY_SERVER=http://127.0.0.1:8750 python "part 3.py"
+#   python library_server.py --db bench.db --load-test --desks 40 --duration 15
+#
+# Routes (JSON in and out; errors are {"error": "..."}):
+#   GET  /books?q=&limit=&after=      catalog search; after=<score>,<book_id> of the last book
+#   GET  /books/<id>/related?k=       related books (recommendations.py)
+#   GET  /books/<id>/rating           average and count (ratings.py)
+#   GET  /top-rated?k=
+#   GET  /members?q=                  members by number or name prefix
+#   GET  /members/<id>/history?cursor= {"loans": [...], "cursor": [...] or null} (borrow_history.py)
+#   GET  /members/<id>/summary        {loans, open, fines}
+#   GET  /loans?after=|before=&limit= {"count": n, "loans": [...]}; keyset on transaction id
+#   GET  /loans/anchors?step=&from=   ids of every step-th loan (TransactionTable jumps)
+#   GET  /loans/<id>
+#   POST /checkout  {member, book, issue_date, due_date}
+#   POST /checkin   {member, book, return_date}    the loan; "hold" if the copy went to one
+#   POST /holds     {member, book}                 the hold with its queue "position"
+#   POST /messages  {recipient, subject, body}     queues an email in the outbox
+#   GET  /stats   /overdue   /popular?window=&k=
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8750
+DEFAULT_READERS = 4
+RELATED_REFRESH_SECONDS = 30
+RELATED_BATCH = 200
+MAX_BODY = 1 << 20
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 409: "Conflict",
+               413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class LibraryService:
+    def __init__(self, path, readers=DEFAULT_READERS):
+        self.path = path
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="writer")
+        self.readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="reader")
+        self.local = threading.local()
+        self.reader_conns = []
+        self._lock = threading.Lock()
+        self.writer.submit(self._open_writer).result()
+
+    def _open_writer(self):
+        self.conn = open_database(self.path)
+        self.loans = LoanStore(self.conn)
+        self.popular = PopularityRanker(self.conn)
+
+    def _reader(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            # Used only by this reader thread, but closed by close() on the loop's
+            conn = self.local.conn = connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA query_only = ON")
+            with self._lock:
+                self.reader_conns.append(conn)
+        return conn
+
+    async def read(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.readers, lambda: fn(self._reader(), *args))
+
+    async def write(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.writer, fn, *args)
+
+    # --- Writer-thread operations -----------------------------------
+    def _checkout(self, body):
+        txn = self.loans.checkout(body["member"], body["book"], body["issue_date"], body["due_date"])
+        self.popular.record_issue(txn["book_id"], txn["issue_date"])
+        return txn
+
+    def _checkin(self, body):
+        return self.loans.checkin(body["member"], body["book"], body["return_date"])
+
+    def _place_hold(self, body):
+        return self.loans.place_hold(body["member"], body["book"])
+
+    def _message(self, body):
+        return enqueue(self.conn, "email", body["recipient"], "message", body["subject"], body["body"])
+
+    async def refresh_related_forever(self):
+        while True:
+            await asyncio.sleep(RELATED_REFRESH_SECONDS)
+            # One batch per writer job, so checkouts queue behind at most one
+            while await self.write(refresh_related, self.conn, RELATED_BATCH) == RELATED_BATCH:
+                pass
+
+    # --- Routing ----------------------------------------------------
+    async def handle(self, method, path, query, body):
+        arg = lambda name, default=None: query.get(name, [default])[0]
+        if method == "GET":
+            if path == "/books":
+                after = arg("after")
+                if after:
+                    score, book_id = after.split(",")
+                    after = (float(score), int(book_id))
+                return await self.read(search_books, arg("q", ""), int(arg("limit", 25)), after)
+            if path.startswith("/books/") and path.endswith("/related"):
+                return await self.read(related_books, int(path.split("/")[2]), int(arg("k", 10)))
+            if path.startswith("/books/") and path.endswith("/rating"):
+                return await self.read(book_rating, int(path.split("/")[2]))
+            if path == "/top-rated":
+                return await self.read(top_rated, int(arg("k", 10)))
+            if path == "/members":
+                return await self.read(find_members, arg("q", ""))
+            if path.startswith("/members/") and path.endswith("/history"):
+                cursor = arg("cursor")
+                loans, cursor = await self.read(member_history, int(path.split("/")[2]),
+                                                tuple(json.loads(cursor)) if cursor else None)
+                return {"loans": loans, "cursor": cursor}
+            if path.startswith("/members/") and path.endswith("/summary"):
+                return await self.read(history_summary, int(path.split("/")[2]))
+            if path == "/loans":
+                limit = int(arg("limit", 50))
+                if arg("before"):
+                    loans = await self.read(loan_page_before, int(arg("before")), limit)
+                else:
+                    after = arg("after")
+                    loans = await self.read(loan_page_after, int(after) if after else None, limit)
+                return {"count": await self.read(loan_count), "loans": loans}
+            if path == "/loans/anchors":
+                start = arg("from")
+                return await self.read(loan_anchors, int(arg("step", 100)), int(start) if start else None)
+            if path.startswith("/loans/"):
+                loan = await self.read(get_loan, int(path.rsplit("/", 1)[1]))
+                if loan is None:
+                    raise HttpError(404, "No such loan.")
+                return loan
+            if path == "/stats":
+                return await self.read(read_stats)
+            if path == "/overdue":
+                return await self.read(overdue_loans, arg("today"))
+            if path == "/popular":
+                return await self.write(self.popular.top_titles, int(arg("window", 30)), int(arg("k", 10)),
+                                        arg("category"))
+        elif method == "POST":
+            if path == "/checkout":
+                return await self.write(self._checkout, body)
+            if path == "/checkin":
+                return await self.write(self._checkin, body)
+            if path == "/holds":
+                return await self.write(self._place_hold, body)
+            if path == "/messages":
+                return await self.write(self._message, body)
+        raise HttpError(404, f"No route for {method} {path}")
+
+    def close(self):
+        self.readers.shutdown(wait=True)
+        self.writer.submit(refresh_related, self.conn).result()
+        self.writer.submit(self.conn.close).result()
+        self.writer.shutdown(wait=True)
+        for conn in self.reader_conns:
+            conn.close()
+
+
+# ====================================================
+#   HTTP/1.1 (keep-alive) ON asyncio STREAMS
+# ====================================================
+async def read_request(reader):
+    """(method, target, headers, body) or None when the client hung up."""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _ = lines[0].split(" ", 2)
+    except ValueError:
+        raise HttpError(400, "Malformed request line.") from None
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HttpError(400, "Malformed Content-Length.") from None
+    if length < 0:
+        raise HttpError(400, "Malformed Content-Length.")
+    if length > MAX_BODY:
+        raise HttpError(413, "Request body too large.")
+    body = await reader.readexactly(length) if length else b""
+    return method, target, headers, body
+
+
+def encode_response(status, payload, keep_alive=True):
+    body = json.dumps(payload).encode()
+    head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode() + body
+
+
+def make_handler(service, log=print):
+    async def handle_client(reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HttpError as e:
+                    writer.write(encode_response(e.status, {"error": str(e)}, keep_alive=False))
+                    break
+                if request is None:
+                    break
+                method, target, headers, raw = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                url = urlsplit(target)
+                try:
+                    body = json.loads(raw) if raw else {}
+                    status, payload = 200, await service.handle(method, url.path, parse_qs(url.query), body)
+                except HttpError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except LoanError as e:
+                    status, payload = 409, {"error": str(e)}
+                except (KeyError, ValueError, TypeError) as e:
+                    status, payload = 400, {"error": f"Bad request: {e}"}
+                except Exception as e:
+                    log(f"{method} {target} failed: {e!r}")
+                    status, payload = 500, {"error": "Internal server error."}
+                writer.write(encode_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+    return handle_client
+
+
+async def serve(path, host=DEFAULT_HOST, port=DEFAULT_PORT, readers=DEFAULT_READERS, log=print):
+    service = LibraryService(path, readers)
+    server = await asyncio.start_server(make_handler(service, log), host, port, backlog=256)
+    log(f"Serving {path} on http://{host}:{port}")
+    related = asyncio.create_task(service.refresh_related_forever())
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        related.cancel()
+        service.close()
+
+
+# ====================================================
+#   LOAD TEST
+# ====================================================
+async def _desk(host, port, plan, deadline, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            for name, method, target, body in plan():
+                data = json.dumps(body).encode() if body is not None else b""
+                request = (f"{method} {target} HTTP/1.1\r\nHost: {host}\r\n"
+                           f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n").encode()
+                started = time.perf_counter()
+                writer.write(request + data)
+                await writer.drain()
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = int(head.split(b"Content-Length:")[1].split(b"\r\n")[0])
+                await reader.readexactly(length)
+                latencies[name].append(time.perf_counter() - started)
+                if not head.startswith(b"HTTP/1.1 200"):
+                    errors[name] += 1
+    finally:
+        writer.close()
+
+
+def _workload(conn, rng, today, due):
+    numbers = [row[0] for row in conn.execute(
+        "SELECT membership_number FROM membertb ORDER BY random() LIMIT 500")]
+    titles = [row[0] for row in conn.execute(
+        "SELECT title FROM booktb WHERE available_copies > 0 ORDER BY random() LIMIT 500")]
+    words = sorted({w for t in titles for w in t.split() if len(w) > 3}) or ["a"]
+    (total,) = conn.execute("SELECT MAX(transaction_id) FROM transtb").fetchone()
+    total = total or 1
+
+    def plan():
+        roll = rng.random()
+        if roll < 0.5:
+            return [("search", "GET", f"/books?q={rng.choice(words)}", None)]
+        if roll < 0.65:
+            return [("stats", "GET", "/stats", None)]
+        if roll < 0.8:
+            return [("loans_page", "GET", f"/loans?after={rng.randrange(total)}&limit=50", None)]
+        if roll < 0.9:
+            return [("members", "GET", f"/members?q={rng.choice(numbers)}", None)]
+        member, book = str(rng.choice(numbers)), rng.choice(titles)
+        return [("checkout", "POST", "/checkout", {"member": member, "book": book,
+                                                  "issue_date": today, "due_date": due}),
+                ("checkin", "POST", "/checkin", {"member": member, "book": book, "return_date": today})]
+    return plan
+
+
+def _percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] * 1000 if ordered else 0
+
+
+async def load_test(path, desks=32, duration=10.0, port=DEFAULT_PORT, readers=DEFAULT_READERS, seed=1):
+    """Start a server subprocess on `path` and drive it with `desks` keep-alive clients."""
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--db", path,
+                               "--port", str(port), "--readers", str(readers)],
+                              stdout=subprocess.DEVNULL)
+    try:
+        for _ in range(200):
+            try:
+                _, w = await asyncio.open_connection(DEFAULT_HOST, port)
+                w.close()
+                break
+            except OSError:
+                await asyncio.sleep(0.05)
+        conn = connect(path)
+        today = date.today()
+        rng = random.Random(seed)
+        plan = _workload(conn, rng, today.isoformat(), (today + timedelta(days=14)).isoformat())
+        conn.close()
+
+        latencies, errors = defaultdict(list), defaultdict(int)
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(_desk(DEFAULT_HOST, port, plan, deadline, latencies, errors)
+                               for _ in range(desks)))
+        elapsed = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+
+    total = sum(len(v) for v in latencies.values())
+    print(f"{desks} desks, {elapsed:.1f}s: {total} requests, {total / elapsed:.0f} req/s")
+    print(f"{'route':<12}{'count':>8}{'errors':>8}{'p50':>10}{'p95':>10}{'p99':>10}")
+    everything = []
+    for name in sorted(latencies):
+        ordered = sorted(latencies[name])
+        everything.extend(ordered)
+        print(f"{name:<12}{len(ordered):>8}{errors[name]:>8}{_percentile(ordered, 50):>8.1f}ms"
+              f"{_percentile(ordered, 95):>8.1f}ms{_percentile(ordered, 99):>8.1f}ms")
+    everything.sort()
+    print(f"{'all':<12}{total:>8}{sum(errors.values()):>8}{_percentile(everything, 50):>8.1f}ms"
+          f"{_percentile(everything, 95):>8.1f}ms{_percentile(everything, 99):>8.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Circulation JSON server for the library desks.")
+    parser.add_argument("--db", default="library.db")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--readers", type=int, default=DEFAULT_READERS, help="concurrent read connections")
+    parser.add_argument("--load-test", action="store_true", help="start a server and drive it with simulated desks")
+    parser.add_argument("--desks", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    try:
+        if args.load_test:
+            asyncio.run(load_test(args.db, args.desks, args.duration, args.port, args.readers))
+        else:
+            asyncio.run(serve(args.db, args.host, args.port, args.readers))
+    except KeyboardInterrupt:
+        pass
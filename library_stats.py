@@ -0,0 +1,133 @@
+import argparse
+
+from library_db import connect
+
+# ====================================================
+#   DASHBOARD STATISTICS
+# ====================================================
+# The dashboard counters live in a one-row-per-statistic table that SQLite
+# triggers keep current on every change to booktb, membertb and transtb, so
+# reading them is a primary-key lookup instead of COUNT(*) over big tables.
+#
+# "total_loans" counts every transtb row, so paging the transaction history
+# (TransactionTable, the server's /loans) never needs COUNT(*) on transtb.
+#
+# "overdue_loans" follows transtb.status, which fines.py --nightly sets to
+# 'overdue'; it is as fresh as the last nightly run.
+#
+#   python library_stats.py            # print the counters
+#   python library_stats.py --rebuild  # recount from scratch
+
+STAT_NAMES = ("total_books", "total_copies", "total_members", "total_loans", "books_issued",
+              "overdue_loans")
+
+RECOUNT = {
+    "total_books": "SELECT COUNT(*) FROM booktb",
+    "total_copies": "SELECT COALESCE(SUM(total_copies), 0) FROM booktb",
+    "total_members": "SELECT COUNT(*) FROM membertb",
+    "total_loans": "SELECT COUNT(*) FROM transtb",
+    "books_issued": "SELECT COUNT(*) FROM transtb WHERE return_date IS NULL",
+    "overdue_loans": "SELECT COUNT(*) FROM transtb WHERE return_date IS NULL AND status = 'overdue'",
+}
+
+# Open loan / open overdue loan, as 0 or 1 (never NULL), for a transtb row alias
+OPEN = "({r}.return_date IS NULL)"
+OVERDUE = "({r}.return_date IS NULL AND {r}.status IS 'overdue')"
+
+
+def _bump(name, delta):
+    return f"UPDATE librarystats SET value = value + ({delta}) WHERE name = '{name}';"
+
+
+def ensure_stats(conn):
+    """Create the stats table and triggers; count once the statistics that are new."""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS librarystats(
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    """)
+    counted = {name for (name,) in conn.execute("SELECT name FROM librarystats")}
+    missing = [name for name in STAT_NAMES if name not in counted]
+    if missing:
+        # Triggers from before a statistic was added do not maintain it: replace them
+        for (trigger,) in conn.execute("""
+                SELECT name FROM sqlite_master
+                WHERE type = 'trigger' AND name LIKE 'librarystats!_%' ESCAPE '!'""").fetchall():
+            conn.execute(f"DROP TRIGGER {trigger}")
+    new_open, old_open = OPEN.format(r="new"), OPEN.format(r="old")
+    new_overdue, old_overdue = OVERDUE.format(r="new"), OVERDUE.format(r="old")
+    conn.executescript(f"""
+    CREATE TRIGGER IF NOT EXISTS librarystats_book_ai AFTER INSERT ON booktb BEGIN
+        {_bump("total_books", 1)}
+        {_bump("total_copies", "new.total_copies")}
+    END;
+    CREATE TRIGGER IF NOT EXISTS librarystats_book_ad AFTER DELETE ON booktb BEGIN
+        {_bump("total_books", -1)}
+        {_bump("total_copies", "-old.total_copies")}
+    END;
+    CREATE TRIGGER IF NOT EXISTS librarystats_book_au AFTER UPDATE OF total_copies ON booktb BEGIN
+        {_bump("total_copies", "new.total_copies - old.total_copies")}
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS librarystats_member_ai AFTER INSERT ON membertb BEGIN
+        {_bump("total_members", 1)}
+    END;
+    CREATE TRIGGER IF NOT EXISTS librarystats_member_ad AFTER DELETE ON membertb BEGIN
+        {_bump("total_members", -1)}
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS librarystats_trans_ai AFTER INSERT ON transtb BEGIN
+        {_bump("total_loans", 1)}
+        {_bump("books_issued", new_open)}
+        {_bump("overdue_loans", new_overdue)}
+    END;
+    CREATE TRIGGER IF NOT EXISTS librarystats_trans_ad AFTER DELETE ON transtb BEGIN
+        {_bump("total_loans", -1)}
+        {_bump("books_issued", "-" + old_open)}
+        {_bump("overdue_loans", "-" + old_overdue)}
+    END;
+    CREATE TRIGGER IF NOT EXISTS librarystats_trans_au AFTER UPDATE OF return_date, status ON transtb BEGIN
+        {_bump("books_issued", f"{new_open} - {old_open}")}
+        {_bump("overdue_loans", f"{new_overdue} - {old_overdue}")}
+    END;
+    """)
+    rebuild_stats(conn, missing)
+    conn.commit()
+
+
+def rebuild_stats(conn, names=STAT_NAMES):
+    with conn:
+        for name in names:
+            (value,) = conn.execute(RECOUNT[name]).fetchone()
+            conn.execute("INSERT OR REPLACE INTO librarystats(name, value) VALUES (?, ?)", (name, value))
+
+
+def read_stats(conn):
+    stats = dict.fromkeys(STAT_NAMES, 0)
+    stats.update(conn.execute("SELECT name, value FROM librarystats"))
+    return stats
+
+
+def format_stats(stats):
+    return ("📊 Key Statistics:\n"
+            f"• Total Books: {stats['total_books']}\n"
+            f"• Total Copies: {stats['total_copies']}\n"
+            f"• Total Members: {stats['total_members']}\n"
+            f"• Books Issued: {stats['books_issued']}\n"
+            f"• Overdue Loans: {stats['overdue_loans']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trigger-maintained library statistics.")
+    parser.add_argument("--db", default="library.db")
+    parser.add_argument("--rebuild", action="store_true", help="recount every statistic from the tables")
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    ensure_stats(conn)
+    if args.rebuild:
+        rebuild_stats(conn)
+    for name, value in read_stats(conn).items():
+        print(f"{name}: {value}")
+    conn.close()
@@ -0,0 +1,244 @@
+import tkinter as tk
+from tkinter import ttk, filedialog
+
+import instrumentation
+from book_search import PAGE_SIZE
+from ratings import format_rating
+
+# ====================================================
+#   SHARED POPUP WINDOWS
+# ====================================================
+# Windows that behave the same in every GUI (Dashboard.py, part 3.py, hi.py).
+# Each takes the parent Tk window and, if it reads the library, the app's
+# loan source: a LoanStore, or a LibraryClient when the desk runs against
+# library_server.py (both offer search, related, rating, members, history
+# and history_summary).
+
+
+def open_search_books_window(parent, source, covers=None):
+    win = tk.Toplevel(parent)
+    win.title("🔍 Search Books")
+    win.geometry("820x520")
+    win.config(bg="white")
+
+    top = tk.Frame(win, bg="white")
+    top.pack(fill="x", padx=10, pady=10)
+    tk.Label(top, text="Title / Author / Category / ISBN:", bg="white").pack(side="left")
+    query = tk.Entry(top, width=40)
+    query.pack(side="left", padx=5)
+    query.focus_set()
+
+    body = tk.Frame(win, bg="white")
+    body.pack(fill="both", expand=True, padx=10)
+    columns = ("title", "author", "category", "isbn", "available")
+    tree = ttk.Treeview(body, columns=columns, show="headings", height=18)
+    for col, width in zip(columns, (240, 160, 120, 120, 80)):
+        tree.heading(col, text=col.title())
+        tree.column(col, width=width, anchor="w")
+    tree.pack(side="left", fill="both", expand=True)
+    detail = tk.Frame(body, bg="white")
+    detail.pack(side="left", padx=10, fill="y")
+    cover = tk.Label(detail, bg="white")
+    cover.pack(anchor="n")
+    rating = tk.Label(detail, text="", bg="white")
+    rating.pack(anchor="w")
+    tk.Label(detail, text="Readers also borrowed:", bg="white").pack(anchor="w", pady=(10, 0))
+    related = tk.Listbox(detail, width=32, height=10)
+    related.pack(fill="y", expand=True)
+
+    footer = tk.Frame(win, bg="white")
+    footer.pack(fill="x", padx=10, pady=5)
+    status = tk.Label(footer, text="", bg="white", fg="#555555")
+    status.pack(side="left")
+    more = ttk.Button(footer, text="More results", state="disabled")
+    more.pack(side="right")
+
+    state = {"text": "", "after": None, "shown": 0}
+    books = {}
+
+    def run_search(event=None):
+        state["text"] = query.get().strip()
+        state.update(after=None, shown=0)
+        tree.delete(*tree.get_children())
+        books.clear()
+        load_page()
+
+    def load_page():
+        results = source.search(state["text"], limit=PAGE_SIZE, after=state["after"])
+        for book in results:
+            iid = str(book["book_id"])
+            books[iid] = book
+            tree.insert("", "end", iid=iid, values=(
+                book["title"], book["author"], book["category"], book["isbn"],
+                f"{book['available_copies']}/{book['total_copies']}"))
+        if results:
+            state["after"] = (results[-1]["score"], results[-1]["book_id"])
+        state["shown"] += len(results)
+        more.config(state="normal" if len(results) == PAGE_SIZE else "disabled")
+        status.config(text=f"{state['shown']} result(s)" if state["shown"] else "No matching books.")
+
+    def show_cover(photo):
+        if win.winfo_exists():
+            cover.config(image=photo or "")
+            cover.image = photo
+
+    def on_select(event=None):
+        selection = tree.selection()
+        if not selection:
+            return
+        book = books[selection[0]]
+        rating.config(text=format_rating(source.rating(book["book_id"])))
+        related.delete(0, tk.END)
+        for other in source.related(book["book_id"]):
+            related.insert(tk.END, f"{other['title']} - {other['author']}")
+        if covers is not None:
+            covers.request(book["cover_image_url"], show_cover, owner=win)
+
+    def close_window():
+        if covers is not None:
+            covers.cancel_owner(win)
+        win.destroy()
+
+    ttk.Button(top, text="Search", command=run_search).pack(side="left")
+    more.config(command=load_page)
+    query.bind("<Return>", run_search)
+    tree.bind("<<TreeviewSelect>>", on_select)
+    win.protocol("WM_DELETE_WINDOW", close_window)
+    return win
+
+
+def open_borrow_history_window(parent, source):
+    win = tk.Toplevel(parent)
+    win.title("📖 Borrowing History")
+    win.geometry("900x520")
+    win.config(bg="white")
+
+    top = tk.Frame(win, bg="white")
+    top.pack(fill="x", padx=10, pady=10)
+    tk.Label(top, text="Membership number or name:", bg="white").pack(side="left")
+    query = tk.Entry(top, width=30)
+    query.pack(side="left", padx=5)
+    query.focus_set()
+    summary = tk.Label(win, text="", bg="white", anchor="w", font=("Arial", 11, "bold"))
+    summary.pack(fill="x", padx=10)
+
+    body = tk.Frame(win, bg="white")
+    body.pack(fill="both", expand=True, padx=10)
+    matches = tk.Listbox(body, width=30)      # shown when several members match
+    columns = ("book", "issue_date", "due_date", "return_date", "fine", "status")
+    tree = ttk.Treeview(body, columns=columns, show="headings", height=18)
+    for col, width in zip(columns, (300, 100, 100, 100, 70, 80)):
+        tree.heading(col, text=col.replace("_", " ").title())
+        tree.column(col, width=width, anchor="w" if col == "book" else "center")
+    scrollbar = ttk.Scrollbar(body, orient="vertical", command=tree.yview)
+    scrollbar.pack(side="right", fill="y")
+    tree.pack(side="right", fill="both", expand=True)
+
+    footer = tk.Frame(win, bg="white")
+    footer.pack(fill="x", padx=10, pady=5)
+    status = tk.Label(footer, text="", bg="white", fg="#555555")
+    status.pack(side="left")
+    more = ttk.Button(footer, text="Load more", state="disabled")
+    more.pack(side="right")
+
+    state = {"member": None, "cursor": None, "shown": 0, "total": 0, "members": [], "pending": False}
+
+    def find_member(event=None):
+        state["members"] = source.members(query.get())
+        matches.pack_forget()
+        if not state["members"]:
+            status.config(text="No member found.")
+        elif len(state["members"]) == 1:
+            show_member(state["members"][0])
+        else:
+            matches.delete(0, tk.END)
+            for member in state["members"]:
+                matches.insert(tk.END, f"{member['first_name']} {member['last_name']} ({member['membership_number']})")
+            matches.pack(side="left", fill="y", padx=(0, 10))
+            status.config(text=f"{len(state['members'])} members match; pick one.")
+
+    def on_pick(event=None):
+        selection = matches.curselection()
+        if selection:
+            show_member(state["members"][selection[0]])
+
+    def show_member(member):
+        state.update(member=member, cursor=None, shown=0)
+        tree.delete(*tree.get_children())
+        totals = source.history_summary(member["member_id"])
+        state["total"] = totals["loans"]
+        summary.config(text=f"{member['first_name']} {member['last_name']} ({member['membership_number']}) - "
+                            f"{totals['loans']} loan(s), {totals['open']} open, fines {totals['fines']:.2f}")
+        load_more()
+
+    def load_more():
+        state["pending"] = False
+        if state["member"] is None:
+            return
+        loans, state["cursor"] = source.history(state["member"]["member_id"], state["cursor"])
+        for loan in loans:
+            tree.insert("", "end", iid=str(loan["id"]), values=(
+                loan["book"], loan["issue_date"] or "", loan["due_date"] or "", loan["return_date"] or "",
+                f"{loan['fine'] or 0:.2f}", loan["status"] or ""))
+        state["shown"] += len(loans)
+        more.config(state="normal" if state["cursor"] else "disabled")
+        status.config(text=f"{state['shown']} of {state['total']} loan(s) shown")
+
+    def on_scroll(first, last):
+        # Fetch the next page when the last row scrolls into view
+        scrollbar.set(first, last)
+        if float(last) >= 1.0 and state["cursor"] is not None and not state["pending"]:
+            state["pending"] = True
+            win.after_idle(load_more)
+
+    ttk.Button(top, text="Show History", command=find_member).pack(side="left")
+    more.config(command=load_more)
+    query.bind("<Return>", find_member)
+    matches.bind("<<ListboxSelect>>", on_pick)
+    tree.config(yscrollcommand=on_scroll)
+    return win
+
+
+def open_diagnostics_window(parent):
+    """Live view of the instrumentation histograms (LIBRARY_PROFILE=1)."""
+    win = tk.Toplevel(parent)
+    win.title("🩺 Diagnostics")
+    win.geometry("900x480")
+    win.config(bg="white")
+
+    columns = ("category", "name", "count", "mean", "p50", "p95", "p99", "max")
+    tree = ttk.Treeview(win, columns=columns, show="headings", height=18)
+    for col, width in zip(columns, (70, 420, 60, 70, 70, 70, 70, 70)):
+        tree.heading(col, text=col.title())
+        tree.column(col, width=width, anchor="w" if col in ("category", "name") else "e")
+    tree.pack(fill="both", expand=True, padx=10, pady=10)
+
+    footer = tk.Frame(win, bg="white")
+    footer.pack(fill="x", padx=10, pady=5)
+    status = tk.Label(footer, text="", bg="white", fg="#555555")
+    status.pack(side="left")
+
+    def refresh():
+        tree.delete(*tree.get_children())
+        for category, name, s in instrumentation.REGISTRY.snapshot():
+            tree.insert("", "end", values=(category, name, s["count"], *(
+                f"{s[key]:.2f}ms" for key in ("mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"))))
+        if not instrumentation.ENABLED:
+            status.config(text="Profiling is off. Start the app with LIBRARY_PROFILE=1.")
+
+    def dump():
+        path = filedialog.asksaveasfilename(parent=win, defaultextension=".json",
+                                            initialfile="library_profile.json")
+        if path:
+            instrumentation.REGISTRY.dump(path)
+            status.config(text=f"Saved to {path}")
+
+    def reset():
+        instrumentation.REGISTRY.reset()
+        refresh()
+
+    ttk.Button(footer, text="Refresh", command=refresh).pack(side="right")
+    ttk.Button(footer, text="Reset", command=reset).pack(side="right", padx=5)
+    ttk.Button(footer, text="Save...", command=dump).pack(side="right")
+    refresh()
+    return win
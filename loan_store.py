@@ -0,0 +1,391 @@
+from collections import defaultdict
+from datetime import date
+
+from fines import loan_fine
+from library_db import write_transaction
+from holds import ensure_holds, take_copy, release_copy, place_hold, hold_queue, HoldError
+from fuzzy_match import ensure_fuzzy_index, match_books, match_members, similarity, word_trigrams
+
+# ====================================================
+#   LOAN STORE (transtb)
+# ====================================================
+# Issue and return in the GUIs go through LoanStore, which keeps every loan
+# in transtb so it survives restarts.  Open loans are also cached in an
+# in-process hash index {(member_id, book_id): [transaction_id, ...]}, loaded
+# once at start-up through a partial index on transtb.  Other desks (and the
+# CLI) write the same database, so the cache is only a fast path: a miss or a
+# stale entry falls back to the partial index, which never scans the
+# transaction history either.
+#
+# What staff type is resolved exactly first (membership number, name, ISBN,
+# title).  When that fails a return falls back to the trigram matcher
+# (fuzzy_match.py): "hary poter" or "Harry Potter" still finds the member's
+# loan of "Harry Potter and the Philosopher's Stone" as long as only one of
+# their open loans fits.  Failed issues name the closest matches instead.
+#
+# Issue and return also take/put back a copy in booktb.available_copies, or
+# serve the book's hold queue, in the same transaction (holds.py).
+#
+# LoanStore also acts as the row source for TransactionTable (count,
+# page_after/page_before by transaction id, and anchors for scrollbar jumps),
+# and serves the reads of the shared windows (search, history, ratings).
+
+STATUS_ISSUED = "issued"
+STATUS_RETURNED = "returned"
+FUZZY_MEMBERS = 25
+FUZZY_RETURN_SCORE = 0.6      # a fuzzy return needs a closer book match than a suggestion
+FUZZY_MARGIN = 0.1            # ...and must beat the next loan by this much
+SUGGESTIONS = 3
+
+
+class LoanError(Exception):
+    """A user-facing problem with an issue or return (unknown member, ...)."""
+
+
+def ensure_loan_indexes(conn):
+    conn.executescript("""
+    CREATE INDEX IF NOT EXISTS idx_transtb_open_loans
+        ON transtb(member_id, book_id) WHERE return_date IS NULL;
+    CREATE INDEX IF NOT EXISTS idx_membertb_name
+        ON membertb(first_name COLLATE NOCASE, last_name COLLATE NOCASE);
+    CREATE INDEX IF NOT EXISTS idx_booktb_title
+        ON booktb(title COLLATE NOCASE);
+    """)
+    conn.commit()
+
+
+LOAN_SELECT = """
+SELECT t.transaction_id, t.member_id, t.book_id,
+       COALESCE(m.first_name || ' ' || m.last_name, '#' || t.member_id),
+       COALESCE(b.title, '#' || t.book_id),
+       t.issue_date, t.due_date, t.return_date, t.fine_amount, t.status
+FROM {source} t
+LEFT JOIN membertb m ON m.member_id = t.member_id
+LEFT JOIN booktb b ON b.book_id = t.book_id
+"""
+
+
+def loan_from_row(row):
+    return {
+        "id": row[0], "member_id": row[1], "book_id": row[2],
+        "member": row[3], "book": row[4],
+        "issue_date": row[5], "due_date": row[6], "return_date": row[7],
+        "fine": row[8] or 0, "status": row[9],
+    }
+
+
+class LoanStore:
+    def __init__(self, conn):
+        self.conn = conn
+        ensure_loan_indexes(conn)
+        ensure_fuzzy_index(conn)
+        ensure_holds(conn)
+        self.open_loans = defaultdict(list)
+        for txn_id, member_id, book_id in conn.execute(
+                "SELECT transaction_id, member_id, book_id FROM transtb "
+                "INDEXED BY idx_transtb_open_loans WHERE return_date IS NULL"):
+            self.open_loans[(member_id, book_id)].append(txn_id)
+
+    # --- Resolving what staff typed ---------------------------------
+    def resolve_member(self, text):
+        """Member id for a membership number or "First Last" name."""
+        text = text.strip()
+        if text.isdigit():
+            row = self.conn.execute("SELECT member_id FROM membertb WHERE membership_number = ?",
+                                    (int(text),)).fetchone()
+            if row:
+                return row[0]
+        first, _, last = text.partition(" ")
+        rows = self.conn.execute("""
+        SELECT member_id FROM membertb
+        WHERE first_name = ? COLLATE NOCASE AND last_name = ? COLLATE NOCASE
+        """, (first, last.strip())).fetchall()
+        if not rows:
+            suggestions = [f"{m['first_name']} {m['last_name']} ({m['membership_number']})"
+                           for m in match_members(self.conn, text, SUGGESTIONS)]
+            raise LoanError(f"No member found for '{text}'." + _did_you_mean(suggestions))
+        if len(rows) > 1:
+            raise LoanError(f"Several members are named '{text}'. Please enter the membership number.")
+        return rows[0][0]
+
+    def resolve_books(self, text):
+        """Book ids for an exact title (any case) or ISBN."""
+        text = text.strip()
+        rows = self.conn.execute("SELECT book_id FROM booktb WHERE isbn = ?", (text,)).fetchall()
+        if not rows:
+            rows = self.conn.execute("SELECT book_id FROM booktb WHERE title = ? COLLATE NOCASE ORDER BY book_id",
+                                     (text,)).fetchall()
+        if not rows:
+            suggestions = [book["title"] for book in match_books(self.conn, text, SUGGESTIONS)]
+            raise LoanError(f"No book found for '{text}'." + _did_you_mean(suggestions))
+        return [row[0] for row in rows]
+
+    # --- Issue / return ---------------------------------------------
+    def _issue(self, member_id, book_id, issue_date, due_date):
+        """The new loan, or None (nothing written) when no copy is free."""
+        with write_transaction(self.conn):
+            if not take_copy(self.conn, member_id, book_id, issue_date):
+                return None
+            cur = self.conn.execute("""
+            INSERT INTO transtb(member_id, book_id, issue_date, due_date, return_date, fine_amount, status)
+            VALUES (?, ?, ?, ?, NULL, 0, ?)
+            """, (member_id, book_id, issue_date, due_date, STATUS_ISSUED))
+        txn_id = cur.lastrowid
+        self.open_loans[(member_id, book_id)].append(txn_id)
+        return self.get(txn_id)
+
+    def issue(self, member_id, book_id, issue_date, due_date):
+        txn = self._issue(member_id, book_id, issue_date, due_date)
+        if txn is None:
+            raise self._no_copies(book_id)
+        return txn
+
+    def _no_copies(self, book_id):
+        (title,) = self.conn.execute("SELECT title FROM booktb WHERE book_id = ?", (book_id,)).fetchone()
+        waiting = len(hold_queue(self.conn, book_id))
+        return LoanError(f"No copies of '{title}' are available ({waiting} hold(s) waiting). "
+                         "Place a hold to join the queue.")
+
+    def find_open(self, member_id, book_ids):
+        """Oldest open loan of any of `book_ids` by the member, or None."""
+        for book_id in book_ids:
+            key = (member_id, book_id)
+            for txn_id in self.open_loans.get(key, ()):
+                txn = self.get(txn_id)
+                if txn is not None and txn["return_date"] is None:
+                    return txn
+            # Not cached, or returned at another desk: ask transtb
+            txn_ids = [txn_id for (txn_id,) in self.conn.execute("""
+            SELECT transaction_id FROM transtb INDEXED BY idx_transtb_open_loans
+            WHERE member_id = ? AND book_id = ? AND return_date IS NULL
+            ORDER BY transaction_id
+            """, key)]
+            if txn_ids:
+                self.open_loans[key] = txn_ids
+                return self.get(txn_ids[0])
+            self.open_loans.pop(key, None)
+        return None
+
+    def find_open_fuzzy(self, member_text, book_text):
+        """The open loan whose member and book best match misspelt or partial
+        text.  Members come from the trigram index (or the exact number); the
+        book is scored only against those members' open loans.  Raises
+        LoanError when nothing fits or another loan fits almost as well.
+        """
+        members = {}
+        text = member_text.strip()
+        if text.isdigit():
+            row = self.conn.execute("SELECT member_id FROM membertb WHERE membership_number = ?",
+                                    (int(text),)).fetchone()
+            if row:
+                members[row[0]] = 1.0
+        for member in match_members(self.conn, text, FUZZY_MEMBERS):
+            members.setdefault(member["member_id"], member["score"])
+        book_text = book_text.strip()
+        query = word_trigrams(book_text)
+        best = {}
+        for member_id, member_score in members.items():
+            for txn_id, book_id, title, isbn in self.conn.execute("""
+            SELECT t.transaction_id, t.book_id, b.title, b.isbn
+            FROM transtb t INDEXED BY idx_transtb_open_loans JOIN booktb b ON b.book_id = t.book_id
+            WHERE t.member_id = ? AND t.return_date IS NULL
+            ORDER BY t.transaction_id
+            """, (member_id,)):
+                book_score = 1.0 if book_text == isbn else similarity(query, title) if query else 0.0
+                if book_score >= FUZZY_RETURN_SCORE and (member_id, book_id) not in best:
+                    best[(member_id, book_id)] = (member_score + book_score, txn_id)
+        if not best:
+            raise LoanError("No matching record found.")
+        ranked = sorted(best.values(), key=lambda item: (-item[0], item[1]))
+        if len(ranked) > 1 and ranked[1][0] > ranked[0][0] - FUZZY_MARGIN:
+            tied = [self.get(txn_id) for score, txn_id in ranked[:SUGGESTIONS]
+                    if score > ranked[0][0] - FUZZY_MARGIN]
+            raise LoanError("Several open loans match: "
+                            + "; ".join(f"{txn['member']} - {txn['book']} (issued {txn['issue_date']})" for txn in tied)
+                            + ". Please enter the membership number and full title.")
+        return self.get(ranked[0][1])
+
+    def return_loan(self, txn, return_date, fine):
+        """The returned loan; its "hold" is the hold the copy went to, if any."""
+        with write_transaction(self.conn):
+            cur = self.conn.execute("""
+            UPDATE transtb SET return_date = ?, fine_amount = ?, status = ?
+            WHERE transaction_id = ? AND return_date IS NULL
+            """, (return_date, fine, STATUS_RETURNED, txn["id"]))
+            hold = release_copy(self.conn, txn["book_id"], return_date) if cur.rowcount else None
+        key = (txn["member_id"], txn["book_id"])
+        if txn["id"] in self.open_loans.get(key, ()):
+            self.open_loans[key].remove(txn["id"])
+            if not self.open_loans[key]:
+                del self.open_loans[key]
+        if not cur.rowcount:
+            raise LoanError("This loan was already returned at another desk.")
+        returned = self.get(txn["id"])
+        returned["hold"] = hold
+        return returned
+
+    def get(self, txn_id):
+        return get_loan(self.conn, txn_id)
+
+    # --- What the issue/return windows call -------------------------
+    def checkout(self, member_text, book_text, issue_date, due_date):
+        """Issue a free copy of the first book matching `book_text` that has one."""
+        issue_date, due_date = _check_date(issue_date, "Issue date"), _check_date(due_date, "Due date")
+        member_id = self.resolve_member(member_text)
+        book_ids = self.resolve_books(book_text)
+        for book_id in book_ids:
+            txn = self._issue(member_id, book_id, issue_date, due_date)
+            if txn is not None:
+                return txn
+        raise self._no_copies(book_ids[0])
+
+    def place_hold(self, member_text, book_text):
+        """Queue the member for the first book matching `book_text`."""
+        member_id = self.resolve_member(member_text)
+        try:
+            return place_hold(self.conn, member_id, self.resolve_books(book_text)[0])
+        except HoldError as e:
+            raise LoanError(str(e)) from e
+
+    def checkin(self, member_text, book_text, return_date):
+        """Return the member's oldest open loan of the book; the loan has its fine.
+
+        Falls back to find_open_fuzzy() when the text does not match exactly.
+        """
+        return_date = _check_date(return_date, "Return date")
+        try:
+            txn = self.find_open(self.resolve_member(member_text), self.resolve_books(book_text))
+        except LoanError:
+            txn = None
+        if txn is None:
+            txn = self.find_open_fuzzy(member_text, book_text)
+        return self.return_loan(txn, return_date, loan_fine(self.conn, txn["id"], return_date))
+
+    # --- TransactionTable source ------------------------------------
+    def count(self):
+        return loan_count(self.conn)
+
+    def page_after(self, after_id, limit):
+        return loan_page_after(self.conn, after_id, limit)
+
+    def page_before(self, before_id, limit):
+        return loan_page_before(self.conn, before_id, limit)
+
+    def anchors(self, step, start_id=None):
+        return loan_anchors(self.conn, step, start_id)
+
+    # --- Reads for the shared windows (library_windows.py) ----------
+    # Imported in the methods: these modules import this one
+    def search(self, text, limit=25, after=None):
+        from book_search import search_books
+        return search_books(self.conn, text, limit, after)
+
+    def related(self, book_id, k=10):
+        from recommendations import related_books
+        return related_books(self.conn, book_id, k)
+
+    def rating(self, book_id):
+        from ratings import book_rating
+        return book_rating(self.conn, book_id)
+
+    def top_rated(self, k=10):
+        from ratings import top_rated
+        return top_rated(self.conn, k)
+
+    def members(self, text):
+        return find_members(self.conn, text)
+
+    def history(self, member_id, cursor=None):
+        from borrow_history import member_history
+        return member_history(self.conn, member_id, cursor)
+
+    def history_summary(self, member_id):
+        from borrow_history import history_summary
+        return history_summary(self.conn, member_id)
+
+    def stats(self):
+        from library_stats import read_stats
+        return read_stats(self.conn)
+
+    def message(self, recipient, subject, body):
+        """Queue an email to one recipient in the notification outbox."""
+        from notifications import enqueue
+        return enqueue(self.conn, "email", recipient, "message", subject, body)
+
+
+def _check_date(text, label):
+    """The date typed into a loan window as YYYY-MM-DD, or LoanError."""
+    text = str(text).strip()
+    try:
+        return date.fromisoformat(text).isoformat()
+    except ValueError:
+        raise LoanError(f"{label} '{text}' is not a date (YYYY-MM-DD).") from None
+
+
+def _did_you_mean(suggestions):
+    return f" Did you mean: {', '.join(suggestions)}?" if suggestions else ""
+
+
+def get_loan(conn, txn_id):
+    row = conn.execute(LOAN_SELECT.format(source="transtb") + " WHERE t.transaction_id = ?",
+                       (txn_id,)).fetchone()
+    return loan_from_row(row) if row else None
+
+
+def loan_count(conn):
+    """Number of transactions, from the trigger-maintained librarystats counter."""
+    row = conn.execute("SELECT value FROM librarystats WHERE name = 'total_loans'").fetchone()
+    return row[0] if row else 0
+
+
+def loan_page_after(conn, after_id, limit):
+    """The `limit` loans after transaction after_id (None: the first ones)."""
+    source = "(SELECT * FROM transtb WHERE transaction_id > ? ORDER BY transaction_id LIMIT ?)"
+    rows = conn.execute(LOAN_SELECT.format(source=source) + " ORDER BY t.transaction_id",
+                        (-1 if after_id is None else after_id, limit)).fetchall()
+    return [loan_from_row(row) for row in rows]
+
+
+def loan_page_before(conn, before_id, limit):
+    """The `limit` loans just before transaction before_id, oldest first."""
+    source = "(SELECT * FROM transtb WHERE transaction_id < ? ORDER BY transaction_id DESC LIMIT ?)"
+    rows = conn.execute(LOAN_SELECT.format(source=source) + " ORDER BY t.transaction_id",
+                        (before_id, limit)).fetchall()
+    return [loan_from_row(row) for row in rows]
+
+
+def loan_anchors(conn, step, start_id=None):
+    """Ids of every step-th loan from start_id (the first loan if None) on.
+
+    Reads only the primary key, so even millions of loans are one quick pass.
+    """
+    rows = conn.execute("""
+    SELECT transaction_id FROM (
+        SELECT transaction_id, ROW_NUMBER() OVER (ORDER BY transaction_id) - 1 AS n
+        FROM transtb WHERE transaction_id >= ?)
+    WHERE n % ? = 0 ORDER BY transaction_id
+    """, (-1 if start_id is None else start_id, step)).fetchall()
+    return [row[0] for row in rows]
+
+
+def find_members(conn, text, limit=20):
+    text = text.strip()
+    if text.isdigit():
+        rows = conn.execute("""
+        SELECT member_id, membership_number, first_name, last_name, email, membership_type, status
+        FROM membertb WHERE membership_number = ?
+        """, (int(text),)).fetchall()
+    else:
+        first, _, last = text.partition(" ")
+        rows = conn.execute("""
+        SELECT member_id, membership_number, first_name, last_name, email, membership_type, status
+        FROM membertb
+        WHERE first_name LIKE ? ESCAPE '\\' AND last_name LIKE ? ESCAPE '\\'
+        ORDER BY first_name, last_name LIMIT ?
+        """, (_prefix(first), _prefix(last.strip()), limit)).fetchall()
+    keys = ("member_id", "membership_number", "first_name", "last_name", "email", "membership_type", "status")
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def _prefix(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
@@ -0,0 +1,267 @@
+import argparse
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from instrumentation import timer
+
+# ====================================================
+#   POOLED, HEDGED BOOK METADATA CLIENT
+# ====================================================
+# One MetadataClient is shared by the GUI lookup and the bulk importer.  Each
+# provider gets its own requests.Session, so TCP/TLS connections are kept
+# alive and reused, with its own timeout and retry policy.
+#
+# In hedged mode the next provider is asked after `hedge_delay` seconds if
+# the current one has not answered yet, and the first usable answer wins.
+#
+# requests/urllib3 are imported when the first Provider is built, not at
+# module load, so the GUIs do not pay for them until the first lookup.
+#
+# Latency benchmark against a local stub server:
+#   python metadata_client.py --bench
+
+GOOGLE_URL = "https://www.googleapis.com/books/v1/volumes?q=isbn:{isbn}"
+OPENLIBRARY_URL = "https://openlibrary.org/isbn/{isbn}.json"
+DEFAULT_HEDGE_DELAY = 0.3
+POLL_INTERVAL = 0.05
+
+
+class LookupCancelled(Exception):
+    pass
+
+
+def parse_google(res):
+    res.raise_for_status()
+    data = res.json()
+    return data if data.get("items") else None
+
+
+def parse_openlibrary(res):
+    if res.status_code == 404:
+        return None
+    res.raise_for_status()
+    return res.json()
+
+
+class Provider:
+    def __init__(self, name, url, parse, timeout=(3.05, 5), retries=2, backoff=0.2, pool_size=16):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.name = name
+        self.url = url
+        self.parse = parse
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=backoff, allowed_methods=["GET"],
+                      status_forcelist=[429, 500, 502, 503, 504], raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def fetch(self, isbn):
+        """Return the provider payload, None if the ISBN is unknown."""
+        with timer("http", self.name):
+            res = self.session.get(self.url.format(isbn=isbn), timeout=self.timeout)
+        return self.parse(res)
+
+    def close(self):
+        self.session.close()
+
+
+def default_providers(google_url=GOOGLE_URL, openlibrary_url=OPENLIBRARY_URL):
+    return [
+        Provider("google", google_url, parse_google, timeout=(3.05, 5)),
+        Provider("openlibrary", openlibrary_url, parse_openlibrary, timeout=(3.05, 8)),
+    ]
+
+
+class MetadataClient:
+    def __init__(self, providers=None, hedge_delay=DEFAULT_HEDGE_DELAY, max_workers=32):
+        self.providers = providers if providers is not None else default_providers()
+        self.hedge_delay = hedge_delay
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="metadata")
+        self.latencies = deque(maxlen=10000)
+        self._lock = threading.Lock()
+
+    def lookup(self, isbn, cache=None, limiters=None, cancel_event=None):
+        """Return (provider, payload) for the first provider that knows the ISBN.
+
+        Returns (None, None) when every provider answered "not found".  If a
+        provider failed and none found the book, the last error is re-raised.
+        """
+        started = time.perf_counter()
+        try:
+            return self._lookup(isbn, cache, limiters, cancel_event)
+        finally:
+            with self._lock:
+                self.latencies.append(time.perf_counter() - started)
+
+    def _lookup(self, isbn, cache, limiters, cancel_event):
+        import requests
+
+        todo = []
+        for provider in self.providers:
+            if cache is not None:
+                found, payload = cache.get(isbn, provider.name)
+                if found:
+                    if payload:
+                        return provider.name, payload
+                    continue
+            todo.append(provider)
+
+        error = None
+        running = {}
+        hedge_at = None
+        while todo or running:
+            now = time.monotonic()
+            if todo and (not running or (hedge_at is not None and now >= hedge_at)):
+                provider = todo.pop(0)
+                running[self.pool.submit(self._fetch, provider, isbn, cache, limiters)] = provider
+                hedge_at = now + self.hedge_delay if self.hedge_delay is not None else None
+
+            if cancel_event is not None and cancel_event.is_set():
+                raise LookupCancelled(isbn)
+
+            step = POLL_INTERVAL if cancel_event is not None else None
+            if todo and hedge_at is not None:
+                step = max(0.0, min(step or hedge_at - now, hedge_at - now))
+            done, _ = wait(running, timeout=step, return_when=FIRST_COMPLETED)
+            for future in done:
+                provider = running.pop(future)
+                try:
+                    payload = future.result()
+                except (requests.RequestException, ValueError) as e:
+                    error = e
+                    continue
+                if payload:
+                    return provider.name, payload
+
+        if error is not None:
+            raise error
+        return None, None
+
+    def _fetch(self, provider, isbn, cache, limiters):
+        if limiters is not None and provider.name in limiters:
+            limiters[provider.name].acquire()
+        payload = provider.fetch(isbn)
+        if cache is not None:
+            cache.put(isbn, provider.name, payload)
+        return payload
+
+    def latency_percentiles(self):
+        with self._lock:
+            samples = sorted(self.latencies)
+        if not samples:
+            return {"count": 0, "p50": 0.0, "p99": 0.0}
+        return {
+            "count": len(samples),
+            "p50": samples[int(0.50 * (len(samples) - 1))],
+            "p99": samples[int(0.99 * (len(samples) - 1))],
+        }
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        for provider in self.providers:
+            provider.close()
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def default_client():
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = MetadataClient()
+        return _default_client
+
+
+# ====================================================
+#   STUB SERVER + LATENCY BENCHMARK
+# ====================================================
+def start_stub_server(google_delay=0.25, openlibrary_delay=0.1, google_miss_rate=0.3, seed=1):
+    """Serve fake Google Books / Open Library answers on localhost.
+
+    Returns (server, google_url, openlibrary_url).  Google misses a share of
+    ISBNs after its full delay, which is the case hedging is meant to fix.
+    """
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import urlparse, parse_qs
+
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+
+    def jitter(delay):
+        with rng_lock:
+            return delay * rng.uniform(0.5, 2.0)
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/google":
+                isbn = parse_qs(url.query)["q"][0].split(":", 1)[1]
+                time.sleep(jitter(google_delay))
+                miss = int(isbn[-4:]) % 100 < google_miss_rate * 100
+                body = {"totalItems": 0} if miss else {
+                    "items": [{"volumeInfo": {"title": f"Google {isbn}", "authors": ["Stub"]}}]}
+                self._send(200, body)
+            elif url.path.startswith("/openlibrary/"):
+                isbn = url.path.rsplit("/", 1)[1].split(".")[0]
+                time.sleep(jitter(openlibrary_delay))
+                self._send(200, {"title": f"Open Library {isbn}", "publish_date": "2001"})
+            else:
+                self._send(404, {})
+
+        def _send(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    return server, base + "/google?q=isbn:{isbn}", base + "/openlibrary/{isbn}.json"
+
+
+def run_benchmark(lookups=200, hedge_delay=0.1):
+    server, google_url, openlibrary_url = start_stub_server()
+    results = {}
+    try:
+        for label, delay in (("sequential", None), ("hedged", hedge_delay)):
+            client = MetadataClient(default_providers(google_url, openlibrary_url), hedge_delay=delay)
+            for i in range(lookups):
+                client.lookup(f"978000{i:07d}")
+            results[label] = client.latency_percentiles()
+            client.close()
+    finally:
+        server.shutdown()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Metadata client latency benchmark.")
+    parser.add_argument("--bench", action="store_true", help="compare sequential and hedged lookups")
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--hedge-delay", type=float, default=0.1)
+    args = parser.parse_args()
+    if args.bench:
+        for label, stats in run_benchmark(args.lookups, args.hedge_delay).items():
+            print(f"{label:>10}: n={stats['count']} p50={stats['p50'] * 1000:.1f}ms p99={stats['p99'] * 1000:.1f}ms")
+    else:
+        parser.print_help()
@@ -0,0 +1,376 @@
+import argparse
+import queue
+import random
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from email.message import EmailMessage
+
+from fines import overdue_loans
+from library_db import connect
+
+# ====================================================
+#   NOTIFICATION OUTBOX + DISPATCHER
+# ====================================================
+# The GUIs never send mail themselves; they add rows to the notifyoutbox
+# table.  A dispatcher claims pending rows in batches, sends them on a thread
+# pool over pooled SMTP connections, and records the outcome.  Failures are
+# retried with exponential backoff.  Each row carries a dedupe_key, so the
+# same notice is never queued twice for one recipient.  Every row names its
+# channel; the Dispatcher sends each through the transport given for that
+# channel (send(recipient, subject, body) and close()), so another channel
+# only needs a transport and the rows that use it.
+#
+# Queue tonight's notices, then send them to a local debug SMTP server:
+#   python notifications.py enqueue --overdue --due-soon 2
+#   python notifications.py enqueue --new-arrivals shipment.csv@1a2b...   # a bulk_import job
+#   python -m smtpd -n -c DebuggingServer localhost:1025     (Python <= 3.11)
+#   python notifications.py dispatch --smtp-host localhost --smtp-port 1025
+
+DEFAULT_SENDER = "library@example.org"
+DEFAULT_BATCH_SIZE = 200
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 30          # seconds; doubles on every failed attempt
+STALE_CLAIM = 15 * 60      # rows left in 'sending' this long are retried
+
+STATUS_PENDING = "pending"
+STATUS_SENDING = "sending"
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+
+
+def ensure_outbox(conn):
+    conn.executescript("""
+    CREATE TABLE IF NOT EXISTS notifyoutbox(
+        message_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        channel TEXT NOT NULL,
+        recipient TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        subject TEXT,
+        body TEXT NOT NULL,
+        dedupe_key TEXT UNIQUE,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL,
+        last_error TEXT,
+        created_at REAL NOT NULL,
+        sent_at REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_notifyoutbox_pending
+        ON notifyoutbox(next_attempt_at) WHERE status = 'pending';
+    """)
+    conn.commit()
+
+
+# ====================================================
+#   ENQUEUE
+# ====================================================
+OUTBOX_INSERT = """
+INSERT OR IGNORE INTO notifyoutbox(channel, recipient, kind, subject, body, dedupe_key,
+                                   next_attempt_at, created_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def enqueue_many(conn, messages):
+    """Queue (channel, recipient, kind, subject, body, dedupe_key) tuples.
+
+    Returns how many were new; duplicates of an existing dedupe_key are skipped.
+    """
+    now = time.time()
+    before = conn.total_changes
+    with conn:
+        conn.executemany(OUTBOX_INSERT, [tuple(m) + (now, now) for m in messages])
+    return conn.total_changes - before
+
+
+def enqueue(conn, channel, recipient, kind, subject, body, dedupe_key=None):
+    return enqueue_many(conn, [(channel, recipient, kind, subject, body, dedupe_key)])
+
+
+def _group_by_member(loans):
+    members = {}
+    for loan in loans:
+        members.setdefault(loan["member_id"], []).append(loan)
+    return members
+
+
+def enqueue_overdue_notices(conn, today=None):
+    """One overdue notice per member per day, listing all their overdue loans."""
+    today = today or date.today().isoformat()
+    messages = []
+    for member_id, loans in _group_by_member(overdue_loans(conn, today)).items():
+        email = loans[0]["email"]
+        if not email:
+            continue
+        lines = "\n".join(f"- {l['book']} (due {l['due_date']}, fine so far ${l['fine']:.2f})" for l in loans)
+        body = f"Dear {loans[0]['member']},\n\nThe following books are overdue:\n{lines}\n\nPlease return them soon."
+        messages.append(("email", email, "overdue", "Overdue library books", body,
+                         f"overdue:{member_id}:{today}"))
+    return enqueue_many(conn, messages)
+
+
+def enqueue_due_reminders(conn, days_ahead=2, today=None):
+    """One reminder per loan that falls due within `days_ahead` days."""
+    today = date.fromisoformat(today) if today else date.today()
+    until = (today + timedelta(days=days_ahead)).isoformat()
+    rows = conn.execute("""
+    SELECT t.transaction_id, m.email, m.first_name || ' ' || m.last_name, b.title, t.due_date
+    FROM transtb t INDEXED BY idx_transtb_open_due
+    JOIN membertb m ON m.member_id = t.member_id
+    LEFT JOIN booktb b ON b.book_id = t.book_id
+    WHERE t.return_date IS NULL AND t.due_date >= ? AND t.due_date <= ? AND m.email != ''
+    """, (today.isoformat(), until)).fetchall()
+    messages = [("email", email, "due", f"'{title}' is due on {due}",
+                 f"Dear {name},\n\n'{title}' is due back on {due}.", f"due:{txn_id}")
+                for txn_id, email, name, title, due in rows]
+    return enqueue_many(conn, messages)
+
+
+def enqueue_hold_ready(conn, hold_id):
+    """Queue the pick-up notice of a hold that has a copy set aside.
+
+    Does not commit: holds.py calls it inside the transaction that allocates
+    the copy, so the notice is queued if and only if the allocation sticks.
+    """
+    row = conn.execute("""
+    SELECT m.email, m.first_name || ' ' || m.last_name, b.title, h.expires_at
+    FROM holdtb h
+    JOIN membertb m ON m.member_id = h.member_id
+    JOIN booktb b ON b.book_id = h.book_id
+    WHERE h.hold_id = ?
+    """, (hold_id,)).fetchone()
+    if row is None or not row[0]:
+        return 0
+    email, name, title, expires = row
+    now = time.time()
+    return conn.execute(OUTBOX_INSERT, (
+        "email", email, "hold_ready", f"'{title}' is ready for pick-up",
+        f"Dear {name},\n\n'{title}' is waiting for you at the front desk until {expires}.",
+        f"hold:{hold_id}", now, now)).rowcount
+
+
+def enqueue_new_arrivals(conn, book_ids):
+    """A single new-arrivals digest to every active member with an email."""
+    if not book_ids:
+        return 0
+    titles = [row[0] for row in conn.execute(
+        f"SELECT title FROM booktb WHERE book_id IN ({','.join('?' * len(book_ids))})", list(book_ids))]
+    digest = "\n".join(f"- {t}" for t in titles)
+    batch = max(book_ids)
+    members = conn.execute("SELECT member_id, email, first_name FROM membertb WHERE status = 'active' AND email != ''")
+    return enqueue_many(conn, (("email", email, "new_arrival", "New books at the library",
+                                f"Dear {name},\n\nNew on our shelves:\n{digest}", f"new:{member_id}:{batch}")
+                               for member_id, email, name in members))
+
+
+# ====================================================
+#   TRANSPORTS
+# ====================================================
+class SmtpPool:
+    """A small pool of logged-in SMTP connections shared by the send workers."""
+
+    def __init__(self, host="localhost", port=25, size=4, username=None, password=None,
+                 starttls=False, timeout=30):
+        self.host, self.port, self.timeout = host, port, timeout
+        self.username, self.password, self.starttls = username, password, starttls
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            smtp.starttls()
+        if self.username:
+            smtp.login(self.username, self.password)
+        return smtp
+
+    def send(self, msg):
+        with self.slots:
+            try:
+                smtp = self.idle.get_nowait()
+            except queue.Empty:
+                smtp = self._connect()
+            try:
+                smtp.send_message(msg)
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                # Idle connection dropped by the server: reconnect once
+                smtp.close()
+                smtp = self._connect()
+                smtp.send_message(msg)
+            except Exception:
+                smtp.close()
+                raise
+            self.idle.put(smtp)
+
+    def close(self):
+        while True:
+            try:
+                smtp = self.idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                smtp.quit()
+            except smtplib.SMTPException:
+                smtp.close()
+
+
+class EmailTransport:
+    def __init__(self, pool, sender=DEFAULT_SENDER):
+        self.pool = pool
+        self.sender = sender
+
+    def send(self, recipient, subject, body):
+        msg = EmailMessage()
+        msg["From"] = self.sender
+        msg["To"] = recipient
+        msg["Subject"] = subject or "Library notice"
+        msg.set_content(body)
+        self.pool.send(msg)
+
+    def close(self):
+        self.pool.close()
+
+
+# ====================================================
+#   DISPATCHER
+# ====================================================
+class Dispatcher:
+    def __init__(self, conn, transports, workers=4, batch_size=DEFAULT_BATCH_SIZE,
+                 max_attempts=MAX_ATTEMPTS, backoff_base=BACKOFF_BASE):
+        self.conn = conn
+        self.transports = transports          # channel -> transport
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="notify")
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+
+    def claim_batch(self):
+        now = time.time()
+        with self.conn:
+            self.conn.execute("""
+            UPDATE notifyoutbox SET status = 'pending'
+            WHERE status = 'sending' AND next_attempt_at < ?
+            """, (now - STALE_CLAIM,))
+            return self.conn.execute("""
+            UPDATE notifyoutbox SET status = 'sending', next_attempt_at = ?
+            WHERE message_id IN (
+                SELECT message_id FROM notifyoutbox
+                WHERE status = 'pending' AND next_attempt_at <= ?
+                ORDER BY next_attempt_at LIMIT ?
+            )
+            RETURNING message_id, channel, recipient, subject, body, attempts
+            """, (now, now, self.batch_size)).fetchall()
+
+    def _send(self, message):
+        message_id, channel, recipient, subject, body, attempts = message
+        try:
+            self.transports[channel].send(recipient, subject, body)
+            return message_id, attempts, None
+        except Exception as e:
+            return message_id, attempts, f"{type(e).__name__}: {e}"
+
+    def run_once(self):
+        """Send one batch; returns (sent, failed) counts."""
+        batch = self.claim_batch()
+        if not batch:
+            return 0, 0
+        results = list(self.pool.map(self._send, batch))
+        now = time.time()
+        sent = [(now, message_id) for message_id, _, error in results if error is None]
+        retry = []
+        for message_id, attempts, error in results:
+            if error is None:
+                continue
+            attempts += 1
+            status = STATUS_FAILED if attempts >= self.max_attempts else STATUS_PENDING
+            delay = self.backoff_base * 2 ** (attempts - 1) * random.uniform(0.8, 1.2)
+            retry.append((status, attempts, now + delay, error, message_id))
+        with self.conn:
+            self.conn.executemany("UPDATE notifyoutbox SET status = 'sent', sent_at = ? WHERE message_id = ?",
+                                  sent)
+            self.conn.executemany("""
+            UPDATE notifyoutbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?
+            WHERE message_id = ?
+            """, retry)
+        return len(sent), len(retry)
+
+    def run(self, until_empty=True, idle_sleep=5.0, log=print):
+        """Dispatch until the queue is drained (or forever); returns a summary."""
+        started = time.perf_counter()
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = self.run_once()
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                elapsed = time.perf_counter() - started
+                log(f"sent {total_sent}, failed {total_failed} ({total_sent / elapsed:.1f} msg/s)")
+            elif until_empty:
+                break
+            else:
+                time.sleep(idle_sleep)
+        elapsed = time.perf_counter() - started
+        return {"sent": total_sent, "failed": total_failed, "seconds": round(elapsed, 3),
+                "messages_per_second": round(total_sent / elapsed, 1) if elapsed else 0.0}
+
+    def close(self):
+        self.pool.shutdown()
+        for transport in self.transports.values():
+            transport.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Library notification outbox.")
+    parser.add_argument("--db", default="library.db")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    enq = sub.add_parser("enqueue", help="queue due-date / overdue notices")
+    enq.add_argument("--overdue", action="store_true", help="one overdue notice per member")
+    enq.add_argument("--due-soon", type=int, metavar="DAYS", help="reminders for loans due within DAYS")
+    enq.add_argument("--new-arrivals", metavar="JOB", help="digest of the books a bulk_import job added")
+
+    disp = sub.add_parser("dispatch", help="send queued notifications")
+    disp.add_argument("--smtp-host", default="localhost")
+    disp.add_argument("--smtp-port", type=int, default=25)
+    disp.add_argument("--smtp-user")
+    disp.add_argument("--smtp-password")
+    disp.add_argument("--starttls", action="store_true")
+    disp.add_argument("--sender", default=DEFAULT_SENDER)
+    disp.add_argument("--workers", type=int, default=4, help="send threads (and SMTP connections)")
+    disp.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    disp.add_argument("--forever", action="store_true", help="keep polling instead of exiting when empty")
+
+    args = parser.parse_args(argv)
+    conn = connect(args.db)
+    ensure_outbox(conn)
+
+    if args.command == "enqueue":
+        from fines import ensure_fine_rules
+        ensure_fine_rules(conn)
+        if args.overdue:
+            print(f"Queued {enqueue_overdue_notices(conn)} overdue notice(s)")
+        if args.due_soon is not None:
+            print(f"Queued {enqueue_due_reminders(conn, args.due_soon)} due-date reminder(s)")
+        if args.new_arrivals:
+            from bulk_import import imported_book_ids
+            book_ids = imported_book_ids(conn, args.new_arrivals)
+            print(f"Queued {enqueue_new_arrivals(conn, book_ids)} new-arrival notice(s)")
+    else:
+        pool = SmtpPool(args.smtp_host, args.smtp_port, size=args.workers, username=args.smtp_user,
+                        password=args.smtp_password, starttls=args.starttls)
+        dispatcher = Dispatcher(conn, {"email": EmailTransport(pool, args.sender)},
+                                workers=args.workers, batch_size=args.batch_size)
+        try:
+            summary = dispatcher.run(until_empty=not args.forever)
+        finally:
+            dispatcher.close()
+        print(f"Sent {summary['sent']} message(s), {summary['failed']} failed, "
+              f"in {summary['seconds']}s ({summary['messages_per_second']} msg/s)")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,32 @@
+import time
+STARTED = time.perf_counter()   # taken before the other imports for the start-up report
+
+import gc
 import tkinter as tk
 from tkinter import ttk, messagebox
-from PIL import Image, ImageTk
 from datetime import datetime, timedelta
-import requests
+from tk_worker import TkWorker
+from loan_store import LoanError
+from library_client import loan_backend, LibraryClient, ServerError
+from library_stats import format_stats
+from popular_books import PopularityRanker, WINDOWS
+import instrumentation
+from library_db import connect
+from typeahead import load_catalog, attach_typeahead
+# Modules only one window or action needs are imported there, so start-up
+# loads just what the first paint uses
 
 # ====================================================
 #   LIBRARY MANAGEMENT SYSTEM WITH API INTEGRATION
 # ====================================================
 
+LOOKUP_TIMEOUT = 15  # seconds before the Add Book lookup gives up
+
+
 class LibraryApp(tk.Tk):
     def __init__(self):
+        self.startup = instrumentation.StartupTimer(STARTED)
+        self.startup.mark("imports")
         super().__init__()
         self.title("📚 Library Management System")
         self.geometry("1000x850")
@@ -19,31 +36,54 @@ class LibraryApp(tk.Tk):
         tk.Label(self, text="📘 Library Management Dashboard", font=("Arial", 22, "bold"),
                  bg="#283593", fg="white").pack(fill="x", pady=10)
 
-        # --- Sections ---
-        self.create_dashboard_section()
-        self.create_book_management_section()
-        self.create_member_management_section()
-        self.create_transaction_management_section()
-
-        # In-memory data
-        self.transactions = []
+        # Loans live in transtb (library.db), or behind library_server.py
+        self.loans = loan_backend()
+        self.popular = None         # loaded in _finish_startup
+        # Against library_server.py the server owns the database, the ranker
+        # and the statistics; this desk opens no connection and goes through the client
+        self.remote = isinstance(self.loans, LibraryClient)
+        self.conn = None if self.remote else self.loans.conn
+        self.catalog = None         # typeahead index, loaded in the background after that
+        self.startup.mark("database")
+
+        # --- Sections: one tab each, built the first time it is shown ---
+        self.txn_table = None       # built with the Transactions tab
+        self.sections = ttk.Notebook(self)
+        self.sections.pack(fill="both", expand=True, padx=10, pady=5)
+        self.section_builders = {}
+        for title, build in (("Dashboard", self.create_dashboard_section),
+                             ("Books", self.create_book_management_section),
+                             ("Members", self.create_member_management_section),
+                             ("Transactions", self.create_transaction_management_section)):
+            tab = tk.Frame(self.sections, bg="#f5f5f5")
+            self.sections.add(tab, text=title)
+            self.section_builders[str(tab)] = build
+        self.sections.bind("<<NotebookTabChanged>>", self._build_section)
+        self._build_section()       # the dashboard, shown first
+
+        # ISBN cache, worker threads and cover cache are built on first use
+        self._isbn_cache = self._worker = self._covers = None
+        self.lag_monitor = instrumentation.LagMonitor(self).start()
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.startup.mark("window")
+        self.after_idle(self._finish_startup)
 
     # ====================================================
     #   DASHBOARD SECTION
     # ====================================================
-    def create_dashboard_section(self):
-        dashboard_frame = tk.LabelFrame(self, text="Dashboard", font=("Arial", 14, "bold"),
+    def create_dashboard_section(self, parent):
+        dashboard_frame = tk.LabelFrame(parent, text="Dashboard", font=("Arial", 14, "bold"),
                                         padx=15, pady=10, bg="#e8eaf6")
         dashboard_frame.pack(fill="x", padx=20, pady=10)
 
-        stats_label = tk.Label(
+        self.stats_label = tk.Label(
             dashboard_frame,
-            text="📊 Key Statistics:\n• Total Books: \n• Total Members: \n• Books Issued: ",
+            text=format_stats(self.loans.stats()),
             font=("Arial", 12),
             justify="left",
             bg="#e8eaf6"
         )
-        stats_label.grid(row=0, column=0, sticky="w", padx=10, pady=5)
+        self.stats_label.grid(row=0, column=0, sticky="w", padx=10, pady=5)
 
         quick_actions = tk.Frame(dashboard_frame, bg="#e8eaf6")
         quick_actions.grid(row=0, column=1, padx=20)
@@ -60,16 +100,19 @@ class LibraryApp(tk.Tk):
 
         tk.Label(dashboard_frame, text="⭐ Popular Books", font=("Arial", 12, "bold"),
                  bg="#e8eaf6").grid(row=1, column=1, sticky="w", pady=10)
+        self.popular_window = tk.StringVar(value="30 days")
+        window_choice = ttk.Combobox(dashboard_frame, textvariable=self.popular_window, state="readonly",
+                                     width=9, values=[f"{w} days" for w in WINDOWS] + ["Top rated"])
+        window_choice.grid(row=1, column=1, sticky="e", pady=10)
+        window_choice.bind("<<ComboboxSelected>>", lambda e: self.refresh_popular())
         self.popular_list = tk.Listbox(dashboard_frame, width=40, height=5)
         self.popular_list.grid(row=2, column=1, pady=5)
-        for book in ["The Hobbit", "Pride and Prejudice", "The Great Gatsby", "1984"]:
-            self.popular_list.insert(tk.END, book)
 
     # ====================================================
     #   BOOK MANAGEMENT SECTION
     # ====================================================
-    def create_book_management_section(self):
-        book_frame = tk.LabelFrame(self, text="Book Management (API Integrated)",
+    def create_book_management_section(self, parent):
+        book_frame = tk.LabelFrame(parent, text="Book Management (API Integrated)",
                                    font=("Arial", 14, "bold"), padx=15, pady=10, bg="#e3f2fd")
         book_frame.pack(fill="x", padx=20, pady=10)
 
@@ -80,8 +123,8 @@ class LibraryApp(tk.Tk):
     # ====================================================
     #   MEMBER MANAGEMENT SECTION
     # ====================================================
-    def create_member_management_section(self):
-        member_frame = tk.LabelFrame(self, text="Member Management",
+    def create_member_management_section(self, parent):
+        member_frame = tk.LabelFrame(parent, text="Member Management",
                                      font=("Arial", 14, "bold"), padx=15, pady=10, bg="#f3e5f5")
         member_frame.pack(fill="x", padx=20, pady=10)
 
@@ -93,8 +136,8 @@ class LibraryApp(tk.Tk):
     # ====================================================
     #   TRANSACTION MANAGEMENT SECTION
     # ====================================================
-    def create_transaction_management_section(self):
-        txn_frame = tk.LabelFrame(self, text="Transaction Management", font=("Arial", 14, "bold"),
+    def create_transaction_management_section(self, parent):
+        txn_frame = tk.LabelFrame(parent, text="Transaction Management", font=("Arial", 14, "bold"),
                                   padx=15, pady=10, bg="#fff3e0")
         txn_frame.pack(fill="both", expand=True, padx=20, pady=10)
 
@@ -103,23 +146,38 @@ class LibraryApp(tk.Tk):
         ttk.Button(button_frame, text="Issue Book", command=self.open_issue_book_window).pack(side="left", padx=10)
         ttk.Button(button_frame, text="Return Book", command=self.open_return_book_window).pack(side="left", padx=10)
         ttk.Button(button_frame, text="View All Transactions", command=self.refresh_transaction_table).pack(side="left", padx=10)
-        ttk.Button(button_frame, text="Send Due Date Reminders", command=self.send_due_reminders).pack(side="left", padx=10)
-
+        if not self.remote:
+            # Against the server, reminders are queued on its host: python notifications.py enqueue
+            ttk.Button(button_frame, text="Send Due Date Reminders",
+                       command=self.send_due_reminders).pack(side="left", padx=10)
+        if instrumentation.ENABLED:
+            ttk.Button(button_frame, text="Diagnostics",
+                       command=self.open_diagnostics_window).pack(side="left", padx=10)
+
+        from txn_table import TransactionTable
         columns = ("member", "book", "issue_date", "due_date", "return_date", "fine")
         self.tree = ttk.Treeview(txn_frame, columns=columns, show="headings", height=10)
         for col in columns:
             self.tree.heading(col, text=col.replace("_", " ").title())
             self.tree.column(col, anchor="center", width=150)
+        scrollbar = ttk.Scrollbar(txn_frame, orient="vertical")
+        scrollbar.pack(side="right", fill="y", pady=10)
         self.tree.pack(fill="both", expand=True, pady=10)
+        self.txn_table = TransactionTable(self.tree, self.loans, scrollbar)
+        self.txn_table.refresh()
 
     # ====================================================
     #   POPUP WINDOWS (WITH API INTEGRATION)
     # ====================================================
 
     def open_add_book_window(self):
+        from isbn_cache import normalize_isbn
+        from book_lookup import lookup_isbn, book_record
+        from metadata_client import LookupCancelled
+
         win = tk.Toplevel(self)
         win.title("📕 Add New Book (ISBN Lookup)")
-        win.geometry("420x500")
+        win.geometry("420x720")
         win.config(bg="white")
 
         tk.Label(win, text="Enter ISBN (Auto-fetch details):", font=("Arial", 12), bg="white").pack(pady=5)
@@ -133,67 +191,101 @@ class LibraryApp(tk.Tk):
             tk.Label(win, text=f + ":", bg="white").pack(anchor="w", padx=20)
             e.pack(pady=2)
 
+        status = tk.Label(win, text="", fg="#555555", bg="white")
+        cover = tk.Label(win, bg="white")
+
         def fetch_book_data():
-            isbn = isbn_entry.get().strip()
-            if not isbn:
-                messagebox.showerror("Error", "Please enter an ISBN.")
+            raw = isbn_entry.get().strip()
+            if not raw:
+                messagebox.showerror("Error", "Please enter an ISBN.", parent=win)
+                return
+            isbn = normalize_isbn(raw)
+            if isbn is None:
+                messagebox.showerror("Error", f"'{raw}' is not a valid ISBN-10 or ISBN-13.", parent=win)
                 return
 
-            # Try Google Books API
-            g_api = f"https://www.googleapis.com/books/v1/volumes?q=isbn:{isbn}"
-            try:
-                res = requests.get(g_api)
-                data = res.json()
-                if "items" in data:
-                    info = data["items"][0]["volumeInfo"]
-                    entries["Title"].delete(0, tk.END)
-                    entries["Title"].insert(0, info.get("title", ""))
-                    entries["Author"].delete(0, tk.END)
-                    entries["Author"].insert(0, ", ".join(info.get("authors", [])))
-                    entries["Genre"].delete(0, tk.END)
-                    entries["Genre"].insert(0, ", ".join(info.get("categories", [])))
-                    entries["Publisher"].delete(0, tk.END)
-                    entries["Publisher"].insert(0, info.get("publisher", ""))
-                    entries["Year"].delete(0, tk.END)
-                    entries["Year"].insert(0, info.get("publishedDate", ""))
-                    entries["Description"].delete(0, tk.END)
-                    entries["Description"].insert(0, info.get("description", "")[:100])
-                    messagebox.showinfo("Success", "Book details fetched from Google Books API.")
-                    return
-            except Exception:
-                pass
-
-            # Fallback: Open Library API
-            ol_api = f"https://openlibrary.org/isbn/{isbn}.json"
-            try:
-                res = requests.get(ol_api)
-                if res.status_code == 200:
-                    info = res.json()
-                    entries["Title"].insert(0, info.get("title", ""))
-                    entries["Year"].insert(0, info.get("publish_date", ""))
-                    messagebox.showinfo("Success", "Book details fetched from Open Library API.")
-                else:
-                    messagebox.showwarning("Not Found", "No data found for this ISBN.")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to fetch data: {e}")
-
-        ttk.Button(win, text="Fetch Details", command=fetch_book_data).pack(pady=10)
+            # Google Books first, Open Library as fallback; runs off the Tk thread
+            fetch_button.config(state="disabled")
+            status.config(text="Looking up ISBN...")
+            self.worker.submit(lambda cancel: lookup_isbn(isbn, self.isbn_cache, cancel_event=cancel),
+                               on_done=show_book_data, on_error=show_lookup_error,
+                               timeout=LOOKUP_TIMEOUT, owner=win)
+
+        def show_book_data(result):
+            lookup_finished()
+            provider, data = result
+            if provider is not None:
+                self.covers.request(book_record("", provider, data)["cover_image_url"], show_cover, owner=win)
+            if provider == "google":
+                info = data["items"][0]["volumeInfo"]
+                set_field("Title", info.get("title", ""))
+                set_field("Author", ", ".join(info.get("authors", [])))
+                set_field("Genre", ", ".join(info.get("categories", [])))
+                set_field("Publisher", info.get("publisher", ""))
+                set_field("Year", info.get("publishedDate", ""))
+                set_field("Description", info.get("description", "")[:100])
+                messagebox.showinfo("Success", "Book details fetched from Google Books API.", parent=win)
+            elif provider == "openlibrary":
+                set_field("Title", data.get("title", ""))
+                set_field("Year", data.get("publish_date", ""))
+                messagebox.showinfo("Success", "Book details fetched from Open Library API.", parent=win)
+            else:
+                messagebox.showwarning("Not Found", "No data found for this ISBN.", parent=win)
+
+        def show_lookup_error(error):
+            lookup_finished()
+            if not isinstance(error, LookupCancelled):
+                messagebox.showerror("Error", f"Failed to fetch data: {error}", parent=win)
+
+        def show_cover(photo):
+            if win.winfo_exists():
+                cover.config(image=photo or "")
+                cover.image = photo
+
+        def lookup_finished():
+            fetch_button.config(state="normal")
+            status.config(text="")
+
+        def set_field(name, value):
+            entries[name].delete(0, tk.END)
+            entries[name].insert(0, value)
+
+        fetch_button = ttk.Button(win, text="Fetch Details", command=fetch_book_data)
+        fetch_button.pack(pady=10)
+        status.pack()
+        cover.pack()
+
+        def close_window():
+            self.worker.cancel_owner(win)
+            self.covers.cancel_owner(win)
+            win.destroy()
+
+        win.protocol("WM_DELETE_WINDOW", close_window)
 
+        @instrumentation.timed("save_book")
         def save_book():
             info = {k: v.get() for k, v in entries.items()}
             messagebox.showinfo("Saved", f"Book added:\n\n{info}")
-            win.destroy()
+            close_window()
 
         ttk.Button(win, text="Save Book", command=save_book).pack(pady=10)
 
     # --- Other Popups remain same (simplified) ---
     def open_update_book_window(self): self._open_popup("Update Book Details", "Edit existing book info.")
-    def open_search_books_window(self): self._open_popup("Search Books", "Search by title, author, or ISBN.")
+
+    def open_search_books_window(self):
+        from library_windows import open_search_books_window
+        open_search_books_window(self, self.loans, self.covers)
+
     def open_register_member_window(self): self._open_popup("Register Member", "Register a new library member.")
     def open_update_member_window(self): self._open_popup("Update Member", "Update existing member information.")
-    def open_borrow_history_window(self): self._open_popup("Borrow History", "View member borrowing history.")
 
-    # --- Email/SMS API Simulation ---
+    def open_borrow_history_window(self):
+        from library_windows import open_borrow_history_window
+        open_borrow_history_window(self, self.loans)
+
+
+    # --- Email/SMS Notifications ---
     def open_email_notify_window(self):
         win = tk.Toplevel(self)
         win.title("📩 Send Notifications")
@@ -209,7 +301,18 @@ class LibraryApp(tk.Tk):
         msg_box.pack(pady=5)
 
         def send_message():
-            messagebox.showinfo("Sent", f"Notification sent to {email.get()} (simulated).")
+            recipient = email.get().strip()
+            body = msg_box.get("1.0", tk.END).strip()
+            if not recipient or not body:
+                messagebox.showerror("Error", "Please enter an email and a message.", parent=win)
+                return
+            try:
+                self.loans.message(recipient, "Message from the library", body)
+            except ServerError as e:
+                messagebox.showerror("Error", str(e), parent=win)
+                return
+            messagebox.showinfo("Queued", f"Notification to {recipient} queued for sending.", parent=win)
+            win.destroy()
 
         ttk.Button(win, text="Send", command=send_message).pack(pady=10)
 
@@ -219,7 +322,7 @@ class LibraryApp(tk.Tk):
     def open_issue_book_window(self):
         win = tk.Toplevel(self)
         win.title("📗 Issue Book")
-        win.geometry("400x350")
+        win.geometry("400x390")
 
         tk.Label(win, text="Member Name:").pack(pady=5)
         member = tk.Entry(win, width=30)
@@ -228,6 +331,7 @@ class LibraryApp(tk.Tk):
         tk.Label(win, text="Book Title:").pack(pady=5)
         book = tk.Entry(win, width=30)
         book.pack()
+        self._add_typeahead(member, book)
 
         tk.Label(win, text="Issue Date:").pack(pady=5)
         issue = tk.Entry(win, width=30)
@@ -239,21 +343,36 @@ class LibraryApp(tk.Tk):
         due.insert(0, (datetime.now() + timedelta(days=7)).strftime("%Y-%m-%d"))
         due.pack()
 
+        @instrumentation.timed("save_issue")
         def save_issue():
-            txn = {
-                "member": member.get(),
-                "book": book.get(),
-                "issue_date": issue.get(),
-                "due_date": due.get(),
-                "return_date": None,
-                "fine": 0
-            }
-            self.transactions.append(txn)
-            self.refresh_transaction_table()
+            try:
+                txn = self.loans.checkout(member.get(), book.get(), issue.get(), due.get())
+            except (LoanError, ServerError) as e:
+                messagebox.showerror("Error", str(e), parent=win)
+                return
+            if self.txn_table is not None:
+                self.txn_table.row_changed(txn)
+            self.refresh_stats()
+            if not self.remote:
+                if self.popular is not None:
+                    self.popular.record_issue(txn["book_id"], txn["issue_date"])
+                from recommendations import refresh_related
+                refresh_related(self.conn)
+            self.refresh_popular()
             messagebox.showinfo("Issued", "Book issued successfully.")
             win.destroy()
 
+        def place_hold():
+            try:
+                hold = self.loans.place_hold(member.get(), book.get())
+            except (LoanError, ServerError) as e:
+                messagebox.showerror("Error", str(e), parent=win)
+                return
+            messagebox.showinfo("Hold Placed", f"Hold placed: number {hold['position']} in the queue.", parent=win)
+            win.destroy()
+
         ttk.Button(win, text="Save", command=save_issue).pack(pady=10)
+        ttk.Button(win, text="Place Hold", command=place_hold).pack()
 
     def open_return_book_window(self):
         win = tk.Toplevel(self)
@@ -267,46 +386,155 @@ class LibraryApp(tk.Tk):
         tk.Label(win, text="Book Title:").pack(pady=5)
         book = tk.Entry(win, width=30)
         book.pack()
+        self._add_typeahead(member, book)
 
         tk.Label(win, text="Return Date:").pack(pady=5)
         ret = tk.Entry(win, width=30)
         ret.insert(0, datetime.now().strftime("%Y-%m-%d"))
         ret.pack()
 
+        @instrumentation.timed("process_return")
         def process_return():
-            fine = 0
-            today = datetime.now().date()
-            for txn in self.transactions:
-                if txn["member"] == member.get() and txn["book"] == book.get() and not txn["return_date"]:
-                    due = datetime.strptime(txn["due_date"], "%Y-%m-%d").date()
-                    if today > due:
-                        fine = (today - due).days
-                    txn["return_date"] = ret.get()
-                    txn["fine"] = fine
-                    break
-            self.refresh_transaction_table()
-            messagebox.showinfo("Returned", f"Book returned. Fine: ${fine}")
+            try:
+                txn = self.loans.checkin(member.get(), book.get(), ret.get())
+            except (LoanError, ServerError) as e:
+                messagebox.showerror("Error", str(e), parent=win)
+                return
+            fine = txn["fine"]
+            if self.txn_table is not None:
+                self.txn_table.row_changed(txn)
+            self.refresh_stats()
+            message = f"Book returned. Fine: ${fine}"
+            if txn.get("hold"):
+                message += f"\nSet this copy aside: a hold for member #{txn['hold']['member_id']} is now ready."
+            messagebox.showinfo("Returned", message)
             win.destroy()
 
         ttk.Button(win, text="Return", command=process_return).pack(pady=15)
 
+    @instrumentation.timed()
     def refresh_transaction_table(self):
-        for row in self.tree.get_children():
-            self.tree.delete(row)
-        for t in self.transactions:
-            self.tree.insert("", "end", values=(
-                t["member"], t["book"], t["issue_date"], t["due_date"],
-                t["return_date"], f"${t['fine']}"
-            ))
+        if self.txn_table is not None:
+            self.txn_table.refresh()
+        self.refresh_stats()
+
+    def open_diagnostics_window(self):
+        from library_windows import open_diagnostics_window
+        open_diagnostics_window(self)
+
+    def refresh_stats(self):
+        self.stats_label.config(text=format_stats(self.loans.stats()))
+
+    @instrumentation.timed()
+    def refresh_popular(self):
+        choice = self.popular_window.get()
+        self.popular_list.delete(0, tk.END)
+        if choice == "Top rated":
+            from ratings import format_rating
+            for book in self.loans.top_rated(k=10):
+                self.popular_list.insert(tk.END, f"{book['title']} ({format_rating(book)})")
+            return
+        window = int(choice.split()[0])
+        if self.remote:
+            ranked = self.loans.popular(window, k=10)
+        elif self.popular is None:
+            return
+        else:
+            ranked = self.popular.top_titles(window, k=10)
+        for title, issues in ranked:
+            self.popular_list.insert(tk.END, f"{title} ({issues})")
 
     def send_due_reminders(self):
-        today = datetime.now().date()
-        overdue = [t for t in self.transactions if not t["return_date"] and datetime.strptime(t["due_date"], "%Y-%m-%d").date() < today]
-        if overdue:
-            msg = "\n".join([f"{t['member']} - '{t['book']}' (Due: {t['due_date']})" for t in overdue])
-            messagebox.showinfo("Reminders", f"Due reminders sent to:\n\n{msg}")
+        from notifications import enqueue_overdue_notices, enqueue_due_reminders
+        path = self.conn.execute("PRAGMA database_list").fetchone()[2]
+
+        def enqueue_all(cancel):
+            # The overdue scan and the inserts run on the worker, on a connection of its own
+            conn = connect(path)
+            try:
+                return enqueue_overdue_notices(conn), enqueue_due_reminders(conn)
+            finally:
+                conn.close()
+
+        def queued(counts):
+            overdue, due = counts
+            if overdue or due:
+                messagebox.showinfo("Reminders", f"{overdue} overdue notice(s) and {due} due-date reminder(s) "
+                                                 "queued.\nThey are sent by: python notifications.py dispatch")
+            else:
+                messagebox.showinfo("Reminders", "No new reminders to send.")
+
+        def failed(error):
+            messagebox.showerror("Reminders", f"Could not queue the reminders: {error}")
+
+        self.worker.submit(enqueue_all, queued, failed)
+
+    @property
+    def isbn_cache(self):
+        if self._isbn_cache is None:
+            from isbn_cache import IsbnCache
+            self._isbn_cache = IsbnCache()
+        return self._isbn_cache
+
+    @property
+    def worker(self):
+        if self._worker is None:
+            self._worker = TkWorker(self)
+        return self._worker
+
+    @property
+    def covers(self):
+        if self._covers is None:
+            from cover_cache import CoverCache
+            self._covers = CoverCache(self.worker)
+        return self._covers
+
+    def _build_section(self, event=None):
+        tab = self.sections.select()
+        build = self.section_builders.pop(tab, None)
+        if build is not None:
+            build(self.nametowidget(tab))
+
+    def _finish_startup(self):
+        # Runs once the main loop has drawn the window: the slower fills
+        # (popularity buckets) happen here; the transactions load with their tab
+        self.update_idletasks()
+        self.startup.mark("first_paint")
+        if not self.remote:
+            self.popular = PopularityRanker(self.conn)
+        self.refresh_popular()
+        self.startup.mark("data")
+        self.startup.report()
+        if not self.remote:
+            # The typeahead index reads the catalog tables; a desk on the server goes without
+            load_catalog(self.worker, self.conn, self._catalog_loaded)
+
+    # --- Member/book typeahead (typeahead.py) ---
+    def _catalog_loaded(self, catalog):
+        self.catalog = catalog
+        # The index's millions of long-lived keys would otherwise make every
+        # full GC pass stall a keystroke (~40ms); this app keeps them for good
+        gc.freeze()
+
+    def _add_typeahead(self, member, book):
+        if self.catalog is not None:
+            self.catalog.refresh()
+        attach_typeahead(member, lambda text: self.catalog.suggest_members(text) if self.catalog else [])
+        attach_typeahead(book, lambda text: self.catalog.suggest_books(text) if self.catalog else [])
+
+    def on_close(self):
+        self.lag_monitor.stop()
+        if self._worker is not None:
+            self._worker.shutdown()
+        if self._isbn_cache is not None:
+            self._isbn_cache.close()
+        if self._covers is not None:
+            self._covers.close()
+        if self.remote:
+            self.loans.close()
         else:
-            messagebox.showinfo("Reminders", "No overdue books.")
+            self.conn.close()
+        self.destroy()
 
     def _open_popup(self, title, text):
         popup = tk.Toplevel(self)
@@ -0,0 +1,205 @@
+import argparse
+import heapq
+import sqlite3
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+from library_db import connect
+
+# ====================================================
+#   POPULAR BOOKS (ROLLING WINDOWS)
+# ====================================================
+# Issues are bucketed per (day, book) in circdaily, which a trigger on transtb
+# keeps current.  PopularityRanker loads the buckets of the longest window
+# once and then maintains one Counter per window incrementally: a new issue
+# adds 1 to every window, and when the day rolls over the buckets that fell
+# out of a window are subtracted.  Nothing re-reads the transaction history.
+#
+# Issues made by other processes (other desks, the server) are noticed by
+# comparing the librarystats loan total with the one last seen: today's
+# buckets are re-read and the difference applied, and only when that does
+# not account for every new loan (a back-dated issue) is everything reloaded.
+# Each window also keeps its TOP_KEPT leaders up to date as counts grow, so
+# top() sorts a few dozen books instead of every book issued in the window.
+#
+#   python popular_books.py --window 30 --top 10 [--category Fantasy]
+
+WINDOWS = (7, 30, 365)
+TOP_KEPT = 50
+
+
+def ensure_circulation_buckets(conn):
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'circdaily'").fetchone()
+    conn.executescript("""
+    CREATE TABLE IF NOT EXISTS circdaily(
+        day TEXT NOT NULL,
+        book_id INTEGER NOT NULL,
+        issues INTEGER NOT NULL,
+        PRIMARY KEY (day, book_id)
+    ) WITHOUT ROWID;
+
+    CREATE TRIGGER IF NOT EXISTS circdaily_trans_ai AFTER INSERT ON transtb
+    WHEN new.issue_date IS NOT NULL BEGIN
+        INSERT INTO circdaily(day, book_id, issues) VALUES (date(new.issue_date), new.book_id, 1)
+        ON CONFLICT(day, book_id) DO UPDATE SET issues = issues + 1;
+    END;
+    """)
+    if not exists:
+        conn.execute("""
+        INSERT INTO circdaily(day, book_id, issues)
+        SELECT date(issue_date), book_id, COUNT(*) FROM transtb
+        WHERE issue_date IS NOT NULL AND date(issue_date) IS NOT NULL
+        GROUP BY 1, 2
+        """)
+    conn.commit()
+
+
+class PopularityRanker:
+    def __init__(self, conn, windows=WINDOWS, today=None, clock=date.today):
+        self.conn = conn
+        self.windows = tuple(sorted(windows))
+        self.clock = clock
+        self.today = today or clock()
+        self.buckets = defaultdict(Counter)              # date -> Counter(book_id)
+        self.counts = {w: Counter() for w in self.windows}
+        self.leaders = {w: {} for w in self.windows}     # the TOP_KEPT largest of counts[w]
+        self.categories = {}
+        self.loans_seen = None
+        self.reload()
+
+    def reload(self):
+        """Load the buckets of the longest window from circdaily."""
+        self.loans_seen = self._loans()
+        self.buckets.clear()
+        for counter in self.counts.values():
+            counter.clear()
+        first = self.today - timedelta(days=self.windows[-1] - 1)
+        for day, book_id, issues in self.conn.execute(
+                "SELECT day, book_id, issues FROM circdaily WHERE day >= ?", (first.isoformat(),)):
+            day = date.fromisoformat(day)
+            if day > self.today:
+                continue
+            self.buckets[day][book_id] += issues
+            for window in self.windows:
+                if (self.today - day).days < window:
+                    self.counts[window][book_id] += issues
+        for window in self.windows:
+            self._rank(window)
+
+    def _loans(self):
+        try:
+            row = self.conn.execute("SELECT value FROM librarystats WHERE name = 'total_loans'").fetchone()
+        except sqlite3.OperationalError:
+            return None     # no library_stats counters: only this process's issues are seen
+        return row[0] if row else None
+
+    def sync(self):
+        """Take in the issues other processes recorded since the last look."""
+        loans = self._loans()
+        if loans is None or self.loans_seen is None or loans == self.loans_seen:
+            return
+        bucket = self.buckets[self.today]
+        stored = self.conn.execute("SELECT book_id, issues FROM circdaily WHERE day = ?",
+                                   (self.today.isoformat(),))
+        delta = {book_id: issues - bucket[book_id] for book_id, issues in stored if issues != bucket[book_id]}
+        if sum(delta.values()) != loans - self.loans_seen or any(n < 0 for n in delta.values()):
+            self.reload()
+            return
+        for book_id, n in delta.items():
+            bucket[book_id] += n
+            for window in self.windows:
+                self._add(window, book_id, n)
+        self.loans_seen = loans
+
+    def _rank(self, window):
+        self.leaders[window] = dict(heapq.nlargest(TOP_KEPT, self.counts[window].items(),
+                                                   key=lambda item: item[1]))
+
+    def _add(self, window, book_id, n):
+        counts, leaders = self.counts[window], self.leaders[window]
+        counts[book_id] += n
+        if book_id in leaders or len(leaders) < TOP_KEPT:
+            leaders[book_id] = counts[book_id]
+            return
+        lowest = min(leaders, key=leaders.get)
+        if counts[book_id] > leaders[lowest]:
+            del leaders[lowest]
+            leaders[book_id] = counts[book_id]
+
+    def advance(self, today=None):
+        """Move the windows forward to `today`, dropping expired buckets."""
+        today = today or self.clock()
+        while self.today < today:
+            self.today += timedelta(days=1)
+            for window in self.windows:
+                expired = self.buckets.get(self.today - timedelta(days=window))
+                if expired:
+                    self.counts[window].subtract(expired)
+                    self.counts[window] += Counter()   # drop zero counts
+                    self._rank(window)
+            self.buckets.pop(self.today - timedelta(days=self.windows[-1]), None)
+
+    def record_issue(self, book_id, issue_day=None):
+        """Count one issue made on `issue_day` (date or YYYY-MM-DD)."""
+        if self.loans_seen is not None:
+            self.loans_seen += 1    # this process's own loan, already counted here
+        if isinstance(issue_day, str):
+            try:
+                issue_day = date.fromisoformat(issue_day[:10])
+            except ValueError:
+                return  # not a YYYY-MM-DD date; circdaily skips it too
+        self.advance()
+        issue_day = issue_day or self.today
+        age = (self.today - issue_day).days
+        if age < 0 or age >= self.windows[-1]:
+            return  # dated in the future (a typo must not move "today") or too old
+        self.buckets[issue_day][book_id] += 1
+        for window in self.windows:
+            if age < window:
+                self._add(window, book_id, 1)
+
+    def top(self, window=30, k=10, category=None):
+        """[(book_id, issues)] for the k most issued books in the window."""
+        self.advance()
+        self.sync()
+        counts = self.counts[window]
+        if category is None:
+            ranked = self.leaders[window].items() if k <= TOP_KEPT else counts.items()
+            return heapq.nlargest(k, ranked, key=lambda item: item[1])
+        self._load_categories(counts)
+        return heapq.nlargest(k, ((b, n) for b, n in counts.items() if self.categories.get(b) == category),
+                              key=lambda item: item[1])
+
+    def top_titles(self, window=30, k=10, category=None):
+        """[(title, issues)] for the dashboard widget."""
+        ranked = self.top(window, k, category)
+        if not ranked:
+            return []
+        ids = [book_id for book_id, _ in ranked]
+        titles = dict(self.conn.execute(
+            f"SELECT book_id, title FROM booktb WHERE book_id IN ({','.join('?' * len(ids))})", ids))
+        return [(titles.get(book_id, f"#{book_id}"), n) for book_id, n in ranked]
+
+    def _load_categories(self, counts):
+        missing = [b for b in counts if b not in self.categories]
+        for i in range(0, len(missing), 500):
+            chunk = missing[i:i + 500]
+            self.categories.update(self.conn.execute(
+                f"SELECT book_id, category FROM booktb WHERE book_id IN ({','.join('?' * len(chunk))})", chunk))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Most issued books in a rolling window.")
+    parser.add_argument("--db", default="library.db")
+    parser.add_argument("--window", type=int, choices=WINDOWS, default=30)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--category")
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    ensure_circulation_buckets(conn)
+    ranker = PopularityRanker(conn)
+    for rank, (title, issues) in enumerate(ranker.top_titles(args.window, args.top, args.category), 1):
+        print(f"{rank:>3}. {title} ({issues} issues)")
+    conn.close()
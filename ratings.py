@@ -0,0 +1,146 @@
+import argparse
+
+from library_db import connect
+
+# ====================================================
+#   BOOK RATINGS
+# ====================================================
+# One bookratings row per reviewed book holds the review count, the sum of
+# the ratings and a 1-5 star histogram.  Triggers on bookreviewtb apply every
+# insert, delete and change of rating/book_id as a +1/-1 delta, so a book's
+# rating is a primary-key lookup and never a GROUP BY over the reviews.
+#
+# "Top rated" orders by a damped average that starts every book at
+# PRIOR_MEAN with PRIOR_WEIGHT phantom reviews, so one 5-star review does not
+# outrank fifty 4.8s.  It is a stored generated column with an index (and a
+# second one per category), so the top-k queries read k index entries.
+#
+#   python ratings.py --book 42
+#   python ratings.py --top 10 [--category Fantasy] [--min-ratings 5]
+#   python ratings.py --rebuild
+
+PRIOR_MEAN = 3.0
+PRIOR_WEIGHT = 5
+STARS = (1, 2, 3, 4, 5)
+
+
+def _apply(r, sign):
+    """UPSERT adding (sign=1) or removing (sign=-1) review row `r` to its book."""
+    stars = ", ".join(f"{sign} * ({r}.rating = {n})" for n in STARS)
+    return f"""
+        INSERT INTO bookratings(book_id, category, ratings, rating_sum, {", ".join(f"stars{n}" for n in STARS)})
+        VALUES ({r}.book_id, (SELECT category FROM booktb WHERE book_id = {r}.book_id),
+                {sign}, {sign} * {r}.rating, {stars})
+        ON CONFLICT(book_id) DO UPDATE SET
+            ratings = ratings + excluded.ratings,
+            rating_sum = rating_sum + excluded.rating_sum,
+            {", ".join(f"stars{n} = stars{n} + excluded.stars{n}" for n in STARS)};"""
+
+
+def ensure_ratings(conn):
+    """Create the ratings table, indexes and triggers; count once if new."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'bookratings'").fetchone()
+    conn.executescript(f"""
+    CREATE TABLE IF NOT EXISTS bookratings(
+        book_id INTEGER PRIMARY KEY,
+        category TEXT,
+        ratings INTEGER NOT NULL DEFAULT 0,
+        rating_sum INTEGER NOT NULL DEFAULT 0,
+        {", ".join(f"stars{n} INTEGER NOT NULL DEFAULT 0" for n in STARS)},
+        average REAL GENERATED ALWAYS AS (CASE WHEN ratings > 0 THEN 1.0 * rating_sum / ratings END) VIRTUAL,
+        score REAL GENERATED ALWAYS AS
+            (({PRIOR_WEIGHT} * {PRIOR_MEAN} + rating_sum) / ({PRIOR_WEIGHT} + ratings)) STORED
+    );
+    CREATE INDEX IF NOT EXISTS idx_bookratings_score ON bookratings(score DESC, ratings);
+    CREATE INDEX IF NOT EXISTS idx_bookratings_category ON bookratings(category, score DESC, ratings);
+
+    CREATE TRIGGER IF NOT EXISTS bookratings_review_ai AFTER INSERT ON bookreviewtb BEGIN
+        {_apply("new", 1)}
+    END;
+    CREATE TRIGGER IF NOT EXISTS bookratings_review_ad AFTER DELETE ON bookreviewtb BEGIN
+        {_apply("old", -1)}
+    END;
+    CREATE TRIGGER IF NOT EXISTS bookratings_review_au AFTER UPDATE OF book_id, rating ON bookreviewtb BEGIN
+        {_apply("old", -1)}
+        {_apply("new", 1)}
+    END;
+    CREATE TRIGGER IF NOT EXISTS bookratings_book_au AFTER UPDATE OF category ON booktb BEGIN
+        UPDATE bookratings SET category = new.category WHERE book_id = new.book_id;
+    END;
+    """)
+    if not exists:
+        rebuild_ratings(conn)
+    conn.commit()
+
+
+def rebuild_ratings(conn):
+    with conn:
+        conn.execute("DELETE FROM bookratings")
+        conn.execute(f"""
+        INSERT INTO bookratings(book_id, category, ratings, rating_sum, {", ".join(f"stars{n}" for n in STARS)})
+        SELECT r.book_id, b.category, COUNT(*), SUM(r.rating), {", ".join(f"SUM(r.rating = {n})" for n in STARS)}
+        FROM bookreviewtb r LEFT JOIN booktb b ON b.book_id = r.book_id
+        GROUP BY r.book_id
+        """)
+
+
+def _rating_from_row(row):
+    return {"book_id": row[0], "ratings": row[1], "average": row[2], "score": row[3],
+            "stars": dict(zip(STARS, row[4:9])), "title": row[9], "author": row[10]}
+
+
+RATING_SELECT = f"""
+SELECT r.book_id, r.ratings, r.average, r.score, {", ".join(f"r.stars{n}" for n in STARS)}, b.title, b.author
+FROM bookratings r {{index}} JOIN booktb b ON b.book_id = r.book_id
+"""
+
+
+def book_rating(conn, book_id):
+    """{ratings, average, score, stars: {1..5: n}, ...} or None if never reviewed."""
+    row = conn.execute(RATING_SELECT.format(index="") + "WHERE r.book_id = ?", (book_id,)).fetchone()
+    return _rating_from_row(row) if row and row[1] > 0 else None
+
+
+def top_rated(conn, k=10, category=None, min_ratings=1):
+    """The k best rated books (damped average), optionally in one category."""
+    if category is None:
+        rows = conn.execute(RATING_SELECT.format(index="INDEXED BY idx_bookratings_score")
+                            + "WHERE r.ratings >= ? ORDER BY r.score DESC LIMIT ?", (min_ratings, k))
+    else:
+        rows = conn.execute(RATING_SELECT.format(index="INDEXED BY idx_bookratings_category")
+                            + "WHERE r.category = ? AND r.ratings >= ? ORDER BY r.score DESC LIMIT ?",
+                            (category, min_ratings, k))
+    return [_rating_from_row(row) for row in rows]
+
+
+def format_rating(rating):
+    if rating is None:
+        return "No ratings yet"
+    return f"★ {rating['average']:.1f} ({rating['ratings']} rating{'s' if rating['ratings'] != 1 else ''})"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trigger-maintained book ratings.")
+    parser.add_argument("--db", default="library.db")
+    parser.add_argument("--book", type=int, help="show one book's rating and histogram")
+    parser.add_argument("--top", type=int, help="show the N best rated books")
+    parser.add_argument("--category")
+    parser.add_argument("--min-ratings", type=int, default=1)
+    parser.add_argument("--rebuild", action="store_true", help="recount from scratch")
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    ensure_ratings(conn)
+    if args.rebuild:
+        rebuild_ratings(conn)
+    if args.book is not None:
+        rating = book_rating(conn, args.book)
+        print(format_rating(rating))
+        if rating:
+            for n in reversed(STARS):
+                print(f"{n}★ {rating['stars'][n]:>6}")
+    if args.top:
+        for rank, book in enumerate(top_rated(conn, args.top, args.category, args.min_ratings), 1):
+            print(f"{rank:>3}. {book['title']} by {book['author']} - {format_rating(book)}")
+    conn.close()
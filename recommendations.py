@@ -0,0 +1,233 @@
+import argparse
+import time
+
+from library_db import connect
+from borrow_history import ensure_history_index
+
+# ====================================================
+#   RELATED BOOKS (ITEM-TO-ITEM)
+# ====================================================
+# bookpairs is a sparse book x book matrix, one row per pair (book_a < book_b)
+# that has ever been related:
+#   co_borrows   times one member borrowed both within CO_BORROW_DAYS
+#   co_ratings   times one member rated both LIKED_RATING or better
+# Triggers on transtb and bookreviewtb add each new loan/review to the matrix
+# as it is inserted (a few index probes on the member's own history) and mark
+# the books involved in relateddirty.  A review whose rating, book or member
+# changes, or that is deleted, takes its co-ratings back out the same way.
+# refresh_related() recomputes the top-N list of just those books into
+# relatedbooks, so the book detail view reads its "related books" with one
+# primary key range scan.
+#
+# ensure_recommendations() only creates the tables and triggers; on a file
+# that already has loans, the history before that is counted by an explicit
+# --rebuild (about 30s for 2M loans), run once after upgrading or from the
+# nightly job, never during app start.
+#
+#   python recommendations.py --book 42            # related books for book 42
+#   python recommendations.py --refresh            # flush the dirty lists
+#   python recommendations.py --rebuild            # recount from scratch
+
+TOP_N = 10
+CO_BORROW_DAYS = 90
+LIKED_RATING = 4
+CO_RATING_WEIGHT = 2      # a shared high rating counts as two co-borrows
+
+# Other loans of new.member_id close to new.issue_date (one row per related loan)
+_CO_BORROWED = f"""
+    FROM transtb e
+    WHERE e.member_id = new.member_id
+      AND e.issue_date BETWEEN date(new.issue_date, '-{CO_BORROW_DAYS} days')
+                           AND date(new.issue_date, '+{CO_BORROW_DAYS} days')
+      AND e.transaction_id < new.transaction_id AND e.book_id != new.book_id
+"""
+_CO_RATED = f"""
+    FROM bookreviewtb e
+    WHERE e.member_id = new.member_id AND e.rating >= {LIKED_RATING}
+      AND e.review_id < new.review_id AND e.book_id != new.book_id
+"""
+# The member's other liked reviews, for a review being changed or deleted
+# (`r` is new or old); unlike _CO_RATED this includes later reviews too
+_CO_RATED_BY = f"""
+    FROM bookreviewtb e
+    WHERE e.member_id = {{r}}.member_id AND e.rating >= {LIKED_RATING}
+      AND e.review_id != {{r}}.review_id AND e.book_id != {{r}}.book_id
+"""
+
+
+def _co_rating_delta(r, delta):
+    """Trigger body adding `delta` to the co-ratings of review `r`."""
+    co_rated = _CO_RATED_BY.format(r=r)
+    return f"""
+        INSERT INTO bookpairs(book_a, book_b, co_ratings)
+        SELECT MIN(e.book_id, {r}.book_id), MAX(e.book_id, {r}.book_id), {delta} {co_rated}
+        ON CONFLICT(book_a, book_b) DO UPDATE SET co_ratings = co_ratings + ({delta});
+        INSERT OR IGNORE INTO relateddirty(book_id) SELECT e.book_id {co_rated};
+        INSERT OR IGNORE INTO relateddirty(book_id) VALUES ({r}.book_id);"""
+
+
+def ensure_recommendations(conn):
+    ensure_history_index(conn)      # the triggers look up the member's loans through it
+    conn.executescript(f"""
+    CREATE TABLE IF NOT EXISTS bookpairs(
+        book_a INTEGER NOT NULL,
+        book_b INTEGER NOT NULL,
+        co_borrows INTEGER NOT NULL DEFAULT 0,
+        co_ratings INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (book_a, book_b)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_bookpairs_b ON bookpairs(book_b, book_a, co_borrows, co_ratings);
+
+    CREATE TABLE IF NOT EXISTS relatedbooks(
+        book_id INTEGER NOT NULL,
+        rank INTEGER NOT NULL,
+        related_id INTEGER NOT NULL,
+        score INTEGER NOT NULL,
+        PRIMARY KEY (book_id, rank)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS relateddirty(book_id INTEGER PRIMARY KEY);
+
+    CREATE INDEX IF NOT EXISTS idx_bookreviewtb_member ON bookreviewtb(member_id, rating, book_id);
+
+    CREATE TRIGGER IF NOT EXISTS bookpairs_trans_ai AFTER INSERT ON transtb
+    WHEN new.issue_date IS NOT NULL BEGIN
+        INSERT INTO bookpairs(book_a, book_b, co_borrows)
+        SELECT MIN(e.book_id, new.book_id), MAX(e.book_id, new.book_id), 1 {_CO_BORROWED}
+        ON CONFLICT(book_a, book_b) DO UPDATE SET co_borrows = co_borrows + 1;
+        INSERT OR IGNORE INTO relateddirty(book_id) SELECT e.book_id {_CO_BORROWED};
+        INSERT OR IGNORE INTO relateddirty(book_id) VALUES (new.book_id);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS bookpairs_review_ai AFTER INSERT ON bookreviewtb
+    WHEN new.rating >= {LIKED_RATING} BEGIN
+        INSERT INTO bookpairs(book_a, book_b, co_ratings)
+        SELECT MIN(e.book_id, new.book_id), MAX(e.book_id, new.book_id), 1 {_CO_RATED}
+        ON CONFLICT(book_a, book_b) DO UPDATE SET co_ratings = co_ratings + 1;
+        INSERT OR IGNORE INTO relateddirty(book_id) SELECT e.book_id {_CO_RATED};
+        INSERT OR IGNORE INTO relateddirty(book_id) VALUES (new.book_id);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS bookpairs_review_au_old
+    AFTER UPDATE OF rating, book_id, member_id ON bookreviewtb
+    WHEN old.rating >= {LIKED_RATING} BEGIN
+        {_co_rating_delta("old", -1)}
+        DELETE FROM bookpairs WHERE co_borrows = 0 AND co_ratings = 0
+            AND (book_a = old.book_id OR book_b = old.book_id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS bookpairs_review_au_new
+    AFTER UPDATE OF rating, book_id, member_id ON bookreviewtb
+    WHEN new.rating >= {LIKED_RATING} BEGIN
+        {_co_rating_delta("new", 1)}
+    END;
+    CREATE TRIGGER IF NOT EXISTS bookpairs_review_ad AFTER DELETE ON bookreviewtb
+    WHEN old.rating >= {LIKED_RATING} BEGIN
+        {_co_rating_delta("old", -1)}
+        DELETE FROM bookpairs WHERE co_borrows = 0 AND co_ratings = 0
+            AND (book_a = old.book_id OR book_b = old.book_id);
+    END;
+    """)
+    conn.commit()
+
+
+def rebuild_recommendations(conn):
+    """Recount bookpairs from the whole history and recompute every list."""
+    with conn:
+        conn.execute("DELETE FROM bookpairs")
+        conn.execute(f"""
+        INSERT INTO bookpairs(book_a, book_b, co_borrows)
+        SELECT MIN(t.book_id, e.book_id), MAX(t.book_id, e.book_id), COUNT(*)
+        FROM transtb t
+        JOIN transtb e INDEXED BY idx_transtb_member_history
+          ON e.member_id = t.member_id
+         AND e.issue_date BETWEEN date(t.issue_date, '-{CO_BORROW_DAYS} days')
+                              AND date(t.issue_date, '+{CO_BORROW_DAYS} days')
+         AND e.transaction_id < t.transaction_id AND e.book_id != t.book_id
+        WHERE t.issue_date IS NOT NULL
+        GROUP BY 1, 2
+        """)
+        conn.execute(f"""
+        INSERT INTO bookpairs(book_a, book_b, co_ratings)
+        SELECT MIN(r.book_id, e.book_id), MAX(r.book_id, e.book_id), COUNT(*)
+        FROM bookreviewtb r
+        JOIN bookreviewtb e INDEXED BY idx_bookreviewtb_member
+          ON e.member_id = r.member_id AND e.rating >= {LIKED_RATING}
+         AND e.review_id < r.review_id AND e.book_id != r.book_id
+        WHERE r.rating >= {LIKED_RATING}
+        GROUP BY 1, 2
+        ON CONFLICT(book_a, book_b) DO UPDATE SET co_ratings = excluded.co_ratings
+        """)
+        conn.execute("DELETE FROM relatedbooks")
+        conn.execute("DELETE FROM relateddirty")
+        conn.execute(f"""
+        INSERT INTO relatedbooks(book_id, rank, related_id, score)
+        SELECT book_id, rank, related_id, score FROM (
+            SELECT book_id, related_id, score,
+                   ROW_NUMBER() OVER (PARTITION BY book_id ORDER BY score DESC, related_id) AS rank
+            FROM (SELECT book_a AS book_id, book_b AS related_id,
+                         co_borrows + {CO_RATING_WEIGHT} * co_ratings AS score FROM bookpairs
+                  UNION ALL
+                  SELECT book_b, book_a, co_borrows + {CO_RATING_WEIGHT} * co_ratings FROM bookpairs)
+        ) WHERE rank <= {TOP_N}
+        """)
+
+
+TOP_RELATED = f"""
+INSERT INTO relatedbooks(book_id, rank, related_id, score)
+SELECT :book, ROW_NUMBER() OVER (ORDER BY score DESC, related_id), related_id, score FROM (
+    SELECT book_b AS related_id, co_borrows + {CO_RATING_WEIGHT} * co_ratings AS score
+    FROM bookpairs WHERE book_a = :book
+    UNION ALL
+    SELECT book_a, co_borrows + {CO_RATING_WEIGHT} * co_ratings
+    FROM bookpairs INDEXED BY idx_bookpairs_b WHERE book_b = :book
+)
+ORDER BY score DESC, related_id
+LIMIT {TOP_N}
+"""
+
+
+def refresh_related(conn, limit=None):
+    """Recompute the lists of the books marked in relateddirty; returns how many."""
+    sql = "SELECT book_id FROM relateddirty" + (f" LIMIT {int(limit)}" if limit else "")
+    dirty = [book_id for (book_id,) in conn.execute(sql)]
+    with conn:
+        for book_id in dirty:
+            conn.execute("DELETE FROM relatedbooks WHERE book_id = ?", (book_id,))
+            conn.execute(TOP_RELATED, {"book": book_id})
+            conn.execute("DELETE FROM relateddirty WHERE book_id = ?", (book_id,))
+    return len(dirty)
+
+
+def related_books(conn, book_id, k=TOP_N):
+    """[{book_id, title, author, score}] most related to book_id, best first."""
+    rows = conn.execute("""
+    SELECT r.related_id, b.title, b.author, r.score
+    FROM relatedbooks r JOIN booktb b ON b.book_id = r.related_id
+    WHERE r.book_id = ?
+    ORDER BY r.rank
+    LIMIT ?
+    """, (book_id, k))
+    return [{"book_id": row[0], "title": row[1], "author": row[2], "score": row[3]} for row in rows]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Related books from co-borrowing and co-rating.")
+    parser.add_argument("--db", default="library.db")
+    parser.add_argument("--book", type=int, help="show the related books of this book_id")
+    parser.add_argument("--top", type=int, default=TOP_N)
+    parser.add_argument("--refresh", action="store_true", help="recompute the lists marked dirty")
+    parser.add_argument("--rebuild", action="store_true", help="recount the whole history")
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    started = time.perf_counter()
+    ensure_recommendations(conn)
+    if args.rebuild:
+        rebuild_recommendations(conn)
+    if args.refresh or args.rebuild:
+        n = refresh_related(conn)
+        (pairs,) = conn.execute("SELECT COUNT(*) FROM bookpairs").fetchone()
+        print(f"{pairs} pairs, {n} list(s) refreshed in {time.perf_counter() - started:.2f}s")
+    if args.book is not None:
+        for rank, book in enumerate(related_books(conn, args.book, args.top), 1):
+            print(f"{rank:>3}. {book['title']} by {book['author']} (score {book['score']})")
+    conn.close()
@@ -0,0 +1,115 @@
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# ====================================================
+#   BACKGROUND WORK FOR TK WINDOWS
+# ====================================================
+# Tk is single threaded: widgets may only be touched from the main loop.
+# TkWorker runs blocking calls (network, slow queries) on a thread pool and
+# hands results back through a queue that is drained with after() polling,
+# so callbacks always run on the Tk thread.
+
+POLL_MS = 50
+
+
+class Job:
+    def __init__(self, owner, on_done, on_error, deadline):
+        self.owner = owner
+        self.on_done = on_done
+        self.on_error = on_error
+        self.deadline = deadline
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        self.cancel_event.set()
+        if self.future is not None:
+            self.future.cancel()
+
+
+class TkWorker:
+    def __init__(self, root, max_workers=4, poll_ms=POLL_MS):
+        self.root = root
+        self.poll_ms = poll_ms
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tk-worker")
+        self.results = queue.Queue()
+        self.pending = set()
+        self._polling = False
+
+    def submit(self, fn, on_done, on_error=None, timeout=None, owner=None):
+        """Run fn(cancel_event) in the pool; report back on the Tk thread.
+
+        on_error receives the exception, or TimeoutError once `timeout`
+        seconds pass without an answer.  Late results are discarded.
+        """
+        deadline = time.monotonic() + timeout if timeout else None
+        job = Job(owner, on_done, on_error, deadline)
+        job.future = self.pool.submit(self._run, job, fn)
+        self.pending.add(job)
+        self._schedule_poll()
+        return job
+
+    def _run(self, job, fn):
+        try:
+            result = fn(job.cancel_event)
+        except BaseException as e:
+            self.results.put((job, False, e))
+        else:
+            self.results.put((job, True, result))
+
+    def cancel(self, job):
+        job.cancel()
+        self.pending.discard(job)
+
+    def cancel_owner(self, owner):
+        for job in [j for j in self.pending if j.owner is owner]:
+            self.cancel(job)
+
+    def _schedule_poll(self):
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.poll_ms, self._poll)
+
+    def _poll(self):
+        self._polling = False
+        try:
+            while True:
+                try:
+                    job, ok, value = self.results.get_nowait()
+                except queue.Empty:
+                    break
+                if job not in self.pending or job.cancelled:
+                    continue
+                self.pending.discard(job)
+                if ok:
+                    self._call(job.on_done, value)
+                elif job.on_error is not None:
+                    self._call(job.on_error, value)
+
+            now = time.monotonic()
+            for job in [j for j in self.pending if j.deadline is not None and now > j.deadline]:
+                self.cancel(job)
+                if job.on_error is not None:
+                    self._call(job.on_error, TimeoutError("Request timed out"))
+        finally:
+            # A failing callback must not stop the other jobs from being delivered
+            if self.pending:
+                self._schedule_poll()
+
+    def _call(self, callback, value):
+        try:
+            callback(value)
+        except Exception:
+            self.root.report_callback_exception(*sys.exc_info())
+
+    def shutdown(self):
+        for job in list(self.pending):
+            self.cancel(job)
+        self.pool.shutdown(wait=False, cancel_futures=True)
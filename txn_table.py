@@ -0,0 +1,208 @@
+# ====================================================
+#   INCREMENTAL / VIRTUALIZED TRANSACTION TABLE
+# ====================================================
+# Keeps a ttk.Treeview in step with a transaction source without clearing and
+# re-inserting every row.  Rows are keyed by transaction id (the Treeview iid),
+# and a refresh only inserts, updates or deletes the rows that changed.
+#
+# Past VIRTUAL_THRESHOLD rows the table switches to a windowed mode: only the
+# rows in view (plus a small margin) exist in the Treeview, and the scrollbar
+# fetches the next window from the source as the user scrolls.  Windows are
+# read by keyset (the rows after/before an id already shown), never with
+# OFFSET, so a window deep in a multi-million-row history costs the same as
+# the first one.  For scrollbar jumps the table keeps a coarse offset -> id
+# map (the id of every ANCHOR_STEP-th row); a jump reads from the nearest
+# anchor and skips fewer than ANCHOR_STEP rows.  The map is read on the first
+# jump away from the top, and new rows then extend it without another read.
+#
+# A source needs four methods (ids ascend with the row order):
+#   count()                      -> total number of transactions
+#   page_after(after_id, limit)  -> the next `limit` transaction dicts after
+#                                   after_id (None: from the start), each with an "id" key
+#   page_before(before_id, limit) -> the `limit` transactions just before
+#                                   before_id, still in ascending order
+#   anchors(step, start_id=None) -> ids of every step-th row from start_id
+#                                   (the first row if None) on
+
+VIRTUAL_THRESHOLD = 2000
+WINDOW_MARGIN = 10
+ANCHOR_STEP = 100
+
+
+def transaction_values(txn):
+    return (txn["member"], txn["book"], txn["issue_date"], txn["due_date"],
+            txn["return_date"], f"${txn['fine']:.2f}")
+
+
+class TransactionTable:
+    def __init__(self, tree, source, scrollbar=None, row_values=transaction_values,
+                 virtual_threshold=VIRTUAL_THRESHOLD):
+        self.tree = tree
+        self.source = source
+        self.scrollbar = scrollbar
+        self.row_values = row_values
+        self.virtual_threshold = virtual_threshold
+        self.rows = {}          # iid -> values currently shown
+        self.ids = []           # ids of the rows shown, in order
+        self.offset = 0
+        self.total = 0
+        self.windowed = False
+        self.anchors = []       # id of row 0, ANCHOR_STEP, 2 * ANCHOR_STEP, ...
+        self.anchored = 0       # rows the anchors were last synced with
+
+        if scrollbar is not None:
+            scrollbar.config(command=self._on_scrollbar)
+            tree.config(yscrollcommand=self._on_tree_scroll)
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            tree.bind(sequence, self._on_wheel, add="+")
+
+    # --- Public API -------------------------------------------------
+    def refresh(self):
+        """Re-read the source and apply only the differences."""
+        self.total = self.source.count()
+        self.windowed = self.total > self.virtual_threshold
+        if self.windowed:
+            self.offset = max(0, min(self.offset, self.total - self._visible_rows()))
+            self._show(self._jump(self.offset))
+        else:
+            self.offset = 0
+            self._show(self.source.page_after(None, self.total))
+        self._update_scrollbar()
+
+    def row_changed(self, txn):
+        """Apply a single issued/returned transaction without a full refresh."""
+        iid = str(txn["id"])
+        values = self.row_values(txn)
+        if iid in self.rows:
+            if self.rows[iid] != values:
+                self.tree.item(iid, values=values)
+                self.rows[iid] = values
+            return
+        # A new transaction: in windowed mode only the counts change unless it is in view
+        self.total = self.source.count()
+        if not self.windowed and self.total > self.virtual_threshold:
+            self.refresh()
+            return
+        if self.anchors and self.total == self.anchored + 1:
+            # The only new row is this one: it is an anchor if it starts a step
+            if self.anchored % ANCHOR_STEP == 0:
+                self.anchors.append(txn["id"])
+            self.anchored = self.total
+        if not self.windowed or self.offset + self._window_size() >= self.total:
+            self.tree.insert("", "end", iid=iid, values=values)
+            self.rows[iid] = values
+            self.ids.append(txn["id"])
+        self._update_scrollbar()
+
+    def row_removed(self, txn_id):
+        iid = str(txn_id)
+        if iid in self.rows:
+            self.tree.delete(iid)
+            del self.rows[iid]
+            self.ids.remove(txn_id)
+
+    # --- Diffing ----------------------------------------------------
+    def _show(self, txns):
+        wanted = {}
+        order = []
+        for txn in txns:
+            iid = str(txn["id"])
+            wanted[iid] = self.row_values(txn)
+            order.append(iid)
+
+        stale = [iid for iid in self.rows if iid not in wanted]
+        if stale:
+            self.tree.delete(*stale)
+            for iid in stale:
+                del self.rows[iid]
+
+        for index, iid in enumerate(order):
+            values = wanted[iid]
+            if iid not in self.rows:
+                self.tree.insert("", index, iid=iid, values=values)
+            else:
+                if self.rows[iid] != values:
+                    self.tree.item(iid, values=values)
+                if self.windowed and self.tree.index(iid) != index:
+                    self.tree.move(iid, "", index)
+            self.rows[iid] = values
+        self.ids = [txn["id"] for txn in txns]
+
+    # --- Windowed scrolling -----------------------------------------
+    def _visible_rows(self):
+        return int(self.tree.cget("height"))
+
+    def _window_size(self):
+        return self._visible_rows() + WINDOW_MARGIN
+
+    def _sync_anchors(self):
+        if not self.anchors or self.total < self.anchored:
+            self.anchors = self.source.anchors(ANCHOR_STEP)
+        elif self.total > self.anchored:
+            # Rows are only ever appended: re-read the map from the last anchor on
+            self.anchors[-1:] = self.source.anchors(ANCHOR_STEP, self.anchors[-1])
+        self.anchored = self.total
+
+    def _jump(self, offset):
+        """The window starting at row `offset`, read from the nearest anchor."""
+        if offset == 0:
+            return self.source.page_after(None, self._window_size())
+        if self.total != self.anchored:
+            self._sync_anchors()
+        index, skip = divmod(offset, ANCHOR_STEP)
+        if index >= len(self.anchors):
+            return []
+        return self.source.page_after(self.anchors[index] - 1, skip + self._window_size())[skip:]
+
+    def _window_at(self, offset):
+        size = self._window_size()
+        delta = offset - self.offset
+        if self.ids and 0 < delta < len(self.ids):
+            # Forward: continue after a row already shown
+            return self.source.page_after(self.ids[delta - 1], size)
+        if self.ids and -size < delta < 0:
+            # Backward: the rows just before the first one shown, then onwards
+            before = self.source.page_before(self.ids[0], -delta)
+            if before:
+                return before + self.source.page_after(before[-1]["id"], size - len(before))
+        return self._jump(offset)
+
+    def _scroll_to(self, offset):
+        offset = max(0, min(int(offset), self.total - self._visible_rows()))
+        if offset != self.offset:
+            txns = self._window_at(offset)
+            self.offset = offset
+            self._show(txns)
+            self.tree.yview_moveto(0)
+        self._update_scrollbar()
+
+    def _update_scrollbar(self):
+        if self.scrollbar is None or not self.windowed:
+            return
+        first = self.offset / self.total if self.total else 0.0
+        last = min(1.0, (self.offset + self._visible_rows()) / self.total) if self.total else 1.0
+        self.scrollbar.set(first, last)
+
+    def _on_tree_scroll(self, first, last):
+        # In normal mode the Treeview drives the scrollbar itself
+        if not self.windowed:
+            self.scrollbar.set(first, last)
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if not self.windowed:
+            self.tree.yview(action, amount, unit) if unit else self.tree.yview(action, amount)
+            return
+        if action == "moveto":
+            self._scroll_to(float(amount) * self.total)
+        elif action == "scroll":
+            step = self._visible_rows() if unit == "pages" else 1
+            self._scroll_to(self.offset + int(amount) * step)
+
+    def _on_wheel(self, event):
+        if not self.windowed:
+            return None
+        if event.num == 4 or getattr(event, "delta", 0) > 0:
+            self._scroll_to(self.offset - 3)
+        else:
+            self._scroll_to(self.offset + 3)
+        return "break"
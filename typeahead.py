@@ -0,0 +1,350 @@
+import argparse
+import gc
+import random
+import time
+from bisect import bisect_left, insort
+
+from library_db import connect
+
+# ====================================================
+#   TYPEAHEAD FOR MEMBER AND BOOK ENTRIES
+# ====================================================
+# PrefixIndex is a sorted array of normalized keys (casefolded, single
+# spaces) with a parallel array of ids.  A prefix lookup is one bisect to the
+# first key >= prefix and a walk forward while keys still start with it, so
+# it costs O(log n + k) however big the catalog is.  The arrays are sorted
+# once; keys added later go to a small sorted side list (and the ids they
+# replace are masked out of the arrays) until MERGE_AT of them are merged in.
+#
+# CatalogIndex keeps one PrefixIndex for members (name, "last first" and
+# membership number) and one for books (title, title without a leading
+# article, ISBN).  It is loaded once.  Triggers log the id of every book and
+# member inserted, renamed or deleted in catalogchanges, and refresh()
+# re-indexes just the ids logged since, so new and edited rows show up
+# without reloading.  Labels for the few rows shown are read by primary key.
+# A 500k-book catalog is about 1.8M keys, 1.6s to load and ~160 MB, so the
+# GUIs load it on a worker thread after the first paint (load_catalog).
+#
+# attach_typeahead() adds a debounced suggestion list under a tk.Entry.
+#
+#   python typeahead.py --db bench.db --bench      # per-keystroke timings
+
+DEBOUNCE_MS = 120
+SUGGESTIONS = 8
+ARTICLES = ("the ", "a ", "an ")
+MERGE_AT = 20000          # side-list keys merged into the sorted arrays at once
+KEEP_CHANGES = 100000     # catalogchanges rows kept; an index further behind reloads
+
+
+def normalize(text):
+    return " ".join(str(text).casefold().split())
+
+
+class PrefixIndex:
+    def __init__(self, pairs=()):
+        """pairs: (normalized key, id); built with one sort."""
+        keys, ids = [], []
+        for key, item_id in pairs:
+            if key:
+                keys.append(key)
+                ids.append(item_id)
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self.keys = [keys[i] for i in order]
+        self.ids = [ids[i] for i in order]
+        self.added = []         # (key, id) added since the sort, sorted
+        self.dropped = set()    # ids whose keys in self.keys are out of date
+
+    def __len__(self):
+        return len(self.keys) + len(self.added)
+
+    def add(self, key, item_id):
+        if key:
+            insort(self.added, (key, item_id))
+            if len(self.added) >= MERGE_AT:
+                self._merge()
+
+    def discard(self, item_id):
+        """Forget every key of item_id (edited or deleted)."""
+        self.dropped.add(item_id)
+        self.added = [pair for pair in self.added if pair[1] != item_id]
+
+    def _merge(self):
+        pairs = [pair for pair in zip(self.keys, self.ids) if pair[1] not in self.dropped]
+        pairs += self.added
+        pairs.sort()
+        self.keys = [key for key, _ in pairs]
+        self.ids = [item_id for _, item_id in pairs]
+        self.added = []
+        self.dropped = set()
+
+    def search(self, prefix, limit=SUGGESTIONS):
+        """Ids whose key starts with prefix, in key order, without repeats."""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        # Up to `limit` distinct ids from each sorted source, then merged by key
+        matches = []
+        keys, ids, dropped = self.keys, self.ids, self.dropped
+        seen = set()
+        i = bisect_left(keys, prefix)
+        while i < len(keys) and keys[i].startswith(prefix) and len(seen) < limit:
+            if ids[i] not in dropped:
+                matches.append((keys[i], ids[i]))
+                seen.add(ids[i])
+            i += 1
+        seen = set()
+        added = self.added
+        i = bisect_left(added, (prefix,))
+        while i < len(added) and added[i][0].startswith(prefix) and len(seen) < limit:
+            matches.append(added[i])
+            seen.add(added[i][1])
+            i += 1
+        found = []
+        for _, item_id in sorted(matches):
+            if item_id not in found:
+                found.append(item_id)
+                if len(found) == limit:
+                    break
+        return found
+
+
+def _book_keys(book_id, title, isbn):
+    key = normalize(title)
+    yield key, book_id
+    for article in ARTICLES:
+        if key.startswith(article):
+            yield key[len(article):], book_id
+    if isbn:
+        yield normalize(isbn), book_id
+
+
+def _member_keys(member_id, number, first, last):
+    first, last = normalize(first), normalize(last)
+    yield f"{first} {last}", member_id
+    yield f"{last} {first}", member_id
+    if number is not None:
+        yield str(number), member_id
+
+
+def ensure_catalog_changes(conn):
+    """Create the catalogchanges log and its triggers; trims it to KEEP_CHANGES rows."""
+    conn.executescript(f"""
+    CREATE TABLE IF NOT EXISTS catalogchanges(
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,             -- 'book' or 'member'
+        item_id INTEGER NOT NULL
+    );
+
+    CREATE TRIGGER IF NOT EXISTS catalogchanges_book_ai AFTER INSERT ON booktb BEGIN
+        INSERT INTO catalogchanges(kind, item_id) VALUES ('book', new.book_id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS catalogchanges_book_au AFTER UPDATE OF title, isbn ON booktb BEGIN
+        INSERT INTO catalogchanges(kind, item_id) VALUES ('book', new.book_id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS catalogchanges_book_ad AFTER DELETE ON booktb BEGIN
+        INSERT INTO catalogchanges(kind, item_id) VALUES ('book', old.book_id);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS catalogchanges_member_ai AFTER INSERT ON membertb BEGIN
+        INSERT INTO catalogchanges(kind, item_id) VALUES ('member', new.member_id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS catalogchanges_member_au
+    AFTER UPDATE OF first_name, last_name, membership_number ON membertb BEGIN
+        INSERT INTO catalogchanges(kind, item_id) VALUES ('member', new.member_id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS catalogchanges_member_ad AFTER DELETE ON membertb BEGIN
+        INSERT INTO catalogchanges(kind, item_id) VALUES ('member', old.member_id);
+    END;
+
+    DELETE FROM catalogchanges WHERE seq <= (SELECT MAX(seq) FROM catalogchanges) - {KEEP_CHANGES};
+    """)
+    conn.commit()
+
+
+BOOK_ROWS = "SELECT book_id, title, isbn FROM booktb"
+MEMBER_ROWS = "SELECT member_id, membership_number, first_name, last_name FROM membertb"
+
+
+class CatalogIndex:
+    def __init__(self, conn):
+        self.conn = conn
+        self._load()
+
+    def _load(self):
+        # Changes logged while loading are applied again by the next refresh()
+        self.seen = self._last_change()
+        self.books = PrefixIndex(pair for row in self.conn.execute(BOOK_ROWS) for pair in _book_keys(*row))
+        self.members = PrefixIndex(pair for row in self.conn.execute(MEMBER_ROWS) for pair in _member_keys(*row))
+
+    def _last_change(self):
+        (seq,) = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM catalogchanges").fetchone()
+        return seq
+
+    def refresh(self):
+        """Re-index the books and members inserted, edited or deleted since the
+        last load; returns how many rows.
+        """
+        (oldest,) = self.conn.execute("SELECT MIN(seq) FROM catalogchanges").fetchone()
+        if oldest is not None and oldest > self.seen + 1:
+            self._load()        # the log was trimmed past this index
+            return len(self.books) + len(self.members)
+        changed = {"book": set(), "member": set()}
+        for seq, kind, item_id in self.conn.execute(
+                "SELECT seq, kind, item_id FROM catalogchanges WHERE seq > ? ORDER BY seq", (self.seen,)):
+            changed[kind].add(item_id)
+            self.seen = seq
+        for index, ids, sql, id_column, keys in (
+                (self.books, changed["book"], BOOK_ROWS, "book_id", _book_keys),
+                (self.members, changed["member"], MEMBER_ROWS, "member_id", _member_keys)):
+            if not ids:
+                continue
+            for item_id in ids:
+                index.discard(item_id)
+            for row in self.conn.execute(f"{sql} WHERE {id_column} IN ({','.join('?' * len(ids))})",
+                                         list(ids)):
+                for key, item_id in keys(*row):
+                    index.add(key, item_id)
+        return len(changed["book"]) + len(changed["member"])
+
+    def _labels(self, sql, ids):
+        if not ids:
+            return []
+        rows = dict((row[0], row[1:]) for row in self.conn.execute(
+            sql.format(ids=",".join("?" * len(ids))), ids))
+        return [(item_id, *rows[item_id]) for item_id in ids if item_id in rows]
+
+    def suggest_books(self, text, limit=SUGGESTIONS):
+        """[(label, value)]: value is the exact title the loan windows resolve."""
+        rows = self._labels("SELECT book_id, title, isbn FROM booktb WHERE book_id IN ({ids})",
+                            self.books.search(text, limit))
+        return [(f"{title} ({isbn})" if isbn else title, title) for _, title, isbn in rows]
+
+    def suggest_members(self, text, limit=SUGGESTIONS):
+        """[(label, value)]: value is the membership number (never ambiguous)."""
+        rows = self._labels("SELECT member_id, first_name, last_name, membership_number FROM membertb "
+                            "WHERE member_id IN ({ids})", self.members.search(text, limit))
+        return [(f"{first} {last} - {number}", str(number) if number is not None else f"{first} {last}")
+                for _, first, last, number in rows]
+
+
+def load_catalog(worker, conn, on_ready):
+    """Build a CatalogIndex on a TkWorker thread with its own connection to
+    conn's file, then call on_ready(index) on the Tk thread; the index reads
+    labels and refreshes through conn from then on.
+    """
+    path = conn.execute("PRAGMA database_list").fetchone()[2]
+
+    def build(cancel):
+        own = connect(path)
+        try:
+            return CatalogIndex(own)
+        finally:
+            own.close()
+
+    def ready(index):
+        index.conn = conn
+        on_ready(index)
+
+    return worker.submit(build, ready)
+
+
+# ====================================================
+#   TK SUGGESTION LIST
+# ====================================================
+def attach_typeahead(entry, suggest, delay_ms=DEBOUNCE_MS):
+    """Show suggest(text) -> [(label, value)] in a list under `entry`.
+
+    Lookups wait until typing pauses for delay_ms.  Down moves into the
+    list; Return or a click puts the value in the entry; Escape closes it.
+    """
+    import tkinter as tk        # here, so open_database() works without Tk (the server)
+
+    listbox = tk.Listbox(entry.winfo_toplevel(), height=SUGGESTIONS, activestyle="dotbox")
+    state = {"after": None, "values": []}
+
+    def hide(event=None):
+        listbox.place_forget()
+
+    def show():
+        state["after"] = None
+        suggestions = suggest(entry.get())
+        state["values"] = [value for _, value in suggestions]
+        listbox.delete(0, tk.END)
+        if not suggestions:
+            hide()
+            return
+        for label, _ in suggestions:
+            listbox.insert(tk.END, label)
+        listbox.config(height=len(suggestions))
+        listbox.place(in_=entry, x=0, rely=1.0, relwidth=1.5)
+        listbox.lift()
+
+    def on_key(event):
+        if event.keysym in ("Down", "Escape", "Return", "Tab"):
+            return
+        if state["after"] is not None:
+            entry.after_cancel(state["after"])
+        state["after"] = entry.after(delay_ms, show)
+
+    def choose(event=None):
+        selection = listbox.curselection()
+        if selection:
+            entry.delete(0, tk.END)
+            entry.insert(0, state["values"][selection[0]])
+        hide()
+        entry.focus_set()
+        entry.icursor(tk.END)
+        return "break"
+
+    def down(event):
+        if listbox.winfo_ismapped() and listbox.size():
+            listbox.focus_set()
+            listbox.selection_clear(0, tk.END)
+            listbox.selection_set(0)
+            listbox.activate(0)
+            return "break"
+
+    entry.bind("<KeyRelease>", on_key, add="+")
+    entry.bind("<Down>", down, add="+")
+    entry.bind("<Escape>", hide, add="+")
+    entry.bind("<FocusOut>", lambda e: entry.after(150, lambda: listbox.focus_get() is listbox or hide()), add="+")
+    listbox.bind("<Return>", choose)
+    listbox.bind("<ButtonRelease-1>", choose)
+    listbox.bind("<Escape>", lambda e: (hide(), entry.focus_set()))
+    return listbox
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Member/book typeahead index.")
+    parser.add_argument("--db", default="library.db")
+    parser.add_argument("--bench", action="store_true", help="time typing 200 random titles and names")
+    parser.add_argument("--no-freeze", action="store_true", help="skip gc.freeze() (to see the GC stall)")
+    parser.add_argument("text", nargs="?", help="prefix to look up")
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    ensure_catalog_changes(conn)
+    started = time.perf_counter()
+    index = CatalogIndex(conn)
+    if not args.no_freeze:
+        gc.freeze()             # as the GUIs do once the index is loaded
+    print(f"{len(index.books)} book keys, {len(index.members)} member keys "
+          f"loaded in {time.perf_counter() - started:.2f}s")
+    if args.text:
+        for label, value in index.suggest_members(args.text) + index.suggest_books(args.text):
+            print(f"{label}  ->  {value}")
+    if args.bench:
+        rng = random.Random(1)
+        titles = [t for (t,) in conn.execute("SELECT title FROM booktb ORDER BY random() LIMIT 100")]
+        names = [f"{f} {l}" for f, l in conn.execute(
+            "SELECT first_name, last_name FROM membertb ORDER BY random() LIMIT 100")]
+        samples = []
+        for text, suggest in [(t, index.suggest_books) for t in titles] + [(n, index.suggest_members) for n in names]:
+            for n in range(1, min(len(text), 12) + 1):       # every keystroke
+                t = time.perf_counter()
+                suggest(text[:n])
+                samples.append(time.perf_counter() - t)
+        samples.sort()
+        print(f"{len(samples)} keystrokes: median {samples[len(samples) // 2] * 1000:.3f}ms, "
+              f"p99 {samples[int(len(samples) * 0.99)] * 1000:.3f}ms, max {samples[-1] * 1000:.3f}ms")
+    conn.close()